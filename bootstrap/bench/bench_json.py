@@ -0,0 +1,56 @@
+"""
+Measure the CPU time spent parsing a payment request and serializing its response
+
+Compares the previous path (stdlib json, full pydantic validation, dataclasses.asdict)
+with the current one (fast json backend, precompiled parser, flat response dict).
+
+Run from the bootstrap directory: python bench/bench_json.py
+"""
+import json
+import sys
+import timeit
+from dataclasses import asdict
+
+sys.path.append('.')
+
+from sanic import response
+
+from src import requets_models, responses_models
+from src.helpers import json_response
+from src.serialization import BACKEND
+
+BODY = b'{"destination": "GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G", "amount": 20, "memo": "1-test"}'
+TX_ID = 'e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d56'
+NUMBER = 20000
+
+
+def previous_path():
+    body_dict = json.loads(BODY.decode())
+    requets_models.PaymentRequest(**body_dict)
+    return response.json(asdict(responses_models.TransactionResponse(TX_ID)), status=200,
+                         escape_forward_slashes=False)
+
+
+def current_path():
+    requets_models.PaymentRequest.from_json(BODY)
+    return json_response(responses_models.TransactionResponse(TX_ID).to_response_dict(), 200)
+
+
+def measure(func) -> float:
+    """Get the best time per call (in microseconds) out of several runs"""
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def main():
+    assert json.loads(previous_path().body) == json.loads(current_path().body)
+
+    previous = measure(previous_path)
+    current = measure(current_path)
+    print(f'json backend: {BACKEND}')
+    print(f'previous: {previous:.1f}us per request')
+    print(f'current:  {current:.1f}us per request')
+    print(f'saved:    {previous - current:.1f}us per request ({(1 - current / previous) * 100:.0f}%)')
+
+
+if __name__ == '__main__':
+    main()
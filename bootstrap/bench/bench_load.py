@@ -0,0 +1,237 @@
+"""
+Drive a running server with a mix of requests, and report the throughput and latency of each route
+
+Runs offline against the fake horizon, from the bootstrap directory:
+    python bench/fake_horizon.py --port 8008
+    HORIZON_ENDPOINT=http://localhost:8008 python main.py
+    python bench/bench_load.py --duration 30 --concurrency 50 --save baseline.json
+
+And after a change, with the server restarted, compare against the baseline:
+    python bench/bench_load.py --duration 30 --concurrency 50 --baseline baseline.json
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import aiohttp
+from kin import config as kin_config
+from kin_base.builder import Builder
+from kin_base.keypair import Keypair
+from kin_base.network import NETWORKS
+
+from typing import Dict, List, Optional
+
+ROUTES = ('pay', 'create', 'balance', 'payment', 'whitelist')
+DEFAULT_MIX = 'pay=4,create=1,balance=3,payment=2,whitelist=1'
+# How many distinct transactions to whitelist, prebuilt so building them doesn't slow down the load generator
+WHITELIST_ENVELOPES = 100
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse the weights of the routes, as in 'pay=4,balance=1'"""
+    weights = {}
+    for item in mix.split(','):
+        route, _, weight = item.partition('=')
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f'Unknown route "{route}", expected one of {", ".join(ROUTES)}')
+        weights[route] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def random_address() -> str:
+    return Keypair.random().address().decode()
+
+
+class RouteStats:
+    """The latencies and status codes of the requests to a single route"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses = Counter()
+
+    def record(self, latency: float, status: int) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+
+    def get_report(self, duration: float) -> dict:
+        return {'requests': len(self.latencies),
+                'errors': sum(count for status, count in self.statuses.items() if status != 200),
+                'rps': len(self.latencies) / duration,
+                'p50_ms': percentile(self.latencies, 50) * 1000,
+                'p99_ms': percentile(self.latencies, 99) * 1000,
+                'statuses': {str(status): count for status, count in sorted(self.statuses.items())}}
+
+
+class LoadGenerator:
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, passphrase: str):
+        self.session = session
+        self.url = url.rstrip('/')
+        self.passphrase = passphrase
+        self.destinations: List[str] = []
+        self.tx_hashes: List[str] = []
+        self.envelopes: List[str] = []
+
+    async def post(self, path: str, body: dict) -> aiohttp.ClientResponse:
+        async with self.session.post(self.url + path, json=body) as response:
+            await response.read()
+            return response
+
+    async def get(self, path: str) -> aiohttp.ClientResponse:
+        async with self.session.get(self.url + path) as response:
+            await response.read()
+            return response
+
+    async def wait_until_ready(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if (await self.get('/ready')).status == 200:
+                    return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{self.url} was not ready after {timeout} seconds')
+            await asyncio.sleep(1)
+
+    async def prepare(self, destination_count: int) -> None:
+        """Create the accounts to pay, and a payment to look up for each of them"""
+        async def create_destination():
+            address = random_address()
+            response = await self.post('/create', {'destination': address, 'starting_balance': 1})
+            if response.status != 200:
+                raise RuntimeError(f'Failed to create a destination account: {await response.text()}')
+            self.destinations.append(address)
+
+        await asyncio.gather(*[create_destination() for _ in range(destination_count)])
+        await asyncio.gather(*[self.call('pay') for _ in range(destination_count)])
+
+        # Whitelisting doesn't check the transaction's accounts, so they don't have to exist
+        NETWORKS['BENCH'] = self.passphrase
+        for _ in range(WHITELIST_ENVELOPES):
+            builder = Builder(None, network_name='BENCH', fee=100, secret=Keypair.random().seed().decode(),
+                              sequence=1)
+            builder.append_payment_op(random.choice(self.destinations), '1')
+            builder.sign()
+            self.envelopes.append(builder.gen_xdr().decode())
+
+    async def call(self, route: str) -> int:
+        """Send a single request to a route, and get its status code"""
+        if route == 'pay':
+            async with self.session.post(self.url + '/pay', json={'destination': random.choice(self.destinations),
+                                                                   'amount': 1}) as response:
+                if response.status == 200:
+                    self.tx_hashes.append((await response.json())['tx_id'])
+                    # Keep looking up recent payments, like clients do
+                    del self.tx_hashes[:-1000]
+                return response.status
+        if route == 'create':
+            response = await self.post('/create', {'destination': random_address(), 'starting_balance': 1})
+        elif route == 'balance':
+            response = await self.get(f'/balance/{random.choice(self.destinations)}')
+        elif route == 'payment':
+            response = await self.get(f'/payment/{random.choice(self.tx_hashes)}')
+        else:
+            response = await self.post('/whitelist', {'envelope': random.choice(self.envelopes),
+                                                      'network_id': self.passphrase})
+        return response.status
+
+    async def run(self, weights: Dict[str, float], concurrency: int, duration: float) -> Dict[str, RouteStats]:
+        """Keep 'concurrency' requests in flight for 'duration' seconds, picking each request's route by weight"""
+        stats = {route: RouteStats() for route in weights}
+        routes, route_weights = list(weights), list(weights.values())
+        end_time = time.monotonic() + duration
+
+        async def worker():
+            while time.monotonic() < end_time:
+                route = random.choices(routes, route_weights)[0]
+                start_time = time.monotonic()
+                try:
+                    status = await self.call(route)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = 0
+                stats[route].record(time.monotonic() - start_time, status)
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return stats
+
+
+def get_report(stats: Dict[str, RouteStats], duration: float) -> dict:
+    total = RouteStats()
+    for route_stats in stats.values():
+        total.latencies.extend(route_stats.latencies)
+        total.statuses.update(route_stats.statuses)
+    report = {route: route_stats.get_report(duration) for route, route_stats in stats.items()}
+    report['total'] = total.get_report(duration)
+    return report
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    def change(route: str, key: str) -> str:
+        if baseline is None or route not in baseline or not baseline[route][key]:
+            return ''
+        return f' ({(report[route][key] / baseline[route][key] - 1) * 100:+.0f}%)'
+
+    print(f'{"route":<10}{"requests":>10}{"errors":>8}{"rps":>18}{"p50 ms":>18}{"p99 ms":>18}')
+    for route, result in report.items():
+        rps = f'{result["rps"]:.1f}{change(route, "rps")}'
+        p50 = f'{result["p50_ms"]:.1f}{change(route, "p50_ms")}'
+        p99 = f'{result["p99_ms"]:.1f}{change(route, "p99_ms")}'
+        print(f'{route:<10}{result["requests"]:>10}{result["errors"]:>8}{rps:>18}{p50:>18}{p99:>18}')
+        if result['errors']:
+            print(f'{"":<10}status codes: {result["statuses"]}')
+
+
+async def run(args) -> dict:
+    weights = parse_mix(args.mix)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        generator = LoadGenerator(session, args.url, args.passphrase)
+        await generator.wait_until_ready(args.ready_timeout)
+        print(f'Creating {args.destinations} destination accounts')
+        await generator.prepare(args.destinations)
+        print(f'Running {args.concurrency} concurrent requests for {args.duration} seconds')
+        stats = await generator.run(weights, args.concurrency, args.duration)
+    return get_report(stats, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate load on a running server')
+    parser.add_argument('--url', default='http://localhost:8000', help='The url of the server')
+    parser.add_argument('--duration', type=float, default=30, help='How long (in seconds) to generate load for')
+    parser.add_argument('--concurrency', type=int, default=50, help='How many requests to keep in flight')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'The weights of the routes (default: {DEFAULT_MIX})')
+    parser.add_argument('--destinations', type=int, default=20, help='How many accounts to create and pay')
+    parser.add_argument('--passphrase', default=kin_config.HORIZON_PASSPHRASE_TEST,
+                        help='The network passphrase, for the transactions to whitelist')
+    parser.add_argument('--ready-timeout', type=float, default=120,
+                        help='How long (in seconds) to wait for the server to be ready')
+    parser.add_argument('--save', help='Save the results to a json file, to compare later runs against')
+    parser.add_argument('--baseline', help='Compare the results to ones saved by an earlier run')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = asyncio.get_event_loop().run_until_complete(run(args))
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""
+A fake horizon, to run the server (and its benchmarks) offline
+
+Keeps the accounts in memory, checks the sequence, fee and balance of submitted transactions,
+and applies them when the next ledger closes, so submissions take as long as they would on a real network.
+Only the endpoints the server uses are served, and payment streams are not simulated.
+
+Run from the bootstrap directory: python bench/fake_horizon.py --port 8008
+Then start the server against it: HORIZON_ENDPOINT=http://localhost:8008 python main.py
+"""
+import sys
+import time
+import asyncio
+import argparse
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from hashlib import sha256
+
+from kin import config as kin_config
+from kin.blockchain.keypair import Keypair
+from kin_base.operation import CreateAccount, Payment
+from kin_base.transaction_envelope import TransactionEnvelope
+from sanic import Sanic, response
+
+sys.path.append('.')
+
+from src.config import Settings
+
+from typing import Dict, List, Optional, Tuple
+
+QUARKS_PER_KIN = 10 ** 5
+# How many of the latest ledgers and successful transactions to keep
+MAX_LEDGERS = 1000
+MAX_TRANSACTIONS = 100000
+ERROR_PREFIX = 'https://stellar.org/horizon-errors/'
+
+
+def to_quarks(amount: str) -> int:
+    return int(Decimal(amount) * QUARKS_PER_KIN)
+
+
+def get_timestamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def problem(error_type: str, title: str, status: int, extras: Optional[dict] = None) -> Tuple[int, dict]:
+    """Get the status and body of a horizon error"""
+    body = {'type': ERROR_PREFIX + error_type, 'title': title, 'status': status, 'detail': title}
+    if extras is not None:
+        body['extras'] = extras
+    return status, body
+
+
+def transaction_failed(envelope_xdr: str, tx_code: str, op_codes: Optional[List[str]] = None) -> Tuple[int, dict]:
+    result_codes = {'transaction': tx_code}
+    if op_codes is not None:
+        result_codes['operations'] = op_codes
+    return problem('transaction_failed', 'Transaction Failed', 400,
+                   {'envelope_xdr': envelope_xdr, 'result_codes': result_codes})
+
+
+@dataclass
+class Account:
+    balance: int  # In quarks
+    sequence: int
+
+
+@dataclass
+class Submission:
+    tx_hash: str
+    envelope_xdr: str
+    envelope: TransactionEnvelope
+    source: str
+    result: asyncio.Future
+
+
+class FakeNetwork:
+    """
+    The accounts, transactions and ledgers of the fake network
+
+    Transactions are checked when they are submitted, like stellar-core checks them before accepting them,
+    and applied (or failed) when the next ledger closes. A ledger applies at most 'capacity' transactions,
+    the rest wait for the ledgers after it.
+    """
+
+    def __init__(self, passphrase: str, ledger_time: float, capacity: int, base_fee: int):
+        """
+        :param passphrase: The passphrase of the network, that transactions are signed for
+        :param ledger_time: How long (in seconds) it takes to close a ledger
+        :param capacity: The maximum number of transactions in a ledger
+        :param base_fee: The minimum fee (in quarks) of an operation
+        """
+        self.network_id = sha256(passphrase.encode()).digest()
+        self.ledger_time = ledger_time
+        self.capacity = capacity
+        self.base_fee = base_fee
+        self.accounts: Dict[str, Account] = {}
+        self.transactions: 'OrderedDict[str, dict]' = OrderedDict()
+        self.ledgers: List[dict] = []
+        self._queue: List[Submission] = []
+        self._pending: Dict[str, asyncio.Future] = {}
+        # The sequence each account has to submit next, for accounts with transactions waiting for a ledger
+        self._next_sequences: Dict[str, int] = {}
+        self._add_ledger(successful=0, failed=0, operations=0)
+
+    @property
+    def ledger_sequence(self) -> int:
+        return self.ledgers[-1]['sequence']
+
+    def fund(self, address: str, balance: int) -> None:
+        """Create an account with a balance (in quarks)"""
+        self.accounts[address] = Account(balance, self.ledger_sequence << 32)
+
+    async def submit(self, envelope_xdr: str) -> Tuple[int, dict]:
+        """Submit a transaction, and wait for the ledger that applies it"""
+        try:
+            envelope = TransactionEnvelope.from_xdr(envelope_xdr)
+            envelope.network_id = self.network_id
+            tx_hash = envelope.hash_meta().hex()
+        except Exception:
+            return problem('transaction_malformed', 'Transaction Malformed', 400)
+
+        # Resubmitting a transaction returns the result of the first submission
+        if tx_hash in self.transactions:
+            return 200, self.transactions[tx_hash]
+        if tx_hash in self._pending:
+            return await asyncio.shield(self._pending[tx_hash])
+
+        tx = envelope.tx
+        source = tx.source.decode() if isinstance(tx.source, bytes) else tx.source
+        account = self.accounts.get(source)
+        if account is None:
+            return transaction_failed(envelope_xdr, 'tx_no_source_account')
+        if tx.sequence != self._next_sequences.get(source, account.sequence + 1):
+            return transaction_failed(envelope_xdr, 'tx_bad_seq')
+        if not tx.operations:
+            return transaction_failed(envelope_xdr, 'tx_missing_operation')
+        if tx.fee < self.base_fee * len(tx.operations):
+            return transaction_failed(envelope_xdr, 'tx_insufficient_fee')
+        if account.balance < tx.fee:
+            return transaction_failed(envelope_xdr, 'tx_insufficient_balance')
+
+        self._next_sequences[source] = tx.sequence + 1
+        result = asyncio.get_event_loop().create_future()
+        self._pending[tx_hash] = result
+        self._queue.append(Submission(tx_hash, envelope_xdr, envelope, source, result))
+        return await asyncio.shield(result)
+
+    async def run(self) -> None:
+        """Close a ledger every 'ledger_time' seconds"""
+        next_close = time.monotonic() + self.ledger_time
+        while True:
+            await asyncio.sleep(max(next_close - time.monotonic(), 0))
+            next_close += self.ledger_time
+            self.close_ledger()
+
+    def close_ledger(self) -> None:
+        """Apply the transactions that waited the longest, up to the ledger's capacity"""
+        batch, self._queue = self._queue[:self.capacity], self._queue[self.capacity:]
+        successful = operations = 0
+        for submission in batch:
+            status, body = self._apply(submission)
+            if status == 200:
+                successful += 1
+                operations += len(submission.envelope.tx.operations)
+            del self._pending[submission.tx_hash]
+            if not submission.result.done():
+                submission.result.set_result((status, body))
+        self._add_ledger(successful, len(batch) - successful, operations)
+
+    def _apply(self, submission: Submission) -> Tuple[int, dict]:
+        tx = submission.envelope.tx
+        account = self.accounts[submission.source]
+        # The fee and sequence are taken even if the operations fail
+        account.sequence = tx.sequence
+        account.balance -= tx.fee
+        if self._next_sequences.get(submission.source) == tx.sequence + 1:
+            del self._next_sequences[submission.source]
+
+        # Apply the operations to a copy of the balances, so they are either all applied or none of them are
+        balances: Dict[str, Optional[int]] = {}
+
+        def get_balance(address: str) -> Optional[int]:
+            if address not in balances:
+                account = self.accounts.get(address)
+                balances[address] = None if account is None else account.balance
+            return balances[address]
+
+        op_codes = []
+        for op in tx.operations:
+            op_source = op.source or submission.source
+            if isinstance(op_source, bytes):
+                op_source = op_source.decode()
+            if get_balance(op_source) is None:
+                op_codes.append('op_no_source_account')
+            elif isinstance(op, CreateAccount):
+                amount = to_quarks(op.starting_balance)
+                if get_balance(op.destination) is not None:
+                    op_codes.append('op_already_exists')
+                elif balances[op_source] < amount:
+                    op_codes.append('op_underfunded')
+                else:
+                    balances[op_source] -= amount
+                    balances[op.destination] = amount
+                    op_codes.append('op_success')
+            elif isinstance(op, Payment):
+                amount = to_quarks(op.amount)
+                if get_balance(op.destination) is None:
+                    op_codes.append('op_no_destination')
+                elif balances[op_source] < amount:
+                    op_codes.append('op_underfunded')
+                else:
+                    balances[op_source] -= amount
+                    balances[op.destination] += amount
+                    op_codes.append('op_success')
+            else:
+                op_codes.append('op_not_supported')
+
+        if any(code != 'op_success' for code in op_codes):
+            return transaction_failed(submission.envelope_xdr, 'tx_failed', op_codes)
+
+        for address, balance in balances.items():
+            if address in self.accounts:
+                self.accounts[address].balance = balance
+            elif balance is not None:
+                # Accounts start with the sequence of the ledger that created them, like on a real network
+                self.fund(address, balance)
+
+        record = {'hash': submission.tx_hash,
+                  'ledger': self.ledger_sequence + 1,
+                  'created_at': get_timestamp(),
+                  'source_account': submission.source,
+                  'source_account_sequence': str(tx.sequence),
+                  'fee_paid': tx.fee,
+                  'operation_count': len(tx.operations),
+                  'envelope_xdr': submission.envelope_xdr}
+        self.transactions[submission.tx_hash] = record
+        if len(self.transactions) > MAX_TRANSACTIONS:
+            self.transactions.popitem(last=False)
+        return 200, record
+
+    def _add_ledger(self, successful: int, failed: int, operations: int) -> None:
+        sequence = self.ledgers[-1]['sequence'] + 1 if self.ledgers else 1
+        self.ledgers.append({'id': str(sequence),
+                             'paging_token': str(sequence << 32),
+                             'sequence': sequence,
+                             'closed_at': get_timestamp(),
+                             'base_fee_in_stroops': self.base_fee,
+                             'max_tx_set_size': self.capacity,
+                             'successful_transaction_count': successful,
+                             'failed_transaction_count': failed,
+                             'operation_count': operations})
+        if len(self.ledgers) > MAX_LEDGERS:
+            self.ledgers.pop(0)
+
+    def get_account(self, address: str) -> Optional[dict]:
+        account = self.accounts.get(address)
+        if account is None:
+            return None
+        return {'id': address,
+                'account_id': address,
+                'paging_token': '',
+                'sequence': str(account.sequence),
+                'subentry_count': 0,
+                'thresholds': {'low_threshold': 0, 'med_threshold': 0, 'high_threshold': 0},
+                'flags': {'auth_required': False, 'auth_revocable': False},
+                'balances': [{'asset_type': 'native',
+                              'balance': f'{Decimal(account.balance) / QUARKS_PER_KIN:.5f}'}],
+                'signers': [{'public_key': address, 'key': address, 'weight': 1, 'type': 'ed25519_public_key'}],
+                'data': {}}
+
+
+def create_app(network: FakeNetwork, read_latency: float = 0) -> Sanic:
+    """
+    Create the fake horizon app
+
+    :param network: The network to serve
+    :param read_latency: How long (in seconds) every read takes, on top of the time it takes to serve it
+    """
+    app = Sanic('fake_horizon', configure_logging=False)
+
+    def json_response(status_and_body: Tuple[int, dict]):
+        status, body = status_and_body
+        return response.json(body, status=status)
+
+    @app.middleware('request')
+    async def delay_reads(request):
+        if read_latency and request.method == 'GET':
+            await asyncio.sleep(read_latency)
+
+    @app.route('/accounts/<address>', methods=['GET'])
+    async def get_account(request, address: str):
+        account = network.get_account(address)
+        if account is None:
+            return json_response(problem('not_found', 'Resource Missing', 404))
+        return response.json(account)
+
+    @app.route('/transactions/<tx_hash>', methods=['GET'])
+    async def get_transaction(request, tx_hash: str):
+        if tx_hash not in network.transactions:
+            return json_response(problem('not_found', 'Resource Missing', 404))
+        return response.json(network.transactions[tx_hash])
+
+    @app.route('/transactions', methods=['POST'])
+    async def submit(request):
+        # The kin sdk sends the transaction as a query parameter, other clients send it as a form
+        envelope_xdr = request.args.get('tx') or request.form.get('tx')
+        if not envelope_xdr:
+            return json_response(problem('transaction_malformed', 'Transaction Malformed', 400))
+        return json_response(await network.submit(envelope_xdr))
+
+    @app.route('/ledgers', methods=['GET'])
+    async def get_ledgers(request):
+        limit = int(request.args.get('limit', 10))
+        ledgers = network.ledgers[::-1] if request.args.get('order') == 'desc' else network.ledgers
+        return response.json({'_embedded': {'records': ledgers[:limit]}})
+
+    @app.route('/metrics', methods=['GET'])
+    async def get_metrics(request):
+        return response.json({'history.latest_ledger': {'value': network.ledger_sequence}})
+
+    @app.listener('after_server_start')
+    async def start_ledgers(app, loop):
+        app.ledger_task = asyncio.ensure_future(network.run())
+
+    @app.listener('before_server_stop')
+    async def stop_ledgers(app, loop):
+        app.ledger_task.cancel()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake horizon, with the accounts in memory')
+    parser.add_argument('--port', type=int, default=8008)
+    parser.add_argument('--passphrase', default=kin_config.HORIZON_PASSPHRASE_TEST,
+                        help='The network passphrase, the same as the server\'s NETWORK_PASSPHRASE')
+    parser.add_argument('--ledger-time', type=float, default=5, help='How long (in seconds) it takes to close a ledger')
+    parser.add_argument('--capacity', type=int, default=500, help='The maximum number of transactions in a ledger')
+    parser.add_argument('--base-fee', type=int, default=100, help='The minimum fee (in quarks) of an operation')
+    parser.add_argument('--read-latency', type=float, default=0, help='How long (in milliseconds) every read takes')
+    parser.add_argument('--fund', action='append', metavar='ADDRESS',
+                        help='An account to create on startup, can be given more than once '
+                             '(defaults to the account of the server\'s SEED)')
+    parser.add_argument('--balance', type=int, default=10 ** 9, help='The balance (in kin) of the funded accounts')
+    args = parser.parse_args()
+
+    network = FakeNetwork(args.passphrase, args.ledger_time, args.capacity, args.base_fee)
+    for address in args.fund or [Keypair.address_from_seed(Settings().SEED)]:
+        network.fund(address, args.balance * QUARKS_PER_KIN)
+        print(f'Funded {address} with {args.balance} kin')
+
+    app = create_app(network, args.read_latency / 1000)
+    app.run(host='0.0.0.0', port=args.port, access_log=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,11 @@
 
 from src.config import Settings
 from src.init import init_app
+from src.workers import run_workers
 
 config = Settings()
-app = init_app(config)
-app.run(access_log=False, host='0.0.0.0', port=config.PORT)
+if config.WORKERS > 1:
+    run_workers(config)
+else:
+    app = init_app(config)
+    app.run(access_log=False, host='0.0.0.0', port=config.PORT)
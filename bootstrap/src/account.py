@@ -0,0 +1,205 @@
+"""Contains the kin account used by the bootstrap server"""
+import time
+import asyncio
+import logging
+
+import kin
+from kin import KinErrors
+from kin_base import Builder
+from kin.blockchain.errors import HorizonErrorType, TransactionResultCode
+
+from . import tracing
+from .channels import ChannelScheduler
+from .journal import Journal
+from .retries import RetryBudget, RetryOutcomes, RetryPolicy, RetryReasons, get_retry_reason
+
+from typing import List, Optional, Union
+
+logger = logging.getLogger('bootstrap')
+
+
+class BootstrapAccount(kin.KinAccount):
+    """
+    A KinAccount that gets its channels from the bootstrap's channel scheduler
+
+    Since every channel is used by one transaction at a time, we can keep track of its sequence number
+    instead of asking horizon for it before every transaction.
+    """
+
+    def __init__(self, seed: str, client: kin.KinClient, channel_scheduler: ChannelScheduler, app_id: str,
+                 journal: Optional[Journal] = None, retry_policy: Optional[RetryPolicy] = None):
+        """:param retry_policy: How to retry failed submissions, they are not retried if it is not given"""
+        super(BootstrapAccount, self).__init__(seed, client, None, app_id)
+        self.channel_manager = channel_scheduler
+        self.journal = journal
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0, backoff=0, deadline=0)
+
+    async def create_account(self, address: str, starting_balance: Union[float, str], fee: int,
+                             memo_text: Optional[str] = None, request: Optional[dict] = None) -> str:
+        """:param request: The request the account is created for, to record in the journal"""
+        with tracing.span('transaction.build'):
+            builder = self.build_create_account(address, starting_balance, fee, memo_text)
+        try:
+            return await self.send_transaction(builder, [request])
+        except KinErrors.HorizonError as e:
+            raise KinErrors.translate_error(e)
+
+    async def send_kin(self, address: str, amount: Union[float, str], fee: int,
+                       memo_text: Optional[str] = None, request: Optional[dict] = None) -> str:
+        """:param request: The request the payment is sent for, to record in the journal"""
+        with tracing.span('transaction.build'):
+            builder = self.build_send_kin(address, amount, fee, memo_text)
+        try:
+            return await self.send_transaction(builder, [request])
+        except KinErrors.HorizonError as e:
+            raise KinErrors.translate_error(e)
+
+    async def send_transaction(self, builder: Builder, requests: Optional[List[Optional[dict]]] = None) -> str:
+        """
+        Sign a transaction with a channel and submit it, and record it in the journal
+
+        :param builder: The transaction builder, with the operations already added
+        :param requests: The request each operation is sent for, to record in the journal
+        :return: The hash of the transaction
+
+        :raises: KinErrors.HorizonError: if horizon rejected the transaction
+        """
+        if self.journal is None:
+            return await self._submit(builder)
+
+        start_time = time.monotonic()
+        try:
+            tx_hash = await self._submit(builder)
+        except Exception as e:
+            # Failed transactions are still applied, so they have a hash too
+            tx_hash = builder.hash_hex() if builder.te is not None else None
+            self.journal.record_transaction(builder, self.keypair.public_address, tx_hash,
+                                            time.monotonic() - start_time, e, requests)
+            raise
+
+        self.journal.record_transaction(builder, self.keypair.public_address, tx_hash,
+                                        time.monotonic() - start_time, None, requests)
+        return tx_hash
+
+    async def _submit(self, builder: Builder) -> str:
+        async with self.channel_manager.get_channel() as seed:
+            channel = self.channel_manager.channels[seed]
+            builder.keypair = channel.keypair
+            builder.address = channel.address
+            budget = self.retry_policy.start()
+            try:
+                if channel.sequence is None:
+                    with tracing.span('horizon.get_sequence'):
+                        await builder.update_sequence()
+                else:
+                    builder.sequence = channel.sequence + 1
+
+                self._sign(builder)
+                tx_hash = await self._submit_with_retries(builder, budget)
+            except KinErrors.HorizonError as e:
+                if e.type != HorizonErrorType.TRANSACTION_FAILED:
+                    self.channel_manager.report_failure(seed)
+                    raise
+
+                tx_result_code = e.extras['result_codes']['transaction']
+                if tx_result_code == TransactionResultCode.FAILED:
+                    # The operations failed, not the channel. The transaction was still applied and used the sequence
+                    channel.sequence = builder.sequence
+                    self.channel_manager.report_success(seed)
+                    raise
+                if tx_result_code == TransactionResultCode.INSUFFICIENT_BALANCE:
+                    # The channel is out of kin for fees, top it up and try again.
+                    # This is a "fast-fail", the sequence doesn't increment, so the same tx can be resubmitted
+                    logger.warning(f'Channel {channel.address} is underfunded, topping it up')
+                    try:
+                        with tracing.span('channel.top_up', channel=channel.address):
+                            await self._top_up(channel.address)
+                        tx_hash = await self._submit_with_retries(builder, budget)
+                    except Exception:
+                        self.channel_manager.report_failure(seed)
+                        raise
+                else:
+                    self.channel_manager.report_failure(seed)
+                    raise
+            except Exception:
+                self.channel_manager.report_failure(seed)
+                raise
+
+            channel.sequence = builder.sequence
+            self.channel_manager.report_success(seed)
+            return tx_hash
+
+    def _sign(self, builder: Builder) -> None:
+        with tracing.span('transaction.sign'):
+            builder.sign()
+            # Also sign with the root account if a different channel was used
+            if builder.address != self.keypair.public_address:
+                builder.sign(self.keypair.secret_seed)
+
+    async def _submit_with_retries(self, builder: Builder, budget: RetryBudget) -> str:
+        """
+        Submit a signed transaction, and retry if it failed because of horizon or the channel's sequence
+
+        A transaction that may have been submitted is never signed again with a different sequence,
+        so it can't be applied twice: if horizon failed, the same transaction is submitted again after a backoff.
+        If the sequence was wrong, it is resynced from horizon, and the transaction is signed again.
+        But if an earlier attempt may have been submitted and its sequence was used since,
+        the transaction is looked up by its hash instead.
+        """
+        may_be_submitted = False
+        while True:
+            try:
+                with tracing.span('horizon.submit', channel=builder.address, operations=len(builder.ops)):
+                    tx_hash = (await builder.submit())['hash']
+                self.retry_policy.record_outcome(budget, RetryOutcomes.SUCCEEDED)
+                return tx_hash
+            except Exception as e:
+                reason = get_retry_reason(e)
+                if reason is None:
+                    self.retry_policy.record_outcome(budget, RetryOutcomes.FAILED)
+                    raise
+                delay = budget.next_delay(reason)
+                if delay is None:
+                    self.retry_policy.record_outcome(budget, RetryOutcomes.EXHAUSTED)
+                    raise
+
+                logger.info(f'Retrying a transaction on channel {builder.address} ({reason}): {e}')
+                if reason == RetryReasons.TRANSIENT:
+                    may_be_submitted = True
+                    await asyncio.sleep(delay)
+                    continue
+
+                submitted_hash = builder.hash_hex()
+                submitted_sequence = builder.sequence
+                with tracing.span('horizon.get_sequence'):
+                    await builder.update_sequence()
+                if may_be_submitted and builder.sequence != submitted_sequence:
+                    builder.sequence = submitted_sequence
+                    if await self._is_applied(submitted_hash, e):
+                        self.retry_policy.record_outcome(budget, RetryOutcomes.FOUND)
+                        return submitted_hash
+                    # The earlier attempt might still be applied, so the transaction can't be signed again
+                    self.retry_policy.record_outcome(budget, RetryOutcomes.FAILED)
+                    raise
+
+                # Build the transaction again with the new sequence, without the old signatures
+                builder.tx = builder.te = None
+                self._sign(builder)
+                may_be_submitted = False
+
+    async def _is_applied(self, tx_hash: str, error: Exception) -> bool:
+        """
+        Check if a transaction is already on the blockchain
+
+        :raises: The submission's error, if the transaction could not be looked up
+        """
+        try:
+            with tracing.span('horizon.get_transaction'):
+                await self._client.horizon.transaction(tx_hash)
+            return True
+        except KinErrors.HorizonError as e:
+            if e.type == HorizonErrorType.NOT_FOUND:
+                return False
+            raise error
+        except Exception:
+            raise error
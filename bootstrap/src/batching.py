@@ -0,0 +1,247 @@
+"""Contains methods to pack several operations into multi-operation transactions"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from sanic import Sanic
+from kin import KinErrors
+from kin.transactions import build_memo
+from kin.blockchain.errors import HorizonErrorType, TransactionResultCode, OperationResultCode, \
+    CreateAccountResultCode
+
+from . import errors
+from .account import BootstrapAccount
+from .helpers import prettify_exc
+
+from typing import List, Optional, Union
+
+# The network will reject transactions with more operations than this
+MAX_OPS_PER_TX = 100
+
+logger = logging.getLogger('bootstrap')
+
+
+class OperationsFailedError(Exception):
+    """Raised when a transaction failed because some of its operations failed"""
+    def __init__(self, op_codes: List[str]):
+        self.op_codes = op_codes
+
+
+def split_to_batches(items: list, batch_size: int = MAX_OPS_PER_TX) -> List[list]:
+    """Split a list of items to batches that can each fit in a single transaction"""
+    return [items[index:index + batch_size] for index in range(0, len(items), batch_size)]
+
+
+def translate_operation_error(op_code: str, destination: str) -> errors.BootstrapError:
+    """Translate a failed payment operation result code to a bootstrap error"""
+    sdk_error = KinErrors.translate_operation_error([op_code])
+    if isinstance(sdk_error, KinErrors.AccountNotFoundError):
+        return errors.DestinationDoesNotExistError(destination)
+    if isinstance(sdk_error, KinErrors.LowBalanceError):
+        return errors.LowBalanceError()
+    return errors.InternalError()
+
+
+async def send_payment_batch(kin_account: BootstrapAccount, payments: list, fee: int,
+                             memo: Optional[str]) -> List[Union[str, errors.BootstrapError, errors.InternalError]]:
+    """
+    Send up to MAX_OPS_PER_TX payments in a single transaction
+
+    Operations in a transaction are atomic, so if some of them fail, the failed ones are removed
+    and the rest are submitted again in a new transaction.
+
+    :return: A list with a tx_id or an error for each payment, in the same order as the payments
+    """
+    results = [None] * len(payments)
+    pending = list(range(len(payments)))
+
+    while pending:
+        try:
+            tx_id = await submit_payments(kin_account, [payments[index] for index in pending], fee, memo)
+        except OperationsFailedError as e:
+            still_pending = []
+            for index, op_code in zip(pending, e.op_codes):
+                if op_code == OperationResultCode.SUCCESS:
+                    still_pending.append(index)
+                else:
+                    results[index] = translate_operation_error(op_code, payments[index].destination)
+            pending = still_pending
+            continue
+        except KinErrors.LowBalanceError:
+            error = errors.LowBalanceError()
+        except errors.BootstrapError as e:
+            # Already an error for the client, like all of the channels being busy
+            error = e
+        except Exception as e:
+            # Other batches might have been sent already, so dont fail the whole request
+            logger.error(f'Unexpected exception while sending a payment batch:\n'
+                         f'{prettify_exc(e)}')
+            error = errors.InternalError()
+        else:
+            error = tx_id
+
+        for index in pending:
+            results[index] = error
+        break
+
+    return results
+
+
+async def submit_payments(kin_account: BootstrapAccount, payments: list, fee: int, memo: Optional[str]) -> str:
+    """
+    Build, sign and submit a transaction with a payment operation for each of the payments
+
+    :return: The hash of the transaction
+
+    :raises: OperationsFailedError: if some of the operations failed
+    """
+    builder = kin_account.get_transaction_builder(fee)
+    builder.add_text_memo(build_memo(kin_account.app_id, memo))
+    for payment in payments:
+        builder.append_payment_op(payment.destination, str(payment.amount),
+                                  source=kin_account.keypair.public_address)
+
+    try:
+        return await kin_account.send_transaction(builder, [payment.dict() for payment in payments])
+    except KinErrors.HorizonError as e:
+        if e.type == HorizonErrorType.TRANSACTION_FAILED \
+                and e.extras['result_codes']['transaction'] == TransactionResultCode.FAILED:
+            raise OperationsFailedError(e.extras['result_codes']['operations'])
+        raise KinErrors.translate_error(e)
+
+
+async def create_accounts_batch(kin_account: BootstrapAccount, addresses: List[str], starting_balance: float,
+                                fee: int) -> None:
+    """
+    Create up to MAX_OPS_PER_TX accounts in a single transaction, accounts that already exist are skipped
+
+    :raises: KinErrors.SdkError: if the accounts could not be created
+    """
+    while addresses:
+        builder = kin_account.get_transaction_builder(fee)
+        builder.add_text_memo(build_memo(kin_account.app_id, None))
+        for address in addresses:
+            builder.append_create_account_op(address, str(starting_balance),
+                                             source=kin_account.keypair.public_address)
+        try:
+            await kin_account.send_transaction(builder)
+            return
+        except KinErrors.HorizonError as e:
+            if e.type != HorizonErrorType.TRANSACTION_FAILED \
+                    or e.extras['result_codes']['transaction'] != TransactionResultCode.FAILED:
+                raise KinErrors.translate_error(e)
+
+            op_codes = e.extras['result_codes']['operations']
+            if any(op_code not in (OperationResultCode.SUCCESS, CreateAccountResultCode.ACCOUNT_EXISTS)
+                   for op_code in op_codes):
+                raise KinErrors.translate_operation_error(op_codes)
+
+            # Try again without the accounts that already exist
+            addresses = [address for address, op_code in zip(addresses, op_codes)
+                         if op_code == OperationResultCode.SUCCESS]
+
+
+class PaymentBatcher:
+    """
+    Coalesce concurrent payment requests into multi-operation transactions
+
+    Requests are put on a queue, and are flushed to the blockchain once 'max_size' requests are waiting,
+    or 'max_wait' seconds passed since the first request in the batch arrived.
+    Stopping the batcher flushes whatever is still waiting, and waits for all of the batches to be sent.
+    """
+
+    def __init__(self, app: Sanic, max_size: int, max_wait: float):
+        """
+        :param app: The app, used to get the kin account and the fee at the time of sending
+        :param max_size: The maximum number of payments to send in a single flush
+        :param max_wait: The maximum time (in seconds) to wait for more payments before flushing
+        """
+        self.app = app
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._batch = []  # The payments collected for the next flush
+        self._sending = set()  # The tasks sending the flushed batches
+        self._task = None
+
+    def start(self) -> None:
+        """Start the background task that flushes the queue"""
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task, and wait until all of the payments it took are sent"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Send the payments that were still waiting for their batch, so their requests don't hang
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            self._flush(batch)
+
+        if self._sending:
+            await asyncio.wait(self._sending)
+
+    async def pay(self, payment_request) -> str:
+        """
+        Queue a payment and wait until it is sent
+
+        :return: The hash of the transaction that included the payment
+
+        :raises: errors.BootstrapError/errors.InternalError: if the payment failed
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((payment_request, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(self._batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Dont block collecting the next batch while this one is being sent
+            batch, self._batch = self._batch, []
+            self._flush(batch)
+
+    def _flush(self, batch: list) -> None:
+        # All of the operations in a transaction share the same memo
+        by_memo = defaultdict(list)
+        for payment_request, future in batch:
+            by_memo[payment_request.memo].append((payment_request, future))
+
+        for memo, memo_batch in by_memo.items():
+            for tx_batch in split_to_batches(memo_batch):
+                task = asyncio.ensure_future(self._send(tx_batch, memo))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+    async def _send(self, tx_batch: list, memo: Optional[str]) -> None:
+        payments = [payment_request for payment_request, _ in tx_batch]
+        try:
+            results = await send_payment_batch(self.app.kin_account, payments, self.app.fee_manager.fee, memo)
+        except Exception as e:
+            results = [e] * len(tx_batch)
+
+        for (_, future), result in zip(tx_batch, results):
+            # The request might have been cancelled while waiting
+            if future.done():
+                continue
+            if isinstance(result, str):
+                future.set_result(result)
+            else:
+                future.set_exception(result)
@@ -0,0 +1,315 @@
+"""Contains in-process caches for responses that are expensive to get from horizon"""
+import time
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    A size bounded cache, where entries expire after a fixed time
+
+    When the cache is full, the least recently used entry is evicted.
+    A ttl of 0 disables the cache.
+
+    Every invalidation gives the key a new generation, so a value that was read before the key
+    was invalidated can be kept out of the cache, even if the read finishes after the invalidation.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        :param max_size: The maximum number of entries to keep
+        :param ttl: How long (in seconds) an entry is kept
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # The generations of the most recently invalidated keys, bounded like the entries.
+        # Dropping a key starts a new generation for all of the keys that aren't kept,
+        # so it never looks like a key wasn't invalidated since its generation was read.
+        self._generations = OrderedDict()
+        self._last_generation = 0
+        self._dropped_generation = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Get an entry from the cache
+
+        :return: The value and its age (in seconds), or None if the key is not cached
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age >= self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value, age
+
+    def get_generation(self, key: Hashable) -> int:
+        """Get the generation of a key, which changes every time the key is invalidated"""
+        return self._generations.get(key, self._dropped_generation)
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Add or replace an entry, evicting the least recently used entry if the cache is full
+
+        :param generation: The generation of the key before its value was read,
+            the value is not cached if the key was invalidated since
+        """
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        if generation is not None and generation != self.get_generation(key):
+            return
+
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Remove entries from the cache, and start a new generation of their keys"""
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+
+        for key in keys:
+            self._entries.pop(key, None)
+            self._last_generation += 1
+            self._generations[key] = self._last_generation
+            self._generations.move_to_end(key)
+        while len(self._generations) > self.max_size:
+            self._generations.popitem(last=False)
+            self._last_generation += 1
+            self._dropped_generation = self._last_generation
+
+    def clear(self) -> None:
+        """Remove all of the entries from the cache"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class WhitelistCache:
+    """
+    Cache whitelisted transactions by the envelope and network id they were sent with
+
+    Signing the same envelope always gives the same signature, so a client that retries gets the cached result.
+    When the cache is full, the least recently used entry is evicted.
+    Entries also expire once their transaction can't be applied anymore: after its time bounds,
+    or once a transaction with a higher sequence was whitelisted for the same account.
+    A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int):
+        """:param max_size: The maximum number of transactions to keep"""
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # The highest sequence that was whitelisted for each of the recent source accounts
+        self._sequences = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(envelope_xdr: str, network_id: str) -> bytes:
+        """Get the key of a whitelist request, a hash is much smaller than the envelope itself"""
+        return sha256(f'{network_id}\n{envelope_xdr}'.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[str]:
+        """Get a whitelisted envelope, or None if it is not cached"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        tx_envelope, source, sequence, max_time = entry
+        if (max_time and max_time <= time.time()) or sequence < self._sequences.get(source, sequence):
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return tx_envelope
+
+    def set(self, key: bytes, tx_envelope: str, source: str, sequence: int, max_time: int) -> None:
+        """
+        Add a whitelisted envelope, evicting the least recently used entry if the cache is full
+
+        :param key: The key from get_key
+        :param tx_envelope: The whitelisted envelope
+        :param source: The source account of the transaction
+        :param sequence: The sequence of the transaction
+        :param max_time: The upper time bound of the transaction (as a unix timestamp), or 0 if it has none
+        """
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (tx_envelope, source, sequence, max_time)
+        self._entries.move_to_end(key)
+        self._sequences[source] = max(sequence, self._sequences.get(source, sequence))
+        self._sequences.move_to_end(source)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        while len(self._sequences) > self.max_size:
+            self._sequences.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    A persistent key-value store for values that never change, backed by sqlite
+
+    Reads and writes run on a separate thread, so waiting on the disk never blocks the event loop.
+    """
+
+    def __init__(self, path: str):
+        """:param path: The path of the sqlite database file, created if it doesn't exist"""
+        # sqlite connections should be used from a single thread
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # This is only a cache, so we can afford to lose the last writes if the machine crashes
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+        self._db.commit()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Get a value from the store, or None if it doesn't exist"""
+        def select():
+            row = self._db.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            return None if row is None else row[0]
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, select)
+
+    async def set(self, key: str, value: bytes) -> None:
+        """Add or replace a value in the store"""
+        def insert():
+            self._db.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)', (key, value))
+            self._db.commit()
+
+        await asyncio.get_event_loop().run_in_executor(self._executor, insert)
+
+    def close(self) -> None:
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown()
+
+
+class TransactionCache:
+    """
+    Cache the responses for transactions
+
+    Confirmed transactions never change, so their responses are kept until evicted,
+    and optionally also on disk so they survive a restart.
+    Transactions that were not found are remembered for a short time only, since they might still be confirmed.
+    """
+
+    def __init__(self, max_size: int, not_found_ttl: float, path: Optional[str] = None):
+        """
+        :param max_size: The maximum number of responses to keep in memory
+        :param not_found_ttl: How long (in seconds) to remember that a transaction was not found
+        :param path: The path of a sqlite database file to also store the responses in, if any
+        """
+        self._found = TTLCache(max_size, float('inf'))
+        self._not_found = TTLCache(max_size, not_found_ttl)
+        self._disk = DiskCache(path) if path else None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, tx_hash: str) -> Optional[bytes]:
+        """
+        Get the serialized response for a transaction
+
+        :return: The response body, or None if the transaction is not cached
+        """
+        cached = self._found.get(tx_hash)
+        if cached is not None:
+            self.hits += 1
+            return cached[0]
+
+        if self._disk is not None:
+            body = await self._disk.get(tx_hash)
+            if body is not None:
+                self._found.set(tx_hash, body)
+                self.hits += 1
+                return body
+
+        self.misses += 1
+        return None
+
+    async def set(self, tx_hash: str, body: bytes) -> None:
+        """Store the serialized response for a transaction"""
+        self._found.set(tx_hash, body)
+        if self._disk is not None:
+            await self._disk.set(tx_hash, body)
+
+    def is_not_found(self, tx_hash: str) -> bool:
+        """Check if the transaction was recently not found"""
+        return self._not_found.get(tx_hash) is not None
+
+    def set_not_found(self, tx_hash: str) -> None:
+        """Remember that the transaction was not found"""
+        self._not_found.set(tx_hash, True)
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+
+class SingleFlight:
+    """
+    Share a single call between concurrent identical requests
+
+    While a call for a key is in flight, other requests for the same key wait for its result
+    instead of making their own call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+        # Metrics
+        self.shared_calls = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        """
+        Call 'func', or wait for the result of a call for the same key that is already in flight
+
+        :param key: Identifies the call, calls with the same key are expected to return the same result
+        :param func: Returns the awaitable to wait for
+        :return: The result of the call
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._forget(key, future))
+        else:
+            self.shared_calls += 1
+
+        # A request that is cancelled should not cancel the call for the other requests
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
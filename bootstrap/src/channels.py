@@ -0,0 +1,227 @@
+"""Contains the channel scheduler, which hands out channels to the transactions the server sends"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import Enum
+
+from kin_base.keypair import Keypair
+
+from . import errors
+from . import tracing
+
+from typing import List, Optional
+
+logger = logging.getLogger('bootstrap')
+
+# Weight of the newest sample in the moving average of the wait time
+WAIT_TIME_SMOOTHING = 0.1
+
+
+class ChannelStatuses(str, Enum):
+    """Contains possible statuses for channels"""
+
+    # subclass str to be able to serialize to json
+    FREE = 'free'
+    TAKEN = 'taken'
+    RESTING = 'resting'
+
+
+@dataclass
+class Channel:
+    seed: str
+    keypair: Keypair
+    address: str
+    status: ChannelStatuses = ChannelStatuses.FREE
+    sequence: Optional[int] = None  # The last sequence used by the channel, None if unknown
+    failures: int = 0  # Consecutive failures
+    retired: bool = False  # The channel will be removed from the pool once it is no longer used
+
+
+class ChannelScheduler:
+    """
+    Hand out channels to transactions, and keep track of their state
+
+    A channel is used by one transaction at a time.
+    When all channels are taken, requests wait in a bounded FIFO queue until a channel is free.
+    Channels that fail repeatedly are rested for a while before they are used again.
+
+    This class replaces the kin-sdk's ChannelManager, and keeps the same interface.
+    """
+
+    def __init__(self, channel_seeds: List[str], max_waiters: int, wait_timeout: float,
+                 failure_threshold: int, rest_time: float):
+        """
+        :param channel_seeds: The seeds of the channels to use
+        :param max_waiters: Maximum number of requests that can wait for a channel
+        :param wait_timeout: Maximum time (in seconds) a request will wait for a channel
+        :param failure_threshold: Number of consecutive failures after which a channel is rested
+        :param rest_time: How long (in seconds) a failing channel is rested
+        """
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self.failure_threshold = failure_threshold
+        self.rest_time = rest_time
+
+        self.channels = {}
+        self._free = deque()
+        self._waiters = deque()
+
+        # Metrics
+        self.average_wait_time = 0.0
+        self.rejected_requests = 0
+        self.saturated_since = None  # Since when requests have been waiting for channels
+
+        self.add_channels(channel_seeds)
+
+    @asynccontextmanager
+    async def get_channel(self) -> str:
+        """
+        Get an available channel
+
+        :return a free channel seed
+
+        :raises: errors.ChannelsBusyError: if no channel became free in time
+        """
+        with tracing.span('channel.acquire'):
+            channel = await self.acquire()
+        try:
+            yield channel
+        finally:
+            self.release(channel)
+
+    async def acquire(self) -> str:
+        """
+        Take a free channel, or wait in line for one
+
+        :return: a channel seed
+
+        :raises: errors.ChannelsBusyError: if the wait queue is full, or no channel became free in time
+        """
+        if self._free and not self._waiters:
+            return self._take(self._free.popleft())
+
+        if len(self._waiters) >= self.max_waiters:
+            self.rejected_requests += 1
+            raise errors.ChannelsBusyError()
+
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        start_time = loop.time()
+        if self.saturated_since is None:
+            self.saturated_since = start_time
+        try:
+            return await asyncio.wait_for(waiter, self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_requests += 1
+            raise errors.ChannelsBusyError()
+        except asyncio.CancelledError:
+            # The channel might have been handed to us just before we got cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if not self._waiters:
+                self.saturated_since = None
+            wait_time = loop.time() - start_time
+            self.average_wait_time += WAIT_TIME_SMOOTHING * (wait_time - self.average_wait_time)
+
+    def release(self, seed: str) -> None:
+        """Return a channel to the pool, or hand it directly to the first request in line"""
+        channel = self.channels[seed]
+        if channel.status == ChannelStatuses.RESTING:
+            return
+        if channel.retired:
+            del self.channels[seed]
+            return
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(seed)
+                return
+
+        channel.status = ChannelStatuses.FREE
+        self._free.append(seed)
+
+    def add_channels(self, channel_seeds: List[str]) -> None:
+        """Add channels to the pool, channels that are already in the pool are ignored"""
+        for seed in channel_seeds:
+            channel = self.channels.get(seed)
+            if channel is not None:
+                # Bring back a channel that was retired but not removed yet
+                channel.retired = False
+                continue
+
+            keypair = Keypair.from_seed(seed)
+            self.channels[seed] = Channel(seed, keypair, keypair.address().decode(), status=ChannelStatuses.TAKEN)
+            self.release(seed)
+
+    def remove_channels(self, channel_seeds: List[str]) -> None:
+        """Remove channels from the pool, channels that are in use are removed once they are released"""
+        for seed in channel_seeds:
+            channel = self.channels.get(seed)
+            if channel is None:
+                continue
+            if channel.status == ChannelStatuses.FREE:
+                self._free.remove(seed)
+                del self.channels[seed]
+            else:
+                channel.retired = True
+
+    def report_success(self, seed: str) -> None:
+        """Report that a channel was used successfully"""
+        self.channels[seed].failures = 0
+
+    def report_failure(self, seed: str) -> None:
+        """Report that a channel failed, and rest it if it keeps failing"""
+        channel = self.channels[seed]
+        channel.failures += 1
+        # We can no longer trust the sequence we have
+        channel.sequence = None
+        if channel.failures >= self.failure_threshold and channel.status == ChannelStatuses.TAKEN:
+            logger.warning(f'Channel {channel.address} failed {channel.failures} times in a row, '
+                           f'resting it for {self.rest_time} seconds')
+            channel.status = ChannelStatuses.RESTING
+            asyncio.get_event_loop().call_later(self.rest_time, self._wake, seed)
+
+    def get_status(self, verbose: Optional[bool] = False) -> dict:
+        """
+        Return the current status of the channels
+
+        :param verbose: Include all channel addresses and their statuses in the response
+        :return: The status of the channels
+        """
+        status = {
+            'total_channels': len(self.channels),
+            'free_channels': len(self._free),
+            'non_free_channels': len(self.channels) - len(self._free),
+            'resting_channels': sum(1 for channel in self.channels.values()
+                                    if channel.status == ChannelStatuses.RESTING),
+            'waiting_requests': len(self._waiters),
+            'average_wait_time': self.average_wait_time,
+            'rejected_requests': self.rejected_requests
+        }
+        if verbose:
+            status['channels'] = {channel.address: channel.status for channel in self.channels.values()}
+
+        return status
+
+    def _take(self, seed: str) -> str:
+        self.channels[seed].status = ChannelStatuses.TAKEN
+        return seed
+
+    def _wake(self, seed: str) -> None:
+        channel = self.channels.get(seed)
+        if channel is None or channel.status != ChannelStatuses.RESTING:
+            return
+        channel.failures = 0
+        if channel.retired:
+            del self.channels[seed]
+            return
+        channel.status = ChannelStatuses.TAKEN
+        self.release(seed)
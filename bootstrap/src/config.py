@@ -12,12 +12,66 @@ class Settings(BaseSettings):
     SEED: str = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
     HORIZON_ENDPOINT: str = kin_config.HORIZON_URI_TEST
     NETWORK_PASSPHRASE: str = kin_config.HORIZON_PASSPHRASE_TEST
+    HORIZON_POOL_SIZE: int = 100
+    HORIZON_KEEPALIVE_TIMEOUT: float = 30
+    HORIZON_CONNECT_TIMEOUT: float = 3
+    HORIZON_REQUEST_TIMEOUT: float = 11
+    HORIZON_NUM_RETRIES: int = 3
+    HORIZON_FAILURE_THRESHOLD: int = 3
+    HORIZON_REST_TIME: float = 30
     APP_ID: str = kin_config.ANON_APP_ID
     CHANNEL_COUNT: int = 100
     CHANNEL_SALT: str = 'bootstrap'
     CHANNEL_STARTING_BALANCE: int = 1
+    CHANNEL_WAIT_QUEUE_SIZE: int = 1000
+    CHANNEL_WAIT_TIMEOUT: float = 10
+    CHANNEL_FAILURE_THRESHOLD: int = 3
+    CHANNEL_REST_TIME: float = 30
+    CHANNEL_MAX_COUNT: int = 500
+    CHANNEL_LOOKUP_CONCURRENCY: int = 50
+    CHANNEL_AUTOSCALE: bool = False
+    CHANNEL_AUTOSCALE_STEP: int = 100
+    CHANNEL_AUTOSCALE_INTERVAL: float = 10
+    FEE_POLICY: str = 'network'
+    FEE_FIXED: int = 100
+    FEE_REFRESH_INTERVAL: float = 30
+    FEE_SURGE_THRESHOLD: float = 0.8
+    FEE_SURGE_MULTIPLIER: float = 2
+    FEE_MAX: int = 10000
+    SUBMIT_MAX_RETRIES: int = 3
+    SUBMIT_RETRY_BACKOFF: float = 0.5
+    SUBMIT_RETRY_DEADLINE: float = 30
     PORT: int = 8000
+    WORKERS: int = 1
     LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: str = 'text'
+    LOG_BODIES: str = 'full'
+    LOG_BODY_MAX_LENGTH: int = 1000
+    LOG_BODY_SAMPLE_RATE: float = 100
+    LOG_SLOW_REQUEST_TIME: float = 1
+    TRACING_PATH: str = ''
+    TRACING_SAMPLE_RATE: float = 100
+    WHITELIST_EXECUTOR: str = 'process'
+    WHITELIST_POOL_SIZE: int = 2
+    WHITELIST_CACHE_SIZE: int = 10000
+    PAYMENT_BATCHING: bool = False
+    PAYMENT_BATCH_SIZE: int = 100
+    PAYMENT_BATCH_WAIT_MS: int = 50
+    BALANCE_CACHE_TTL: float = 0
+    BALANCE_CACHE_SIZE: int = 10000
+    TX_CACHE_SIZE: int = 10000
+    TX_NOT_FOUND_CACHE_TTL: float = 5
+    TX_CACHE_PATH: str = ''
+    BULK_LOOKUP_CONCURRENCY: int = 50
+    STREAM_MAX_SUBSCRIBERS: int = 50000
+    STREAM_QUEUE_SIZE: int = 100
+    STREAM_HEARTBEAT_INTERVAL: float = 15
+    IDEMPOTENCY_KEY_TTL: float = 86400
+    IDEMPOTENCY_STORE_SIZE: int = 100000
+    IDEMPOTENCY_STORE_PATH: str = ''
+    JOURNAL_PATH: str = ''
+    JOURNAL_QUEUE_SIZE: int = 100000
+    JOURNAL_BATCH_SIZE: int = 1000
 
     class Config:
         env_prefix = ''
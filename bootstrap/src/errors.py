@@ -106,6 +106,14 @@ class DestinationExistsError(BootstrapError):
         super(DestinationExistsError, self).__init__(message)
 
 
+class JournalDisabledError(BootstrapError):
+    def __init__(self):
+        self.code = 4043
+        self.http_code = 404
+        message = f'The journal is not enabled on this server'
+        super(JournalDisabledError, self).__init__(message)
+
+
 class InvalidBodyError(BootstrapError):
     def __init__(self):
         self.code = 4008
@@ -114,6 +122,30 @@ class InvalidBodyError(BootstrapError):
         super(InvalidBodyError, self).__init__(message)
 
 
+class ChannelsBusyError(BootstrapError):
+    def __init__(self):
+        self.code = 5031
+        self.http_code = 503
+        message = f'All channels are busy, try again later'
+        super(ChannelsBusyError, self).__init__(message)
+
+
+class NotReadyError(BootstrapError):
+    def __init__(self):
+        self.code = 5032
+        self.http_code = 503
+        message = f'The server is still setting up the channels'
+        super(NotReadyError, self).__init__(message)
+
+
+class TooManySubscribersError(BootstrapError):
+    def __init__(self):
+        self.code = 5033
+        self.http_code = 503
+        message = f'Too many clients are subscribed to payments, try again later'
+        super(TooManySubscribersError, self).__init__(message)
+
+
 def translate_validation_error(val_error: ValidationError) -> BootstrapError:
     """
     Method to translate validation errors to 1 of 4:
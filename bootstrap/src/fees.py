@@ -0,0 +1,121 @@
+"""Contains the fee policy, and the refresher that keeps the fee up to date with the network"""
+import math
+import asyncio
+import logging
+
+import kin
+
+from .helpers import prettify_exc
+
+from typing import List, Optional
+
+logger = logging.getLogger('bootstrap')
+
+# The network's minimum fee (in quarks) until it is first fetched
+DEFAULT_MINIMUM_FEE = 100
+# How many of the latest ledgers to measure the capacity usage of the network over
+LEDGER_WINDOW = 10
+
+
+class FeePolicies:
+    """Contains the supported fee policies"""
+    FIXED = 'fixed'  # Always pay the same fee, 0 for whitelisted apps
+    NETWORK = 'network'  # Pay the network's minimum fee
+    SURGE = 'surge'  # Pay a multiple of the minimum fee when the ledgers are close to full
+
+
+def get_capacity_usage(ledgers: List[dict]) -> float:
+    """Get the ratio of the ledgers' transaction capacity that was used"""
+    transactions = sum(ledger.get('successful_transaction_count', ledger.get('transaction_count', 0)) +
+                       ledger.get('failed_transaction_count', 0) for ledger in ledgers)
+    capacity = sum(ledger.get('max_tx_set_size', 0) for ledger in ledgers)
+    return transactions / capacity if capacity else 0
+
+
+class FeeManager:
+    """
+    Decide the fee to pay for transactions, according to the fee policy and the state of the network
+
+    The network's minimum fee and capacity usage are refreshed in the background,
+    so sending a transaction never waits for them.
+    """
+
+    def __init__(self, kin_client: kin.KinClient, policy: str, fixed_fee: int,
+                 surge_threshold: float, surge_multiplier: float, max_fee: int):
+        """
+        :param kin_client: The client used to get the latest ledgers from horizon
+        :param policy: One of FeePolicies
+        :param fixed_fee: The fee to pay with the 'fixed' policy
+        :param surge_threshold: The ratio of the ledgers' capacity above which the 'surge' policy raises the fee
+        :param surge_multiplier: How many times the minimum fee the 'surge' policy pays when it raises the fee
+        :param max_fee: The highest fee the 'surge' policy pays, unless the minimum fee itself is higher
+
+        :raises: ValueError: if the policy is not one of FeePolicies
+        """
+        if policy not in (FeePolicies.FIXED, FeePolicies.NETWORK, FeePolicies.SURGE):
+            raise ValueError(f'Unknown fee policy "{policy}"')
+
+        self.kin_client = kin_client
+        self.policy = policy
+        self.fixed_fee = fixed_fee
+        self.surge_threshold = surge_threshold
+        self.surge_multiplier = surge_multiplier
+        self.max_fee = max_fee
+        self.minimum_fee = DEFAULT_MINIMUM_FEE
+        self.capacity_usage = 0.0
+        self._task: Optional[asyncio.Future] = None
+
+    @property
+    def fee(self) -> int:
+        """The fee to pay for a transaction right now"""
+        if self.policy == FeePolicies.FIXED:
+            return self.fixed_fee
+        if self.policy == FeePolicies.SURGE and self.capacity_usage >= self.surge_threshold:
+            surge_fee = min(math.ceil(self.minimum_fee * self.surge_multiplier), self.max_fee)
+            return max(surge_fee, self.minimum_fee)
+        return self.minimum_fee
+
+    async def refresh(self) -> None:
+        """Get the minimum fee and the capacity usage from the latest ledgers"""
+        response = await self.kin_client.horizon.ledgers(order='desc', limit=LEDGER_WINDOW)
+        ledgers = response['_embedded']['records']
+        previous_fee = self.fee
+        self.minimum_fee = ledgers[0]['base_fee_in_stroops']
+        self.capacity_usage = get_capacity_usage(ledgers)
+        if self.fee != previous_fee:
+            logger.info(f'The fee changed from {previous_fee} to {self.fee} (minimum fee {self.minimum_fee}, '
+                        f'{self.capacity_usage:.0%} of the ledger capacity used)')
+
+    def start(self, interval: float) -> None:
+        """
+        Refresh the fee in the background
+
+        :param interval: How often (in seconds) to refresh the fee
+        """
+        self._task = asyncio.ensure_future(self._refresh_periodically(interval))
+
+    async def stop(self) -> None:
+        """Stop refreshing the fee"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep using the last known fee
+                logger.error(f'Failed to refresh the fee:\n'
+                             f'{prettify_exc(e)}')
+
+    def get_status(self) -> dict:
+        return {'policy': self.policy,
+                'fee': self.fee,
+                'minimum_fee': self.minimum_fee,
+                'capacity_usage': self.capacity_usage}
@@ -3,13 +3,23 @@ from functools import wraps
 
 from sanic import response
 from .requets_models import BaseRequest
+from .serialization import dumps
+from . import tracing
 
 
 def json_response(resp: dict, http_code: int) -> response.HTTPResponse:
     """Easier way to get a json response"""
-    # escape_forward_slashes: https://github.com/huge-success/sanic/issues/1019
-    return response.json(resp, status=http_code,
-                         escape_forward_slashes=False)
+    return raw_json_response(dumps(resp), http_code)
+
+
+def json_bytes(resp: dict) -> bytes:
+    """Serialize to json the same way json_response does"""
+    return dumps(resp)
+
+
+def raw_json_response(body: bytes, http_code: int) -> response.HTTPResponse:
+    """Get a json response for a body that is already serialized"""
+    return response.HTTPResponse(body_bytes=body, status=http_code, content_type='application/json')
 
 
 def get_model(model: BaseRequest):
@@ -18,7 +28,9 @@ def get_model(model: BaseRequest):
         @wraps(func)
         def wrapper(*args, **kwargs):
             request = args[0]
-            return func(model.from_json(request.body.decode()))
+            with tracing.span('validate', model=model.__name__):
+                request_model = model.from_json(request.body)
+            return func(request_model)
 
         return wrapper
     return decorator
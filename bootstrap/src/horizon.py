@@ -0,0 +1,252 @@
+"""Contains the connection to horizon, pooled and spread across one or more horizon nodes"""
+import json
+import time
+import random
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp_sse_client.client import EventSource
+import kin
+from kin_base import Horizon
+from kin_base.horizon import HEADERS
+from kin_base.exceptions import HorizonError, HorizonRequestError
+from yarl import URL
+
+from .config import Settings
+
+from typing import AsyncGenerator, List, Optional, Union
+
+logger = logging.getLogger('bootstrap')
+
+# How much the latest request counts in a node's average latency
+LATENCY_EWMA_WEIGHT = 0.2
+# The fraction of reads sent to a random healthy node instead of the fastest one, to keep the latency of all nodes known
+PROBE_RATE = 0.05
+
+
+def parse_endpoints(endpoints: str) -> List[str]:
+    """Get the horizon endpoints from a comma separated list"""
+    return [endpoint.strip() for endpoint in endpoints.split(',') if endpoint.strip()]
+
+
+class PooledHorizon(Horizon):
+    """A connection to a single horizon node, with a configurable connection pool, keep-alive and timeouts"""
+
+    def __init__(self, horizon_uri: str, pool_size: int, keepalive_timeout: float, connect_timeout: float,
+                 request_timeout: float, num_retries: int, backoff_factor: float = 0.5):
+        """
+        :param horizon_uri: The url of the horizon node
+        :param pool_size: The maximum number of open connections to the node
+        :param keepalive_timeout: How long (in seconds) to keep idle connections open for reuse
+        :param connect_timeout: How long (in seconds) to wait for a new connection, including waiting for the pool
+        :param request_timeout: How long (in seconds) a whole request can take
+        :param num_retries: How many times to retry a request that failed to connect or timed out
+        :param backoff_factor: How long (in seconds) to wait between retries, multiplied by the retry number
+        """
+        # Horizon's own constructor only supports the pool size and the request timeout, so the session is built here
+        self.horizon_uri = URL(horizon_uri)
+        self.num_retries = num_retries
+        self.backoff_factor = backoff_factor
+        connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=keepalive_timeout)
+        self._session = aiohttp.ClientSession(headers=HEADERS, connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=request_timeout,
+                                                                            connect=connect_timeout))
+        self._sse_session = None
+
+    async def _get(self, url: URL, params: Optional[dict] = None, sse: Optional[bool] = False,
+                   sse_timeout: Optional[float] = None) -> Union[dict, AsyncGenerator]:
+        if sse:
+            # The sdk ignores the params of a stream, and always starts it from "now"
+            return self.sse_generator(url, sse_timeout, (params or {}).get('cursor', 'now'))
+        return await super()._get(url, params)
+
+    async def sse_generator(self, url: Union[str, URL], timeout: Optional[float],
+                            cursor: str = 'now') -> AsyncGenerator:
+        """
+        Stream events from horizon, like the sdk's generator but starting from the given cursor
+
+        :param url: The url of the stream
+        :param timeout: How long (in seconds) to wait for each event, or None to wait forever
+        :param cursor: The paging token to start after, or "now" to only get new events
+        """
+        async def events() -> AsyncGenerator:
+            last_id = cursor
+            retry = 0.1
+            while True:
+                try:
+                    # The headers are passed again since the params override the session's headers
+                    async with EventSource(url, session=self._sse_session, params={'cursor': last_id},
+                                           headers=HEADERS) as client:
+                        async for event in client:
+                            # Events without an id (hello and byebye) carry no data
+                            if event.last_event_id == '':
+                                continue
+                            last_id = event.last_event_id
+                            retry = client._reconnection_time.total_seconds()
+                            try:
+                                yield json.loads(event.data)
+                            except json.JSONDecodeError:
+                                pass
+                except aiohttp.ClientPayloadError:
+                    # The connection dropped after the stream started, resume from the last event
+                    logger.debug(f'Resetting the stream of {url}')
+                    await asyncio.sleep(retry)
+
+        await self._init_sse_session()
+        generator = events()
+        while True:
+            yield await asyncio.wait_for(generator.__anext__(), timeout)
+
+
+class HorizonNode:
+    """
+    A horizon node, with its average latency and a circuit breaker
+
+    After 'failure_threshold' consecutive failures the node is rested, and no requests are sent to it.
+    Once it rested, the next request decides whether it is healthy again, or rested again right away.
+    """
+
+    def __init__(self, horizon: PooledHorizon, failure_threshold: int, rest_time: float):
+        self.horizon = horizon
+        self.uri = str(horizon.horizon_uri)
+        self.failure_threshold = failure_threshold
+        self.rest_time = rest_time
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.rest_until = 0.0
+
+    def is_available(self) -> bool:
+        return self.rest_until <= time.monotonic()
+
+    def report_success(self, latency: float) -> None:
+        self.failures = 0
+        self.latency = latency if self.latency is None else \
+            LATENCY_EWMA_WEIGHT * latency + (1 - LATENCY_EWMA_WEIGHT) * self.latency
+
+    def report_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.is_available():
+                logger.warning(f'Horizon node {self.uri} failed {self.failures} times in a row, '
+                               f'resting it for {self.rest_time} seconds')
+            self.rest_until = time.monotonic() + self.rest_time
+
+    def get_status(self) -> dict:
+        return {'uri': self.uri,
+                'available': self.is_available(),
+                'latency': self.latency,
+                'failures': self.failures}
+
+
+def is_node_failure(e: Exception) -> bool:
+    """Check if a request failed because of the node, and not because of the request itself"""
+    if isinstance(e, HorizonError):
+        return getattr(e, 'status', 0) >= 500
+    return isinstance(e, (HorizonRequestError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class FailoverHorizon(Horizon):
+    """
+    Spread the requests to horizon across several nodes of the same network
+
+    Reads go to the node with the lowest average latency, and fail over to the next node if it fails.
+    Submissions (and streams) stick to a single node, the first available one in the order the nodes were given,
+    so transactions of the same channel are not submitted to nodes that might be behind each other.
+    """
+
+    def __init__(self, nodes: List[HorizonNode]):
+        # Horizon's constructor would open a session of its own, the nodes have the sessions
+        self.nodes = nodes
+        self.num_retries = nodes[0].horizon.num_retries
+        self.backoff_factor = nodes[0].horizon.backoff_factor
+        self._sticky_node = nodes[0]
+
+    @property
+    def horizon_uri(self) -> URL:
+        return self.get_sticky_node().horizon.horizon_uri
+
+    @property
+    def _session(self) -> aiohttp.ClientSession:
+        # Used by the kin-sdk to report the connection settings, and to call friendbot
+        return self.get_sticky_node().horizon._session
+
+    def get_sticky_node(self) -> HorizonNode:
+        """Get the node to submit to, moving to the next available node if the current one is resting"""
+        if not self._sticky_node.is_available():
+            node = next((node for node in self.nodes if node.is_available()), None)
+            if node is not None and node is not self._sticky_node:
+                logger.warning(f'Submitting to horizon node {node.uri} instead of {self._sticky_node.uri}')
+                self._sticky_node = node
+        return self._sticky_node
+
+    def get_read_nodes(self) -> List[HorizonNode]:
+        """Get the nodes in the order to try a read on, fastest first, and resting nodes only as a last resort"""
+        available = [node for node in self.nodes if node.is_available()]
+        # Nodes that were not measured yet are tried first, to measure them
+        available.sort(key=lambda node: node.latency or 0)
+        if len(available) > 1 and random.random() < PROBE_RATE:
+            probed = available.pop(random.randrange(1, len(available)))
+            available.insert(0, probed)
+        return available + [node for node in self.nodes if not node.is_available()]
+
+    async def _call(self, node: HorizonNode, method: str, *args, **kwargs):
+        start_time = time.monotonic()
+        try:
+            result = await getattr(node.horizon, method)(*args, **kwargs)
+        except Exception as e:
+            if is_node_failure(e):
+                node.report_failure()
+            raise
+        node.report_success(time.monotonic() - start_time)
+        return result
+
+    async def query(self, rel_url: URL, params: Optional[dict] = None, sse: Optional[bool] = False,
+                    sse_timeout: Optional[Union[float, None]] = None) -> Union[dict, AsyncGenerator]:
+        if sse:
+            return await self.get_sticky_node().horizon.query(rel_url, params, sse, sse_timeout)
+
+        nodes = self.get_read_nodes()
+        for index, node in enumerate(nodes):
+            try:
+                return await self._call(node, 'query', rel_url, params)
+            except Exception as e:
+                if not is_node_failure(e) or index == len(nodes) - 1:
+                    raise
+                logger.info(f'Read from horizon node {node.uri} failed, trying {nodes[index + 1].uri}: {e}')
+
+    async def submit(self, te: str) -> dict:
+        # Not failed over, a submission that timed out might still be applied
+        return await self._call(self.get_sticky_node(), 'submit', te)
+
+    async def close(self) -> None:
+        await asyncio.gather(*[node.horizon.close() for node in self.nodes])
+
+    def get_status(self) -> List[dict]:
+        return [node.get_status() for node in self.nodes]
+
+
+class BootstrapClient(kin.KinClient):
+    """A KinClient that uses a given horizon connection, instead of opening one of its own"""
+
+    def __init__(self, environment: kin.Environment, horizon: Horizon):
+        self.environment = environment
+        self.network = environment.name
+        self.horizon = horizon
+
+
+def create_kin_client(config: Settings) -> BootstrapClient:
+    """Create a kin client that connects to all of the configured horizon nodes"""
+    endpoints = parse_endpoints(config.HORIZON_ENDPOINT)
+    nodes = [HorizonNode(PooledHorizon(endpoint,
+                                       pool_size=config.HORIZON_POOL_SIZE,
+                                       keepalive_timeout=config.HORIZON_KEEPALIVE_TIMEOUT,
+                                       connect_timeout=config.HORIZON_CONNECT_TIMEOUT,
+                                       request_timeout=config.HORIZON_REQUEST_TIMEOUT,
+                                       num_retries=config.HORIZON_NUM_RETRIES),
+                         failure_threshold=config.HORIZON_FAILURE_THRESHOLD,
+                         rest_time=config.HORIZON_REST_TIME)
+             for endpoint in endpoints]
+    kin_env = kin.Environment('CUSTOM', endpoints[0], config.NETWORK_PASSPHRASE)
+    logger.info(f'Kin client initialized with horizon nodes: {", ".join(endpoints)}')
+    return BootstrapClient(kin_env, FailoverHorizon(nodes))
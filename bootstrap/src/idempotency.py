@@ -0,0 +1,176 @@
+"""Contains the store that makes retrying payment and creation requests safe"""
+import time
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from hashlib import sha256
+
+from sanic import Sanic
+from sanic.response import HTTPResponse
+
+from . import errors
+from .cache import TTLCache
+from .helpers import prettify_exc, raw_json_response
+
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger('bootstrap')
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """
+    Remember the responses of requests that were sent with an idempotency key
+
+    A request with a key that was already used gets the original response, without running again.
+    A request with a key that is still being handled waits for the original request to finish.
+    Only successful responses are kept, so a request that failed can be retried with the same key.
+
+    The handler runs in a task of its own, so if the client disconnects in the middle of a payment,
+    the payment still finishes and its response is kept for the retry.
+
+    Responses are kept in memory, and written to sqlite behind it on a separate thread,
+    so requests never wait on the disk unless they look up a key that is no longer in memory.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        """
+        :param max_size: The maximum number of responses to keep in memory
+        :param ttl: How long (in seconds) to keep the responses
+        :param path: The path of a sqlite database file to also store the responses in, if any
+        """
+        self.ttl = ttl
+        self._completed = TTLCache(max_size, ttl)
+        self._in_flight = {}
+
+        self._db = None
+        if path:
+            # sqlite connections should be used from a single thread
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS idempotency '
+                             '(key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, '
+                             'body BLOB NOT NULL, created_at REAL NOT NULL)')
+            self._db.commit()
+            self._executor.submit(self._write, 'DELETE FROM idempotency WHERE created_at < ?',
+                                  (time.time() - ttl,))
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[HTTPResponse]]) \
+            -> Tuple[int, bytes, bool]:
+        """
+        Run a request once per key
+
+        :param key: The idempotency key
+        :param fingerprint: Identifies the content of the request, a key can't be reused for a different request
+        :param handler: Handles the request
+        :return: The status and body of the response, and whether it is a replay of an earlier response
+
+        :raises: errors.InvalidParamError: if the key was already used for a different request
+        """
+        stored = await self._get(key)
+        if stored is not None:
+            stored_fingerprint, body = stored
+            self._check_fingerprint(stored_fingerprint, fingerprint)
+            return 200, body, True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            in_flight_fingerprint, task = in_flight
+            self._check_fingerprint(in_flight_fingerprint, fingerprint)
+            replayed = True
+        else:
+            task = asyncio.ensure_future(handler())
+            self._in_flight[key] = (fingerprint, task)
+            # Added before anyone awaits the task, so the response is stored before it is returned
+            task.add_done_callback(lambda task: self._on_done(key, fingerprint, task))
+            replayed = False
+
+        # A cancelled request (for example, the client disconnected) doesn't cancel the handler
+        response = await asyncio.shield(task)
+        return response.status, response.body, replayed
+
+    def _on_done(self, key: str, fingerprint: str, task: asyncio.Future) -> None:
+        del self._in_flight[key]
+        if task.cancelled():
+            return
+        # Also marks the exception as retrieved, when no request is left waiting for it
+        if task.exception() is None and task.result().status == 200:
+            self._set(key, fingerprint, task.result().body)
+
+    def close(self) -> None:
+        """Close the database, after the responses that are still waiting are written"""
+        if self._db is not None:
+            self._executor.submit(self._db.close).result()
+            self._executor.shutdown()
+
+    async def _get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        cached = self._completed.get(key)
+        if cached is not None:
+            return cached[0]
+        # A key that is being handled right now can't be on the disk
+        if self._db is None or key in self._in_flight:
+            return None
+
+        def select():
+            return self._db.execute('SELECT fingerprint, body FROM idempotency WHERE key = ? AND created_at >= ?',
+                                    (key, time.time() - self.ttl)).fetchone()
+
+        # Reads are queued after the writes, so a response that is still being written is found
+        row = await asyncio.get_event_loop().run_in_executor(self._executor, select)
+        if row is None:
+            # The key might have been handled while reading
+            cached = self._completed.get(key)
+            return None if cached is None else cached[0]
+        self._completed.set(key, (row[0], row[1]))
+        return row[0], row[1]
+
+    def _set(self, key: str, fingerprint: str, body: bytes) -> None:
+        self._completed.set(key, (fingerprint, body))
+        if self._db is not None:
+            # Dont hold up the response, the memory is enough until the write is done
+            self._executor.submit(self._write, 'INSERT OR REPLACE INTO idempotency '
+                                               '(key, fingerprint, body, created_at) VALUES (?, ?, ?, ?)',
+                                  (key, fingerprint, body, time.time()))
+
+    def _write(self, sql: str, params: tuple) -> None:
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except Exception as e:
+            logger.error(f'Failed to write to the idempotency store:\n{prettify_exc(e)}')
+
+    @staticmethod
+    def _check_fingerprint(stored_fingerprint: str, fingerprint: str) -> None:
+        if stored_fingerprint != fingerprint:
+            raise errors.InvalidParamError(f'The {IDEMPOTENCY_HEADER} was already used for a different request')
+
+
+def idempotent(app: Sanic):
+    """Run the route once per idempotency key, if the request has one"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return await func(request, *args, **kwargs)
+            if not 0 < len(key) <= MAX_KEY_LENGTH:
+                raise errors.InvalidParamError(f'The {IDEMPOTENCY_HEADER} must be between 1 and '
+                                               f'{MAX_KEY_LENGTH} characters long')
+
+            # The same key can be used for different routes
+            status, body, replayed = await app.idempotency_store.run(f'{request.path}:{key}',
+                                                                     sha256(request.body).hexdigest(),
+                                                                     lambda: func(request, *args, **kwargs))
+            response = raw_json_response(body, status)
+            if replayed:
+                response.headers[REPLAYED_HEADER] = 'true'
+            return response
+
+        return wrapper
+    return decorator
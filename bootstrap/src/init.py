@@ -7,17 +7,22 @@ from .log import init_logging
 from .config import Settings
 from .routes import init_routes
 from .middlewares import init_middlewares
+from .workers import Worker
+
+from typing import Optional
 
 VERSION = '1.0.0'
 
 
-def init_app(config: Settings) -> Sanic:
+def init_app(config: Settings, worker: Optional[Worker] = None) -> Sanic:
     # Setup logging
-    init_logging()
+    init_logging(config.LOG_FORMAT)
     logger = logging.getLogger('bootstrap')
     logger.setLevel(config.LOG_LEVEL)
 
     app = Sanic(__name__)
+    # The worker process this app runs in, if running in multi-worker mode
+    app.worker = worker
 
     init_routes(app, VERSION)
     init_middlewares(app, config)
@@ -0,0 +1,188 @@
+"""Contains the journal that keeps a local record of everything the server sent"""
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from kin import KinErrors
+from kin_base import Builder
+from kin_base.memo import TextMemo
+from kin_base.operation import Payment, CreateAccount
+from kin.blockchain.errors import HorizonErrorType, TransactionResultCode
+
+from .helpers import prettify_exc
+
+from typing import List, Optional
+
+logger = logging.getLogger('bootstrap')
+
+RESULT_SUCCESS = 'success'
+
+COLUMNS = ('created_at', 'kind', 'source', 'destination', 'amount', 'memo',
+           'tx_id', 'channel', 'latency', 'result', 'request')
+
+
+class JournalKinds:
+    """Contains the kinds of journal entries"""
+    PAYMENT = 'payment'
+    CREATION = 'creation'
+    WHITELIST = 'whitelist'
+
+
+def get_result(error: Optional[Exception], op_count: int) -> List[str]:
+    """Get the result of each operation in a transaction, based on the error it failed with"""
+    if error is None:
+        return [RESULT_SUCCESS] * op_count
+    if isinstance(error, KinErrors.HorizonError) and error.type == HorizonErrorType.TRANSACTION_FAILED:
+        result_codes = error.extras['result_codes']
+        if result_codes['transaction'] == TransactionResultCode.FAILED \
+                and len(result_codes.get('operations', [])) == op_count:
+            return result_codes['operations']
+        return [result_codes['transaction']] * op_count
+    return [type(error).__name__] * op_count
+
+
+class Journal:
+    """
+    An append-only record of the transactions the server sent, stored in sqlite
+
+    Entries are queued and written in batches by a background task on a separate thread,
+    so recording an entry never blocks on the disk.
+    If the writer can't keep up and the queue is full, new entries are dropped.
+    """
+
+    def __init__(self, path: str, queue_size: int, batch_size: int):
+        """
+        :param path: The path of the sqlite database file, created if it doesn't exist
+        :param queue_size: The maximum number of entries waiting to be written
+        :param batch_size: The maximum number of entries to write at once
+        """
+        self.batch_size = batch_size
+        self._queue = asyncio.Queue(queue_size)
+        self._task = None
+        # sqlite connections should be used from a single thread
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS journal '
+                         '(id INTEGER PRIMARY KEY, created_at REAL NOT NULL, kind TEXT NOT NULL, '
+                         'source TEXT, destination TEXT, amount REAL, memo TEXT, tx_id TEXT, channel TEXT, '
+                         'latency REAL, result TEXT NOT NULL, request TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS journal_created_at ON journal (created_at)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS journal_destination ON journal (destination, created_at)')
+        self._db.commit()
+
+        # Metrics
+        self.dropped_entries = 0
+
+    def start(self) -> None:
+        """Start the background task that writes the entries"""
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Write the entries that are still waiting, and stop the background task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while not self._queue.empty():
+            await self._write(self._get_batch())
+
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown()
+
+    def record_transaction(self, builder: Builder, source: str, tx_id: Optional[str], latency: float,
+                           error: Optional[Exception], requests: Optional[List[Optional[dict]]] = None) -> None:
+        """
+        Record each of the payments and creations in a transaction that was submitted
+
+        :param builder: The builder of the transaction, its address is the channel that was used
+        :param source: The account the operations were sent from, unless they have their own source
+        :param tx_id: The hash of the transaction
+        :param latency: How long (in seconds) it took to send the transaction
+        :param error: The error the transaction failed with, if any
+        :param requests: The request each operation was sent for, if it was sent for a client
+        """
+        memo = builder.memo.text.decode() if isinstance(builder.memo, TextMemo) else None
+        requests = requests or [None] * len(builder.ops)
+        for operation, result, request in zip(builder.ops, get_result(error, len(builder.ops)), requests):
+            if isinstance(operation, Payment):
+                kind, amount = JournalKinds.PAYMENT, float(operation.amount)
+            elif isinstance(operation, CreateAccount):
+                kind, amount = JournalKinds.CREATION, float(operation.starting_balance)
+            else:
+                continue
+            self._record(kind, operation.source or source, operation.destination, amount, memo,
+                         tx_id, builder.address, latency, result, None if request is None else json.dumps(request))
+
+    def record_whitelist(self, request: dict, latency: float, error: Optional[Exception]) -> None:
+        """Record a transaction that was whitelisted"""
+        result = RESULT_SUCCESS if error is None else type(error).__name__
+        self._record(JournalKinds.WHITELIST, None, None, None, None, None, None, latency, result,
+                     json.dumps(request))
+
+    async def query(self, since: Optional[float], destination: Optional[str], limit: int) -> List[dict]:
+        """
+        Get entries from the journal, oldest first
+
+        :param since: Only get entries recorded at or after this unix timestamp
+        :param destination: Only get entries sent to this address
+        :param limit: The maximum number of entries to get
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if destination is not None:
+            conditions.append('destination = ?')
+            params.append(destination)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        sql = f'SELECT {", ".join(COLUMNS)} FROM journal {where} ORDER BY created_at, id LIMIT ?'
+
+        def select():
+            return [dict(row) for row in self._db.execute(sql, (*params, limit))]
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, select)
+
+    def _record(self, *row) -> None:
+        try:
+            self._queue.put_nowait((time.time(), *row))
+        except asyncio.QueueFull:
+            self.dropped_entries += 1
+            logger.warning('The journal queue is full, dropping an entry')
+
+    def _get_batch(self, *entries) -> list:
+        """Take the entries that are waiting, up to the batch size including the given entries"""
+        batch = list(entries)
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: list) -> None:
+        def insert():
+            self._db.executemany(f'INSERT INTO journal ({", ".join(COLUMNS)}) '
+                                 f'VALUES ({", ".join("?" * len(COLUMNS))})', batch)
+            self._db.commit()
+
+        await asyncio.get_event_loop().run_in_executor(self._executor, insert)
+
+    async def _run(self) -> None:
+        while True:
+            # Wait for an entry, and then write it with all of the others that are waiting
+            entry = await self._queue.get()
+            batch = self._get_batch(entry)
+            try:
+                await self._write(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'Failed to write {len(batch)} entries to the journal:\n'
+                             f'{prettify_exc(e)}')
@@ -1,9 +1,29 @@
+import queue
+import atexit
 import logging
 from uuid import uuid4
 from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from .serialization import dumps
 
 req_id: ContextVar[str] = ContextVar('req_id', default=None)
 
+TEXT_FORMAT = '%(asctime)s | %(levelname)s | request_id=%(req_id)s | %(message)s'
+
+
+class LogFormats:
+    """Contains the supported log formats"""
+    TEXT = 'text'
+    JSON = 'json'
+
+
+class LogBodies:
+    """Contains the options for logging request and response bodies"""
+    FULL = 'full'
+    TRUNCATED = 'truncated'
+    OFF = 'off'
+
 
 def req_id_generator() -> str:
     """Generate a unique 8 characters long string to be used as a request id"""
@@ -16,11 +36,68 @@ def request_id_filter(record):
     return record
 
 
-def init_logging():
+def format_body(body: bytes, max_length: int = 0) -> str:
+    """Get a printable request/response body, truncated to 'max_length' characters if it is set"""
+    if max_length and len(body) > max_length:
+        return f'{body[:max_length].decode(errors="replace")}... ({len(body)} bytes)'
+    return body.decode(errors='replace')
+
+
+class TextFormatter(logging.Formatter):
+    """The human readable format, with the structured fields of a record (passed as extra={'fields': ...}) appended"""
+
+    def __init__(self):
+        super(TextFormatter, self).__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super(TextFormatter, self).format(record)
+        fields = getattr(record, 'fields', None)
+        if not fields:
+            return message
+        return message + ''.join(f'\n{name}: {value}' for name, value in fields.items())
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as a single line of json, with the structured fields of the record at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': record.created,
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'request_id': getattr(record, 'req_id', None),
+                 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return dumps(entry).decode()
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Pass records to a listener thread in the same process
+
+    Unlike QueueHandler, the records are not formatted before they are queued,
+    so both the formatting and the writing happen off the event loop.
+    The request id is still injected by the handler's filter, on the thread that logged the record.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def init_logging(log_format: str = LogFormats.TEXT):
     handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter('%(asctime)s | %(levelname)s | request_id=%(req_id)s | %(message)s'))
-    handler.addFilter(request_id_filter)
-    logging.root.addHandler(handler)
+    handler.setFormatter(JsonFormatter() if log_format == LogFormats.JSON else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    queue_handler.addFilter(request_id_filter)
+    logging.root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    # Write the records that are still queued when the server exits
+    atexit.register(listener.stop)
 
     # Suppress warnings from the kin-sdk
     kin_logger = logging.getLogger('kin')
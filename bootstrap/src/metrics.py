@@ -0,0 +1,199 @@
+"""Contains the metrics exposed on /metrics, in the prometheus text format"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from sanic import Sanic
+
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets (in seconds), from a cached response to a transaction that waited for a ledger
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(label_names: Iterable[str], labels: Iterable[str]) -> str:
+    pairs = ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(label_names, labels))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A value that only goes up, for each combination of labels
+
+    All updates happen on the event loop, so a plain dictionary is enough and no locks are needed.
+    """
+
+    def __init__(self, name: str, description: str, label_names: Labels = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self._values.items():
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+class Histogram:
+    """
+    The distribution of observed values in fixed buckets, for each combination of labels
+
+    Each observation only increments its own bucket, the cumulative counts are computed when rendering.
+    """
+
+    def __init__(self, name: str, description: str, label_names: Labels = (), buckets: Tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # The counts of each bucket (and one for values above the last bucket), and the sum of the values
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe how long (in seconds) the block took, whether it succeeded or not"""
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start_time, *labels)
+
+    def get_count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return 0 if entry is None else sum(entry[0])
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        label_names = self.label_names + ('le',)
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(label_names, labels + (_format_value(bucket),))} ' \
+                      f'{cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total[0])}'
+            yield f'{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}'
+
+
+class Collected:
+    """Metrics that are read from the server's state when they are rendered, instead of being updated"""
+
+    def __init__(self, name: str, description: str, metric_type: str, label_names: Labels,
+                 collect: Callable[[], Iterable[Tuple[Labels, float]]]):
+        """
+        :param metric_type: 'gauge' or 'counter'
+        :param collect: Returns the labels and the value of each sample
+        """
+        self.name = name
+        self.description = description
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} {self.metric_type}'
+        for labels, value in self.collect():
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+def _hit_ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0
+
+
+class Metrics:
+    """All of the server's metrics"""
+
+    def __init__(self, app: Sanic):
+        """:param app: The app, used to read the state of the channels and caches when rendering"""
+        self.request_latency = Histogram('bootstrap_request_duration_seconds',
+                                         'How long it took to handle requests', ('route', 'method', 'status'))
+        self.horizon_latency = Histogram('bootstrap_horizon_call_duration_seconds',
+                                         'How long calls to horizon took', ('method',))
+        self.errors = Counter('bootstrap_errors_total', 'Errors returned to clients', ('code',))
+
+        def collect_channels():
+            status = app.channel_scheduler.get_status()
+            return [(('free',), status['free_channels']),
+                    (('taken',), status['non_free_channels'] - status['resting_channels']),
+                    (('resting',), status['resting_channels'])]
+
+        def collect_caches():
+            return [(('balance',), app.balance_cache.hits, app.balance_cache.misses),
+                    (('transaction',), app.tx_cache.hits, app.tx_cache.misses),
+                    (('whitelist',), app.whitelist_cache.hits, app.whitelist_cache.misses)]
+
+        self._collected = [
+            Collected('bootstrap_channels', 'Channels in the pool, by state', 'gauge', ('state',), collect_channels),
+            Collected('bootstrap_channel_waiting_requests', 'Requests waiting for a free channel', 'gauge', (),
+                      lambda: [((), app.channel_scheduler.get_status()['waiting_requests'])]),
+            Collected('bootstrap_channel_average_wait_seconds', 'Average time requests waited for a channel',
+                      'gauge', (), lambda: [((), app.channel_scheduler.get_status()['average_wait_time'])]),
+            Collected('bootstrap_channel_rejected_requests_total',
+                      'Requests rejected because no channel was free in time', 'counter', (),
+                      lambda: [((), app.channel_scheduler.get_status()['rejected_requests'])]),
+            Collected('bootstrap_submit_retries_total', 'Retries of transaction submissions, by reason', 'counter',
+                      ('reason',), lambda: [((reason,), count)
+                                            for reason, count in app.kin_account.retry_policy.retries.items()]),
+            Collected('bootstrap_submit_retry_outcomes_total', 'Transaction submissions that were retried, by outcome',
+                      'counter', ('outcome',),
+                      lambda: [((outcome,), count)
+                               for outcome, count in app.kin_account.retry_policy.outcomes.items()]),
+            Collected('bootstrap_fee', 'The fee paid for transactions, in quarks', 'gauge', (),
+                      lambda: [((), app.fee_manager.fee)]),
+            Collected('bootstrap_ledger_capacity_usage', 'Ratio of the capacity of the latest ledgers that was used',
+                      'gauge', (), lambda: [((), app.fee_manager.capacity_usage)]),
+            Collected('bootstrap_horizon_node_available', 'Whether requests are sent to a horizon node (1) or '
+                      'it is resting after failing (0)', 'gauge', ('node',),
+                      lambda: [((node['uri'],), int(node['available']))
+                               for node in app.kin_client.horizon.get_status()]),
+            Collected('bootstrap_horizon_node_latency_seconds', 'Average latency of a horizon node', 'gauge',
+                      ('node',), lambda: [((node['uri'],), node['latency'])
+                                          for node in app.kin_client.horizon.get_status()
+                                          if node['latency'] is not None]),
+            Collected('bootstrap_cache_hits_total', 'Cache lookups that found an entry', 'counter', ('cache',),
+                      lambda: [(labels, hits) for labels, hits, _ in collect_caches()]),
+            Collected('bootstrap_cache_misses_total', 'Cache lookups that did not find an entry', 'counter',
+                      ('cache',), lambda: [(labels, misses) for labels, _, misses in collect_caches()]),
+            Collected('bootstrap_cache_hit_ratio', 'Ratio of cache lookups that found an entry', 'gauge',
+                      ('cache',), lambda: [(labels, _hit_ratio(hits, misses))
+                                           for labels, hits, misses in collect_caches()]),
+        ]
+
+    def render(self) -> str:
+        """Render all of the metrics in the prometheus text format"""
+        lines = []
+        for metric in [self.request_latency, self.horizon_latency, self.errors] + self._collected:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -1,32 +1,65 @@
 """Contains middlewares and error handlers"""
 
 import time
+import random
+import asyncio
 import logging
 from contextvars import ContextVar
 
-import kin
-from kin.utils import create_channels, get_hd_channels
 from sanic import Sanic
 from sanic.exceptions import SanicException
+from sanic.response import HTTPResponse
 
 from . import errors
+from .fees import FeeManager
 from .helpers import json_response, prettify_exc
-from .log import req_id, req_id_generator
+from .account import BootstrapAccount
+from .batching import PaymentBatcher
+from .cache import TTLCache, TransactionCache, WhitelistCache
+from .channels import ChannelScheduler
+from .horizon import create_kin_client
+from .idempotency import IdempotencyStore
+from .journal import Journal
+from .metrics import Metrics
+from .retries import RetryPolicy
+from .tracing import Tracer, FileSpanExporter, current_span
+from .scaling import ChannelScaler, bootstrap_channels
+from .streaming import PaymentStreamHub
+from .whitelist import WhitelistSigner
+from .workers import STATS_PUBLISH_INTERVAL, get_first_channel
+from .log import LogBodies, req_id, req_id_generator, format_body
 
 req_start_time: ContextVar[int] = ContextVar('req_start_time', default=None)
+req_log_bodies: ContextVar[bool] = ContextVar('req_log_bodies', default=False)
 
 logger = logging.getLogger('bootstrap')
 
+# How long to wait before trying to set up the channels again
+BOOTSTRAP_RETRY_INTERVAL = 5
+
 
 def init_middlewares(app: Sanic, config):
 
+    def get_body_max_length() -> int:
+        return config.LOG_BODY_MAX_LENGTH if config.LOG_BODIES == LogBodies.TRUNCATED else 0
+
     @app.middleware('request')
     async def before_request(request):
         """Set context variables for this request"""
         req_start_time.set(time.time())
         req_id.set(req_id_generator())
-        logger.info(f'Got request {request.method} {request.path},\n'
-                    f'body: {request.body.decode()}')
+        # Errors and slow requests get their bodies logged when they finish, even if they were not sampled
+        sampled = config.LOG_BODIES != LogBodies.OFF and random.random() * 100 < config.LOG_BODY_SAMPLE_RATE
+        req_log_bodies.set(sampled)
+        if app.tracer is not None:
+            app.tracer.start_trace(f'{request.method} {request.path}',
+                                   {'bootstrap.request_id': req_id.get(), 'http.method': request.method,
+                                    'http.target': request.path})
+
+        fields = {'method': request.method, 'path': request.path}
+        if sampled:
+            fields['body'] = format_body(request.body, get_body_max_length())
+        logger.info(f'Got request {request.method} {request.path}', extra={'fields': fields})
 
     @app.middleware('response')
     async def before_response(request, response):
@@ -36,57 +69,213 @@ def init_middlewares(app: Sanic, config):
         except:
             # Shouldn't really happen, but lets not return 500 cause of this
             logger.error("Cannot determine response time for request")
-        else:
-            logger.info(f'Finished handling request after: {response_time} seconds')
+            response_time = None
+
+        if response_time is not None:
+            # Requests that didn't match a route are grouped together, so random paths don't add series
+            app.metrics.request_latency.observe(response_time, request.uri_template or 'unmatched',
+                                                request.method, str(response.status))
+
+        slow = response_time is not None and response_time >= config.LOG_SLOW_REQUEST_TIME
+        failed = response.status >= 400
+        fields = {'method': request.method, 'path': request.path, 'status': response.status,
+                  'response_time': response_time}
+
+        sampled = req_log_bodies.get()
+        if config.LOG_BODIES != LogBodies.OFF and (sampled or slow or failed):
+            if not sampled:
+                # The request body was not logged when the request started
+                fields['request_body'] = format_body(request.body, get_body_max_length())
+            # Streaming responses are written after this, so there is no body to log
+            fields['response_body'] = format_body(response.body, get_body_max_length()) \
+                if isinstance(response, HTTPResponse) else '<streamed>'
 
-        logger.info(f'Response: body: {response.body.decode()}\n'
-                    f'status: {response.status}')
+        logger.log(logging.WARNING if slow else logging.INFO,
+                   f'Finished handling request after: {response_time} seconds', extra={'fields': fields})
+
+        span = current_span.get()
+        if span is not None and span.parent_id is None:
+            # Name the trace after the route and not the path, so traces of the same route can be grouped
+            span.name = f'{request.method} {request.uri_template or request.path}'
+            span.set_attribute('http.status_code', response.status)
+            if response.status >= 500:
+                span.set_error(f'Status {response.status}')
+            span.end()
+            current_span.set(None)
 
     @app.listener('before_server_start')
     async def setup_kin(app, loop):
+        # A config error would otherwise only fail the channel setup, which keeps retrying in the background
+        if config.CHANNEL_COUNT > config.CHANNEL_MAX_COUNT:
+            raise ValueError(f'CHANNEL_COUNT ({config.CHANNEL_COUNT}) can\'t be more than '
+                             f'CHANNEL_MAX_COUNT ({config.CHANNEL_MAX_COUNT})')
 
         # Setup kin client
-        kin_env = kin.Environment('CUSTOM', config.HORIZON_ENDPOINT, config.NETWORK_PASSPHRASE)
-        app.kin_client = kin.KinClient(kin_env)
+        app.kin_client = create_kin_client(config)
+        app.fee_manager = FeeManager(app.kin_client, config.FEE_POLICY, config.FEE_FIXED,
+                                     surge_threshold=config.FEE_SURGE_THRESHOLD,
+                                     surge_multiplier=config.FEE_SURGE_MULTIPLIER,
+                                     max_fee=config.FEE_MAX)
 
-        # Create channels
-        if config.CHANNEL_COUNT > 0:
-            logger.info(f'Setting up {config.CHANNEL_COUNT} channels')
-            channels = get_hd_channels(config.SEED, config.CHANNEL_SALT, config.CHANNEL_COUNT)
-        else:
-            channels = None
+        # The base account is the only channel until the channels are ready.
+        # Workers share the base account, so they have no channels until their own channels are ready.
+        app.channel_scheduler = ChannelScheduler([config.SEED] if app.worker is None else [],
+                                                 max_waiters=config.CHANNEL_WAIT_QUEUE_SIZE,
+                                                 wait_timeout=config.CHANNEL_WAIT_TIMEOUT,
+                                                 failure_threshold=config.CHANNEL_FAILURE_THRESHOLD,
+                                                 rest_time=config.CHANNEL_REST_TIME)
+        app.journal = Journal(config.JOURNAL_PATH, config.JOURNAL_QUEUE_SIZE, config.JOURNAL_BATCH_SIZE) \
+            if config.JOURNAL_PATH else None
+        app.kin_account = BootstrapAccount(config.SEED, app.kin_client, app.channel_scheduler, config.APP_ID,
+                                           app.journal,
+                                           RetryPolicy(config.SUBMIT_MAX_RETRIES, config.SUBMIT_RETRY_BACKOFF,
+                                                       config.SUBMIT_RETRY_DEADLINE))
+        app.whitelist_cache = WhitelistCache(config.WHITELIST_CACHE_SIZE)
+        app.whitelist_signer = WhitelistSigner(config.SEED, config.NETWORK_PASSPHRASE, config.WHITELIST_EXECUTOR,
+                                               config.WHITELIST_POOL_SIZE, app.whitelist_cache)
+        app.channel_scaler = ChannelScaler(app, config.SEED, config.CHANNEL_SALT, config.CHANNEL_STARTING_BALANCE,
+                                           channel_count=0,
+                                           max_channels=config.CHANNEL_MAX_COUNT,
+                                           lookup_concurrency=config.CHANNEL_LOOKUP_CONCURRENCY,
+                                           first_channel=0 if app.worker is None else
+                                           get_first_channel(app.worker.index, config.CHANNEL_MAX_COUNT),
+                                           use_master_seed=app.worker is None)
+        app.ready = False
+        app.stats_task = None
+        app.bootstrap_task = None
 
-        app.kin_account = app.kin_client.kin_account(config.SEED,
-                                                     channel_secret_keys=channels,
-                                                     app_id=config.APP_ID)
+        app.balance_cache = TTLCache(config.BALANCE_CACHE_SIZE, config.BALANCE_CACHE_TTL)
+        app.tx_cache = TransactionCache(config.TX_CACHE_SIZE, config.TX_NOT_FOUND_CACHE_TTL, config.TX_CACHE_PATH)
+        app.bulk_lookup_concurrency = config.BULK_LOOKUP_CONCURRENCY
+        app.payment_stream_hub = PaymentStreamHub(app.kin_client, config.STREAM_QUEUE_SIZE,
+                                                  config.STREAM_MAX_SUBSCRIBERS)
+        app.stream_heartbeat_interval = config.STREAM_HEARTBEAT_INTERVAL
+        app.idempotency_store = IdempotencyStore(config.IDEMPOTENCY_STORE_SIZE, config.IDEMPOTENCY_KEY_TTL,
+                                                 config.IDEMPOTENCY_STORE_PATH)
+        app.metrics = Metrics(app)
+        app.tracer = Tracer(FileSpanExporter(config.TRACING_PATH), config.TRACING_SAMPLE_RATE) \
+            if config.TRACING_PATH else None
 
     @app.listener('before_server_start')
     async def setup_kin_with_network(app, loop):
         """This method is separate from "setup_kin" cause it makes network calls that we want to mock"""
-        app.minimum_fee = await app.kin_client.get_minimum_fee()
 
-        # Create channels
-        if config.CHANNEL_COUNT > 0:
-            await create_channels(config.SEED,
-                                  app.kin_client.environment,
-                                  config.CHANNEL_COUNT,
-                                  config.CHANNEL_STARTING_BALANCE,
-                                  config.CHANNEL_SALT)
+        async def bootstrap():
+            logger.info(f'Setting up {config.CHANNEL_COUNT} channels')
+            while True:
+                try:
+                    # In multi-worker mode, the main process creates the channels for all of the workers
+                    await bootstrap_channels(app, config.CHANNEL_COUNT, create_missing=app.worker is None)
+                    break
+                except errors.NotReadyError:
+                    logger.info(f'Waiting for the channels to be created, checking again in '
+                                f'{BOOTSTRAP_RETRY_INTERVAL} seconds')
+                    await asyncio.sleep(BOOTSTRAP_RETRY_INTERVAL)
+                except Exception as e:
+                    logger.error(f'Failed to set up the channels, retrying in {BOOTSTRAP_RETRY_INTERVAL} seconds:\n'
+                                 f'{prettify_exc(e)}')
+                    await asyncio.sleep(BOOTSTRAP_RETRY_INTERVAL)
+
+            app.ready = True
+            logger.info('Ready to handle requests')
+
+        # Dont block the server from starting, /ready will report when we are done
+        app.bootstrap_task = loop.create_task(bootstrap())
+
+    @app.listener('after_server_start')
+    async def start_payment_batcher(app, loop):
+        """Start coalescing concurrent payments, if enabled"""
+        app.payment_batcher = None
+        if config.PAYMENT_BATCHING:
+            logger.info(f'Batching up to {config.PAYMENT_BATCH_SIZE} payments '
+                        f'every {config.PAYMENT_BATCH_WAIT_MS}ms')
+            app.payment_batcher = PaymentBatcher(app, config.PAYMENT_BATCH_SIZE,
+                                                 config.PAYMENT_BATCH_WAIT_MS / 1000)
+            app.payment_batcher.start()
+
+    @app.listener('after_server_start')
+    async def start_journal(app, loop):
+        """Start writing the journal in the background, if enabled"""
+        if app.journal is not None:
+            logger.info(f'Recording transactions in the journal at {config.JOURNAL_PATH}')
+            app.journal.start()
+
+    @app.listener('after_server_start')
+    async def start_channel_autoscaling(app, loop):
+        """Grow the channel pool when it is saturated, if enabled"""
+        if config.CHANNEL_AUTOSCALE:
+            logger.info(f'Autoscaling channels up to {config.CHANNEL_MAX_COUNT} channels')
+            app.channel_scaler.start_autoscaling(config.CHANNEL_AUTOSCALE_INTERVAL, config.CHANNEL_AUTOSCALE_STEP)
+
+    @app.listener('after_server_start')
+    async def start_fee_refresher(app, loop):
+        """Keep the fee up to date with the network"""
+        app.fee_manager.start(config.FEE_REFRESH_INTERVAL)
+
+    @app.listener('before_server_stop')
+    async def stop_channel_autoscaling(app, loop):
+        await app.channel_scaler.stop()
+
+    @app.listener('before_server_stop')
+    async def stop_fee_refresher(app, loop):
+        await app.fee_manager.stop()
+
+    @app.listener('before_server_stop')
+    async def stop_journal(app, loop):
+        if app.journal is not None:
+            await app.journal.stop()
+
+    # Listeners of before_server_stop run in reverse order, so the batcher finishes sending before the journal stops
+    @app.listener('before_server_stop')
+    async def stop_payment_batcher(app, loop):
+        if app.payment_batcher is not None:
+            await app.payment_batcher.stop()
+
+    @app.listener('before_server_stop')
+    async def stop_payment_stream(app, loop):
+        app.payment_stream_hub.stop()
+
+    @app.listener('after_server_start')
+    async def start_worker_stats(app, loop):
+        """Share the channel stats with the other workers, in multi-worker mode"""
+        if app.worker is None:
+            return
+
+        async def publish_stats():
+            while True:
+                app.worker.stats.publish(app.worker.index, app.channel_scheduler.get_status())
+                await asyncio.sleep(STATS_PUBLISH_INTERVAL)
+
+        app.stats_task = loop.create_task(publish_stats())
+
+    @app.listener('before_server_stop')
+    async def stop_bootstrap(app, loop):
+        if app.bootstrap_task is not None:
+            app.bootstrap_task.cancel()
+        if app.stats_task is not None:
+            app.stats_task.cancel()
 
     @app.middleware('after_server_stop')
     async def close_kin_client(app, loop):
         """Close the kin client"""
         await app.kin_client.close()
+        app.tx_cache.close()
+        app.idempotency_store.close()
+        app.whitelist_signer.close()
+        if app.tracer is not None:
+            app.tracer.exporter.stop()
 
     @app.exception(errors.BootstrapError)
     def bootstrap_error_handle(request, exception: errors.BootstrapError):
         # If it is one of our custom errors, log it
         logger.error(exception.error)
+        app.metrics.errors.inc(str(exception.code))
         return json_response(exception.to_dict(), exception.http_code)
 
     @app.exception(SanicException)
     def http_error_handler(request, exception: SanicException):
         logger.error(f'Http exception: {repr(exception)}')
+        app.metrics.errors.inc(str(exception.status_code))
         return json_response({'code': exception.status_code, 'message': str(exception)},
                              exception.status_code)
 
@@ -95,4 +284,5 @@ def init_middlewares(app: Sanic, config):
         # Log the exception and return an internal server error
         logger.error(f'Unexpected exception:\n'
                      f'{prettify_exc(exception)}')
+        app.metrics.errors.inc(str(errors.InternalError.code))
         return json_response(errors.InternalError().to_dict(), errors.InternalError.code)
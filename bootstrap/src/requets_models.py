@@ -1,14 +1,26 @@
 """Contains all models for the bootstrap server's requests"""
-import json
-
 from kin.config import MEMO_CAP
-from kin.blockchain.utils import is_valid_address, is_valid_transaction_hash
 from pydantic import BaseModel, Extra, validator
 from pydantic import ValidationError
+from pydantic.fields import Shape
 
 from . import errors
+from .serialization import loads
+from .validation import is_valid_address, is_valid_transaction_hash, find_invalid_address, \
+    find_invalid_transaction_hash
+
+from typing import Any, Callable, Dict, Optional, List, Union
 
-from typing import Optional
+# Upper limit for the number of payments that can be sent in a single batch request
+MAX_BATCH_PAYMENTS = 1000
+# Upper limit for the number of transactions that can be whitelisted in a single batch request
+MAX_BATCH_WHITELISTS = 1000
+# Upper limit for the number of items that can be looked up in a single bulk request
+MAX_BULK_LOOKUPS = 10000
+# Upper limit for the number of addresses a single client can subscribe to
+MAX_STREAM_ADDRESSES = 1000
+# Upper limit for the number of journal entries returned in a single request
+MAX_JOURNAL_ENTRIES = 1000
 
 
 class BaseRequest(BaseModel):
@@ -28,14 +40,24 @@ class BaseRequest(BaseModel):
             raise errors.translate_validation_error(e)
 
     @classmethod
-    def from_json(cls, json_string):
+    def from_json(cls, json_string: Union[bytes, str]):
         try:
-            body_dict = json.loads(json_string)
-        except json.JSONDecodeError:
+            body_dict = loads(json_string)
+        except ValueError:  # Also raised for bytes that are not valid utf-8
             raise errors.InvalidBodyError()
         if not isinstance(body_dict, dict):
             # json.loads might return string in some cases like json.loads('"{}"')
             raise errors.InvalidBodyError()
+        return cls.from_dict(body_dict)
+
+    @classmethod
+    def from_dict(cls, body_dict: dict):
+        """Init the model, using its precompiled parser if it has one and the body is simple enough for it"""
+        fast_parser = FAST_PARSERS.get(cls)
+        if fast_parser is not None:
+            model = fast_parser(body_dict)
+            if model is not None:
+                return model
         return cls(**body_dict)
 
 
@@ -64,6 +86,40 @@ class PaymentRequest(BaseRequest):
         raise errors.InvalidParamError(f"Memo: '{value}' is longer than {MEMO_CAP}")
 
 
+class BatchPaymentItem(BaseRequest):
+    destination: str
+    amount: float
+
+    @validator('destination')
+    def validate_destination(cls, value):
+        if is_valid_address(value):
+            return value
+        raise errors.InvalidParamError(f"Destination '{value}' is not a valid public address")
+
+    @validator('amount')
+    def validate_amount(cls, value):
+        if value > 0:
+            return value
+        raise errors.InvalidParamError('Amount for payment must be bigger than 0')
+
+
+class BatchPaymentRequest(BaseRequest):
+    payments: List[BatchPaymentItem]
+    memo: Optional[str]
+
+    @validator('payments', whole=True)
+    def validate_payments(cls, value):
+        if 0 < len(value) <= MAX_BATCH_PAYMENTS:
+            return value
+        raise errors.InvalidParamError(f'A batch must contain between 1 and {MAX_BATCH_PAYMENTS} payments')
+
+    @validator('memo')
+    def validate_memo(cls, value):
+        if value is None or len(value) <= MEMO_CAP:
+            return value
+        raise errors.InvalidParamError(f"Memo: '{value}' is longer than {MEMO_CAP}")
+
+
 class CreationRequest(BaseRequest):
     destination: str
     starting_balance: float
@@ -93,6 +149,26 @@ class WhitelistRequest(BaseRequest):
     network_id: str
 
 
+class BatchWhitelistRequest(BaseRequest):
+    transactions: List[WhitelistRequest]
+
+    @validator('transactions', whole=True)
+    def validate_transactions(cls, value):
+        if 0 < len(value) <= MAX_BATCH_WHITELISTS:
+            return value
+        raise errors.InvalidParamError(f'A batch must contain between 1 and {MAX_BATCH_WHITELISTS} transactions')
+
+
+class ChannelScaleRequest(BaseRequest):
+    channel_count: int
+
+    @validator('channel_count')
+    def validate_channel_count(cls, value):
+        if value >= 0:
+            return value
+        raise errors.InvalidParamError('Channel count must not be negative')
+
+
 class BalanceRequest(BaseRequest):
     address: str
 
@@ -103,6 +179,32 @@ class BalanceRequest(BaseRequest):
         raise errors.InvalidParamError(f"Address '{value}' is not a valid public address")
 
 
+class BulkBalanceRequest(BaseRequest):
+    addresses: List[str]
+
+    @validator('addresses', whole=True)
+    def validate_addresses(cls, value):
+        if not 0 < len(value) <= MAX_BULK_LOOKUPS:
+            raise errors.InvalidParamError(f'A bulk request must contain between 1 and {MAX_BULK_LOOKUPS} addresses')
+        invalid_address = find_invalid_address(value)
+        if invalid_address is not None:
+            raise errors.InvalidParamError(f"Address '{invalid_address}' is not a valid public address")
+        return value
+
+
+class PaymentStreamRequest(BaseRequest):
+    addresses: List[str]
+
+    @validator('addresses', whole=True)
+    def validate_addresses(cls, value):
+        if not 0 < len(value) <= MAX_STREAM_ADDRESSES:
+            raise errors.InvalidParamError(f'Must subscribe to between 1 and {MAX_STREAM_ADDRESSES} addresses')
+        invalid_address = find_invalid_address(value)
+        if invalid_address is not None:
+            raise errors.InvalidParamError(f"Address '{invalid_address}' is not a valid public address")
+        return value
+
+
 class TransactionInfoRequest(BaseRequest):
     tx_hash: str
 
@@ -112,3 +214,153 @@ class TransactionInfoRequest(BaseRequest):
             return value
         raise errors.InvalidParamError(f"Transaction hash: '{value}' is not a valid transaction hash")
 
+
+class PaymentsLookupRequest(BaseRequest):
+    tx_hashes: List[str]
+
+    @validator('tx_hashes', whole=True)
+    def validate_tx_hashes(cls, value):
+        if not 0 < len(value) <= MAX_BULK_LOOKUPS:
+            raise errors.InvalidParamError(f'A bulk request must contain between 1 and {MAX_BULK_LOOKUPS} '
+                                           f'transaction hashes')
+        invalid_tx_hash = find_invalid_transaction_hash(value)
+        if invalid_tx_hash is not None:
+            raise errors.InvalidParamError(f"Transaction hash: '{invalid_tx_hash}' is not a valid transaction hash")
+        return value
+
+
+class JournalRequest(BaseRequest):
+    since: Optional[float]
+    destination: Optional[str]
+    limit: int = 100
+
+    @validator('destination')
+    def validate_destination(cls, value):
+        if value is None or is_valid_address(value):
+            return value
+        raise errors.InvalidParamError(f"Destination '{value}' is not a valid public address")
+
+    @validator('limit')
+    def validate_limit(cls, value):
+        if 0 < value <= MAX_JOURNAL_ENTRIES:
+            return value
+        raise errors.InvalidParamError(f'Limit must be between 1 and {MAX_JOURNAL_ENTRIES}')
+
+
+# The types a value must already have for the precompiled parser to accept it, for each field type
+FAST_PATH_TYPES = {str: (str,), float: (int, float), int: (int,)}
+# Returned by a field converter when the value should be validated by pydantic instead
+FALLBACK = object()
+
+
+def _compile_field(model: type, name: str, field) -> Callable[[Any], Any]:
+    """Get a function that converts and validates a value of the field, or returns FALLBACK"""
+    field_type = field.type_
+    if field.allow_none and getattr(field_type, '__origin__', None) is Union:
+        # Optional[x] is Union[x, NoneType]
+        field_type = field_type.__args__[0]
+    validators = list(field.class_validators.values())
+    if any(v.pre or v.always for v in validators):
+        raise ValueError(f'Field {name} of {model.__name__} is not supported by the precompiled parser')
+    item_validators = [v.func for v in validators if not v.whole]
+    whole_validators = [v.func for v in validators if v.whole]
+
+    if isinstance(field_type, type) and issubclass(field_type, BaseRequest):
+        parse_item = compile_parser(field_type)
+
+        def convert_item(item):
+            if type(item) is not dict:
+                return FALLBACK
+            parsed = parse_item(item)
+            return FALLBACK if parsed is None else parsed
+    else:
+        accepted_types = FAST_PATH_TYPES.get(field_type)
+        if accepted_types is None:
+            raise ValueError(f'Field {name} of {model.__name__} is not supported by the precompiled parser')
+
+        def convert_item(item):
+            # bool is a subclass of int, but pydantic doesn't treat it like one
+            if type(item) not in accepted_types:
+                return FALLBACK
+            item = field_type(item)
+            for func in item_validators:
+                item = func(model, item)
+            return item
+
+    if field.shape is Shape.SINGLETON:
+        convert = convert_item
+    elif field.shape is Shape.LIST:
+        def convert(value):
+            if type(value) is not list:
+                return FALLBACK
+            items = []
+            for item in value:
+                # Stop at the first item pydantic should validate, it might fail before the later items do
+                item = convert_item(item)
+                if item is FALLBACK:
+                    return FALLBACK
+                items.append(item)
+            return items
+    else:
+        raise ValueError(f'Field {name} of {model.__name__} is not supported by the precompiled parser')
+
+    if not whole_validators:
+        return convert
+
+    def convert_whole(value):
+        value = convert(value)
+        if value is FALLBACK:
+            return FALLBACK
+        for func in whole_validators:
+            value = func(model, value)
+        return value
+
+    return convert_whole
+
+
+def compile_parser(model: type) -> Callable[[dict], Optional[BaseRequest]]:
+    """
+    Precompile a parser for a model with simple fields, that skips pydantic's validation machinery
+
+    Supported fields are str/int/float (or Optional of them), lists of them, and lists of other request models.
+    The parser only handles bodies where every value already has the exact type of its field,
+    and runs the model's own validators on them, so the result is the same as initializing the model.
+    For any other body it returns None, and the model should be initialized normally to get the right error.
+    """
+    field_specs = [(name, field.required, field.default, field.allow_none, _compile_field(model, name, field))
+                   for name, field in model.__fields__.items()]
+    field_names = frozenset(model.__fields__)
+
+    def parse(body_dict: dict) -> Optional[BaseRequest]:
+        if not field_names.issuperset(body_dict):
+            return None  # Extra parameters
+
+        values = {}
+        for name, required, default, allow_none, convert in field_specs:
+            if name not in body_dict:
+                if required:
+                    return None
+                values[name] = default
+                continue
+
+            value = body_dict[name]
+            if value is None and allow_none:
+                values[name] = None
+                continue
+
+            value = convert(value)
+            if value is FALLBACK:
+                return None
+            values[name] = value
+
+        return model.construct(values, set(body_dict))
+
+    return parse
+
+
+# Models that are initialized on every request, or that have many items to validate
+FAST_PARSERS: Dict[type, Callable[[dict], Optional[BaseRequest]]] = {
+    model: compile_parser(model) for model in (PaymentRequest, CreationRequest, BatchPaymentRequest,
+                                               BalanceRequest, BulkBalanceRequest,
+                                               TransactionInfoRequest, PaymentsLookupRequest)
+}
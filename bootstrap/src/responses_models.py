@@ -1,15 +1,46 @@
 """Contains all models for the bootstrap server's responses"""
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
+
+from typing import Optional, List, Dict, Tuple, Union
+
+# Field types that can be copied to the response dictionary as they are
+FLAT_TYPES = (str, int, float, bool, type(None))
+# The field names of each flat response class, or None if the class has nested fields
+_flat_fields: Dict[type, Optional[Tuple[str, ...]]] = {}
+
+
+def _is_flat(field_type) -> bool:
+    if getattr(field_type, '__origin__', None) is Union:  # Optional[...]
+        return all(_is_flat(arg) for arg in field_type.__args__)
+    return field_type in FLAT_TYPES
+
+
+def _get_flat_fields(cls: type) -> Optional[Tuple[str, ...]]:
+    try:
+        return _flat_fields[cls]
+    except KeyError:
+        cls_fields = fields(cls)
+        flat_fields = tuple(field.name for field in cls_fields) \
+            if all(_is_flat(field.type) for field in cls_fields) else None
+        _flat_fields[cls] = flat_fields
+        return flat_fields
 
-from typing import Optional
 
 @dataclass
 class BaseResponse:
     """Abstract base response class that all response objects inherit from"""
 
     def to_response_dict(self):
-        """Use dataclasses.asdict to get a dictionary (which sanic will use for a json response)"""
-        return asdict(self)
+        """
+        Get a dictionary (which will be used for a json response)
+
+        Responses that only have simple fields are copied directly,
+        without the recursion and deep copying of dataclasses.asdict.
+        """
+        flat_fields = _get_flat_fields(type(self))
+        if flat_fields is None:
+            return asdict(self)
+        return {name: getattr(self, name) for name in flat_fields}
 
 
 @dataclass
@@ -17,11 +48,35 @@ class TransactionResponse(BaseResponse):
     tx_id: str
 
 
+@dataclass
+class BatchPaymentResult(BaseResponse):
+    destination: str
+    amount: float
+    tx_id: Optional[str]
+    error: Optional[dict]
+
+
+@dataclass
+class BatchPaymentResponse(BaseResponse):
+    results: List[BatchPaymentResult]
+
+
 @dataclass
 class BalanceResponse(BaseResponse):
     balance: float
 
 
+@dataclass
+class BalanceResult(BaseResponse):
+    balance: Optional[float]
+    error: Optional[dict]
+
+
+@dataclass
+class BulkBalanceResponse(BaseResponse):
+    balances: Dict[str, BalanceResult]
+
+
 @dataclass
 class PaymentInfoResponse(BaseResponse):
     source: str
@@ -36,14 +91,61 @@ class WhitelistResponse(BaseResponse):
     tx_envelope: str
 
 
+@dataclass
+class BatchWhitelistResult(BaseResponse):
+    tx_envelope: Optional[str]
+    error: Optional[dict]
+
+
+@dataclass
+class BatchWhitelistResponse(BaseResponse):
+    results: List[BatchWhitelistResult]
+
+
+@dataclass
+class JournalEntry(BaseResponse):
+    created_at: float
+    kind: str
+    source: Optional[str]
+    destination: Optional[str]
+    amount: Optional[float]
+    memo: Optional[str]
+    tx_id: Optional[str]
+    channel: Optional[str]
+    latency: float
+    result: str
+    request: Optional[str]
+
+
+@dataclass
+class JournalResponse(BaseResponse):
+    entries: List[JournalEntry]
+
+
+@dataclass
+class ReadyResponse(BaseResponse):
+    ready: bool
+
+
 @dataclass
 class StatusResponse(BaseResponse):
 
     @dataclass
-    class ChannelsInfo:
+    class ChannelsInfo(BaseResponse):
         free_channels: int
         non_free_channels: int
         total_channels: int
+        resting_channels: int = 0
+        waiting_requests: int = 0
+        average_wait_time: float = 0
+        rejected_requests: int = 0
+
+    @dataclass
+    class FeeInfo(BaseResponse):
+        policy: str
+        fee: int
+        minimum_fee: int
+        capacity_usage: float
 
     service_version: str
     horizon: str
@@ -51,3 +153,4 @@ class StatusResponse(BaseResponse):
     public_address: str
     balance: float
     channels: ChannelsInfo
+    fees: FeeInfo
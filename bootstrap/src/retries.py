@@ -0,0 +1,90 @@
+"""Contains the policy for retrying transaction submissions that failed for reasons other than the transaction itself"""
+import time
+import random
+
+from kin import KinErrors
+from kin.blockchain.errors import HorizonErrorType, TransactionResultCode
+
+from .horizon import is_node_failure
+
+from typing import Dict, Optional
+
+
+class RetryReasons:
+    """Contains the reasons a submission is retried for"""
+    BAD_SEQUENCE = 'bad_sequence'  # The channel's sequence drifted, resync it and sign the transaction again
+    TRANSIENT = 'transient'  # Horizon timed out or failed, submit the same transaction again
+
+
+class RetryOutcomes:
+    """Contains the outcomes of submissions that were retried"""
+    SUCCEEDED = 'succeeded'  # A retry was accepted
+    FOUND = 'found'  # The transaction was already on the blockchain, from an attempt that seemed to fail
+    FAILED = 'failed'  # A retry failed with an error that is not retried
+    EXHAUSTED = 'exhausted'  # Ran out of retries, or out of time
+
+
+def get_retry_reason(e: Exception) -> Optional[str]:
+    """Get the reason to retry a submission that failed with this error, or None if it should not be retried"""
+    if isinstance(e, KinErrors.HorizonError) and e.type == HorizonErrorType.TRANSACTION_FAILED:
+        if e.extras['result_codes']['transaction'] == TransactionResultCode.BAD_SEQUENCE:
+            return RetryReasons.BAD_SEQUENCE
+        return None
+    return RetryReasons.TRANSIENT if is_node_failure(e) else None
+
+
+class RetryPolicy:
+    """
+    How many times, and for how long, to retry a submission
+
+    Also counts the retries by their reason, and the submissions that were retried by their outcome.
+    """
+
+    def __init__(self, max_retries: int, backoff: float, deadline: float):
+        """
+        :param max_retries: The maximum number of retries of a single submission
+        :param backoff: The base of the exponential backoff (in seconds), the actual wait is random up to it
+        :param deadline: How long (in seconds) a submission can keep being retried, from its first attempt
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.retries: Dict[str, int] = dict.fromkeys([RetryReasons.BAD_SEQUENCE, RetryReasons.TRANSIENT], 0)
+        self.outcomes: Dict[str, int] = dict.fromkeys([RetryOutcomes.SUCCEEDED, RetryOutcomes.FOUND,
+                                                       RetryOutcomes.FAILED, RetryOutcomes.EXHAUSTED], 0)
+
+    def start(self) -> 'RetryBudget':
+        """Start tracking the retries of a submission"""
+        return RetryBudget(self)
+
+    def record_outcome(self, budget: 'RetryBudget', outcome: str) -> None:
+        """Count the outcome of a submission, if it was retried"""
+        if budget.retries:
+            self.outcomes[outcome] += 1
+
+
+class RetryBudget:
+    """The retries left for a single submission"""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.retries = 0
+        self.deadline = time.monotonic() + policy.deadline
+
+    def next_delay(self, reason: str) -> Optional[float]:
+        """
+        Use up a retry
+
+        :return: How long (in seconds) to wait before retrying, or None if there are no retries left
+        """
+        if self.retries >= self.policy.max_retries:
+            return None
+        # A bad sequence is fixed by the resync, only horizon failures need time to recover
+        delay = 0 if reason == RetryReasons.BAD_SEQUENCE else \
+            random.uniform(0, self.policy.backoff * 2 ** self.retries)
+        if time.monotonic() + delay >= self.deadline:
+            return None
+
+        self.retries += 1
+        self.policy.retries[reason] += 1
+        return delay
@@ -1,15 +1,33 @@
 """Contains all of the routes for the server"""
+import time
+import asyncio
 import logging
 from datetime import datetime
 
 import kin
 from kin import KinErrors
 from sanic import Sanic
+from sanic.response import HTTPResponse, stream
 
 from . import errors
 from . import requets_models
 from . import responses_models
-from .helpers import json_response, get_model
+from .helpers import json_response, raw_json_response, json_bytes, get_model, prettify_exc
+from .account import BootstrapAccount
+from .cache import TTLCache, TransactionCache, WhitelistCache, SingleFlight
+from .batching import send_payment_batch, split_to_batches, PaymentBatcher
+from .channels import ChannelScheduler
+from .fees import FeeManager
+from .idempotency import IdempotencyStore, idempotent
+from .journal import Journal
+from .metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .tracing import Tracer
+from .whitelist import WhitelistErrors, WhitelistSigner
+from .workers import Worker
+from .scaling import ChannelScaler
+from .streaming import PaymentStreamHub
+
+from typing import Awaitable, Optional, Tuple
 
 logger = logging.getLogger('bootstrap')
 
@@ -18,26 +36,113 @@ def init_routes(app: Sanic, version: str):
 
     # Has no effect, just to help the IDE a bit :)
     app.kin_client: kin.KinClient
-    app.kin_account: kin.KinAccount
-    app.minimum_fee: int
+    app.kin_account: BootstrapAccount
+    app.fee_manager: FeeManager
+    app.payment_batcher: Optional[PaymentBatcher]
+    app.channel_scheduler: ChannelScheduler
+    app.channel_scaler: ChannelScaler
+    app.ready: bool
+    app.balance_cache: TTLCache
+    app.tx_cache: TransactionCache
+    app.whitelist_cache: WhitelistCache
+    app.bulk_lookup_concurrency: int
+    app.payment_stream_hub: PaymentStreamHub
+    app.stream_heartbeat_interval: float
+    app.idempotency_store: IdempotencyStore
+    app.journal: Optional[Journal]
+    app.whitelist_signer: WhitelistSigner
+    app.metrics: Metrics
+    app.tracer: Optional[Tracer]
+    app.worker: Optional[Worker]
 
-    @app.route('/balance/<address>', methods=['GET'])
-    async def get_balance(request, address: str):
-        balance_request = requets_models.BalanceRequest(address=address)
+    # Concurrent identical reads share the same call to horizon
+    reads = SingleFlight()
+
+    async def measure_horizon_call(method: str, call: Awaitable):
+        """Wait for a kin-sdk call that goes to horizon, and measure how long it took"""
+        with app.metrics.horizon_latency.time(method):
+            return await call
+
+    def invalidate_balances(*addresses: str) -> None:
+        """Forget the cached balances of accounts we sent kin from or to"""
+        app.balance_cache.invalidate(app.kin_account.keypair.public_address, *addresses)
+
+    async def fetch_balance(address: str) -> Tuple[float, float]:
+        """
+        Get the balance of an account, from the cache if possible
+
+        :return: The balance and its age (in seconds)
+
+        :raises: errors.AccountNotFoundError: if the account does not exist
+        """
+        cached = app.balance_cache.get(address)
+        if cached is not None:
+            return cached
+
+        # A read that started before a payment to the account must not be cached, or joined, after it
+        generation = app.balance_cache.get_generation(address)
         try:
-            balance = await app.kin_client.get_account_balance(balance_request.address)
+            balance = await reads.do(('balance', address, generation), lambda: measure_horizon_call(
+                'get_account_balance', app.kin_client.get_account_balance(address)))
         except KinErrors.AccountNotFoundError:
-            raise errors.AccountNotFoundError(balance_request.address)
+            raise errors.AccountNotFoundError(address)
+        app.balance_cache.set(address, balance, generation)
+        return balance, 0
 
-        return json_response(responses_models.BalanceResponse(balance).to_response_dict(), 200)
+    @app.route('/balance/<address>', methods=['GET'])
+    async def get_balance(request, address: str):
+        balance_request = requets_models.BalanceRequest.from_dict({'address': address})
+        balance, age = await fetch_balance(balance_request.address)
+
+        response = json_response(responses_models.BalanceResponse(balance).to_response_dict(), 200)
+        response.headers['Age'] = str(int(age))
+        return response
+
+    @app.route('/balances', methods=['POST'])
+    @get_model(model=requets_models.BulkBalanceRequest)
+    async def get_balances(balances_request: requets_models.BulkBalanceRequest):
+        semaphore = asyncio.Semaphore(app.bulk_lookup_concurrency)
+
+        async def get_balance_result(address: str) -> responses_models.BalanceResult:
+            try:
+                async with semaphore:
+                    balance, _ = await fetch_balance(address)
+            except errors.BootstrapError as e:
+                return responses_models.BalanceResult(None, e.to_dict())
+            except Exception as e:
+                logger.error(f'Unexpected exception while getting the balance of {address}:\n'
+                             f'{prettify_exc(e)}')
+                return responses_models.BalanceResult(None, errors.InternalError().to_dict())
+            return responses_models.BalanceResult(balance, None)
+
+        # Remove duplicates, but keep the order
+        addresses = list(dict.fromkeys(balances_request.addresses))
+        results = await asyncio.gather(*[get_balance_result(address) for address in addresses])
+
+        balances_response = responses_models.BulkBalanceResponse(dict(zip(addresses, results)))
+        return json_response(balances_response.to_response_dict(), 200)
+
+    async def fetch_tx_info(tx_hash: str) -> bytes:
+        """
+        Get the info of a payment transaction, from the cache if possible
+
+        :return: The serialized PaymentInfoResponse
+
+        :raises: errors.TransactionNotFoundError: if the transaction does not exist
+        :raises: errors.InvalidTransactionError: if the transaction is not a payment
+        """
+        body = await app.tx_cache.get(tx_hash)
+        if body is not None:
+            return body
+        if app.tx_cache.is_not_found(tx_hash):
+            raise errors.TransactionNotFoundError(tx_hash)
 
-    @app.route('/payment/<tx_hash>', methods=['GET'])
-    async def get_tx_info(request, tx_hash: str):
-        tx_info_request = requets_models.TransactionInfoRequest(tx_hash=tx_hash)
         try:
-            tx = await app.kin_client.get_transaction_data(tx_info_request.tx_hash)
+            tx = await reads.do(('tx', tx_hash), lambda: measure_horizon_call(
+                'get_transaction_data', app.kin_client.get_transaction_data(tx_hash)))
         except KinErrors.ResourceNotFoundError:
-            raise errors.TransactionNotFoundError(tx_info_request.tx_hash)
+            app.tx_cache.set_not_found(tx_hash)
+            raise errors.TransactionNotFoundError(tx_hash)
         except KinErrors.CantSimplifyError:
             raise errors.InvalidTransactionError()
 
@@ -52,59 +157,259 @@ def init_routes(app: Sanic, version: str):
                                                              tx.memo,
                                                              timestamp)
 
-        return json_response(info_response.to_response_dict(), 200)
+        # The transaction will never change, so cache the response itself
+        body = json_bytes(info_response.to_response_dict())
+        await app.tx_cache.set(tx_hash, body)
+        return body
+
+    async def lookup_tx_info(tx_hash: str) -> bytes:
+        """Get the info of a transaction as a serialized lookup result, with either the payment or an error"""
+        payment, error = b'null', b'null'
+        try:
+            payment = await fetch_tx_info(tx_hash)
+        except errors.BootstrapError as e:
+            error = json_bytes(e.to_dict())
+        except Exception as e:
+            logger.error(f'Unexpected exception while getting transaction {tx_hash}:\n'
+                         f'{prettify_exc(e)}')
+            error = json_bytes(errors.InternalError().to_dict())
+
+        # Build the result around the cached payment bytes, instead of decoding and encoding them again
+        return b'{"tx_hash":"%b","payment":%b,"error":%b}' % (tx_hash.encode(), payment, error)
+
+    @app.route('/payment/<tx_hash>', methods=['GET'])
+    async def get_tx_info(request, tx_hash: str):
+        tx_info_request = requets_models.TransactionInfoRequest.from_dict({'tx_hash': tx_hash})
+        return raw_json_response(await fetch_tx_info(tx_info_request.tx_hash), 200)
+
+    @app.route('/payments/lookup', methods=['POST'])
+    @get_model(model=requets_models.PaymentsLookupRequest)
+    async def lookup_payments(lookup_request: requets_models.PaymentsLookupRequest):
+        semaphore = asyncio.Semaphore(app.bulk_lookup_concurrency)
+
+        async def lookup(tx_hash: str) -> bytes:
+            async with semaphore:
+                return await lookup_tx_info(tx_hash)
+
+        results = await asyncio.gather(*[lookup(tx_hash) for tx_hash in lookup_request.tx_hashes])
+        return raw_json_response(b'{"payments":[%b]}' % b','.join(results), 200)
+
+    @app.route('/payments/lookup/stream', methods=['POST'])
+    @get_model(model=requets_models.PaymentsLookupRequest)
+    async def lookup_payments_stream(lookup_request: requets_models.PaymentsLookupRequest):
+        async def write_results(response):
+            semaphore = asyncio.Semaphore(app.bulk_lookup_concurrency)
+
+            async def lookup(tx_hash: str) -> bytes:
+                async with semaphore:
+                    return await lookup_tx_info(tx_hash)
+
+            # Write each result as soon as it is ready, in the order they finish
+            tasks = [asyncio.ensure_future(lookup(tx_hash)) for tx_hash in lookup_request.tx_hashes]
+            try:
+                for next_result in asyncio.as_completed(tasks):
+                    await response.write(await next_result + b'\n')
+            finally:
+                # Stop looking up if the client went away
+                for task in tasks:
+                    task.cancel()
+
+        return stream(write_results, content_type='application/x-ndjson')
+
+    @app.route('/payments/stream', methods=['GET'])
+    async def stream_payments(request):
+        # Addresses can be sent as "?addresses=A,B" or as "?addresses=A&addresses=B"
+        addresses = [address for arg in request.args.getlist('addresses', []) for address in arg.split(',')]
+        stream_request = requets_models.PaymentStreamRequest(addresses=addresses)
+        # Refuse while an error response can still be sent, but only subscribe once streaming starts,
+        # so the subscription isn't left behind if the client goes away before that
+        app.payment_stream_hub.check_capacity()
+
+        async def write_events(response):
+            try:
+                subscription = app.payment_stream_hub.subscribe(stream_request.addresses)
+            except errors.TooManySubscribersError:
+                # Others subscribed since the check
+                return
+
+            try:
+                while True:
+                    try:
+                        event = await asyncio.wait_for(subscription.get(), app.stream_heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        # Keep the connection open through proxies, and find out if the client went away
+                        await response.write(b': heartbeat\n\n')
+                        continue
+                    if event is None:
+                        # The hub dropped us
+                        return
+
+                    tx_hash, payment = event
+                    await response.write(b'id: %b\nevent: payment\ndata: %b\n\n' %
+                                         (tx_hash.encode(), json_bytes(payment.to_response_dict())))
+            finally:
+                app.payment_stream_hub.unsubscribe(subscription)
+
+        return stream(write_events, content_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
     @app.route('/status', methods=['GET'])
     async def get_status(request):
-        status = await app.kin_account.get_status()
+        status = await reads.do('status', lambda: measure_horizon_call('get_status', app.kin_account.get_status()))
+        channels = status['account']['channels']
+        if app.worker is not None:
+            # Include the channels of all of the workers, this worker's stats are the most up to date
+            app.worker.stats.publish(app.worker.index, channels)
+            channels = app.worker.stats.aggregate()
         status_response = responses_models.StatusResponse(version,
                                                           status['client']['horizon']['uri'],
                                                           status['account']['app_id'],
                                                           status['account']['public_address'],
                                                           status['account']['balance'],
-                                                          status['account']['channels'])
+                                                          responses_models.StatusResponse.ChannelsInfo(**channels),
+                                                          responses_models.StatusResponse.FeeInfo(
+                                                              **app.fee_manager.get_status()))
 
         return json_response(status_response.to_response_dict(), 200)
 
+    @app.route('/metrics', methods=['GET'])
+    async def get_metrics(request):
+        return HTTPResponse(app.metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+    @app.route('/ready', methods=['GET'])
+    async def get_ready(request):
+        if not app.ready:
+            raise errors.NotReadyError()
+
+        return json_response(responses_models.ReadyResponse(True).to_response_dict(), 200)
+
     @app.route('/pay', methods=['POST'])
+    @idempotent(app)
     @get_model(model=requets_models.PaymentRequest)
     async def pay(payment_request: requets_models.PaymentRequest):
+        if app.payment_batcher is not None:
+            # The batcher already translates the errors
+            tx_id = await app.payment_batcher.pay(payment_request)
+            invalidate_balances(payment_request.destination)
+            return json_response(responses_models.TransactionResponse(tx_id).to_response_dict(), 200)
+
         try:
-            tx_id = await app.kin_account.send_kin(payment_request.destination,
-                                                   payment_request.amount,
-                                                   app.minimum_fee,
-                                                   payment_request.memo)
+            tx_id = await measure_horizon_call('send_kin', app.kin_account.send_kin(payment_request.destination,
+                                                                                    payment_request.amount,
+                                                                                    app.fee_manager.fee,
+                                                                                    payment_request.memo,
+                                                                                    payment_request.dict()))
         except KinErrors.AccountNotFoundError:
             raise errors.DestinationDoesNotExistError(payment_request.destination)
         except KinErrors.LowBalanceError:
             raise errors.LowBalanceError()
 
+        invalidate_balances(payment_request.destination)
         return json_response(responses_models.TransactionResponse(tx_id).to_response_dict(), 200)
 
+    @app.route('/pay/batch', methods=['POST'])
+    @idempotent(app)
+    @get_model(model=requets_models.BatchPaymentRequest)
+    async def pay_batch(batch_request: requets_models.BatchPaymentRequest):
+        # Send each batch on a different channel at the same time
+        batches = split_to_batches(batch_request.payments)
+        batches_results = await asyncio.gather(*[send_payment_batch(app.kin_account,
+                                                                    batch,
+                                                                    app.fee_manager.fee,
+                                                                    batch_request.memo)
+                                                 for batch in batches])
+        invalidate_balances(*[payment.destination for payment in batch_request.payments])
+
+        results = []
+        for batch, batch_results in zip(batches, batches_results):
+            for payment, result in zip(batch, batch_results):
+                if isinstance(result, str):
+                    results.append(responses_models.BatchPaymentResult(payment.destination, payment.amount,
+                                                                       result, None))
+                else:
+                    results.append(responses_models.BatchPaymentResult(payment.destination, payment.amount,
+                                                                       None, result.to_dict()))
+
+        return json_response(responses_models.BatchPaymentResponse(results).to_response_dict(), 200)
+
     @app.route('/create', methods=['POST'])
+    @idempotent(app)
     @get_model(model=requets_models.CreationRequest)
     async def create(creation_request: requets_models.CreationRequest):
         try:
-            tx_id = await app.kin_account.create_account(creation_request.destination,
-                                                         creation_request.starting_balance,
-                                                         app.minimum_fee,
-                                                         creation_request.memo)
+            tx_id = await measure_horizon_call('create_account',
+                                               app.kin_account.create_account(creation_request.destination,
+                                                                              creation_request.starting_balance,
+                                                                              app.fee_manager.fee,
+                                                                              creation_request.memo,
+                                                                              creation_request.dict()))
         except KinErrors.LowBalanceError:
             raise errors.LowBalanceError()
         except KinErrors.AccountExistsError:
             raise errors.DestinationExistsError(creation_request.destination)
 
+        invalidate_balances(creation_request.destination)
         return json_response(responses_models.TransactionResponse(tx_id).to_response_dict(), 200)
 
+    def get_whitelist_error(whitelist_error: Optional[str]) -> Optional[errors.BootstrapError]:
+        if whitelist_error == WhitelistErrors.WRONG_NETWORK:
+            return errors.InvalidParamError(f'The network id sent in the request doesn\'t '
+                                            f'match the network the server is configured with')
+        if whitelist_error == WhitelistErrors.CANT_DECODE:
+            return errors.CantDecodeTransactionError()
+        return None
+
     @app.route('/whitelist', methods=['POST'])
     @get_model(model=requets_models.WhitelistRequest)
-    async def create(whitelist_request: requets_models.WhitelistRequest):
+    async def whitelist(whitelist_request: requets_models.WhitelistRequest):
+        start_time = time.monotonic()
+        # Decoding and signing the envelope is cpu bound, so it happens in the signer's executor
+        result = await app.whitelist_signer.whitelist(whitelist_request.envelope, whitelist_request.network_id)
+        error = get_whitelist_error(result.error)
+
+        if app.journal is not None:
+            app.journal.record_whitelist(whitelist_request.dict(), time.monotonic() - start_time, error)
+        if error is not None:
+            raise error
+
+        return json_response(responses_models.WhitelistResponse(result.tx_envelope).to_response_dict(), 200)
+
+    @app.route('/whitelist/batch', methods=['POST'])
+    @get_model(model=requets_models.BatchWhitelistRequest)
+    async def whitelist_batch(batch_request: requets_models.BatchWhitelistRequest):
+        start_time = time.monotonic()
+        whitelist_results = await app.whitelist_signer.whitelist_many([(item.envelope, item.network_id)
+                                                                       for item in batch_request.transactions])
+        latency = time.monotonic() - start_time
+
+        results = []
+        for item, result in zip(batch_request.transactions, whitelist_results):
+            error = get_whitelist_error(result.error)
+            if app.journal is not None:
+                app.journal.record_whitelist(item.dict(), latency, error)
+            results.append(responses_models.BatchWhitelistResult(result.tx_envelope,
+                                                                 None if error is None else error.to_dict()))
+
+        return json_response(responses_models.BatchWhitelistResponse(results).to_response_dict(), 200)
+
+    @app.route('/journal', methods=['GET'])
+    async def get_journal(request):
+        if app.journal is None:
+            raise errors.JournalDisabledError()
+
+        journal_request = requets_models.JournalRequest(**{arg: values[0] for arg, values in request.args.items()})
+        entries = await app.journal.query(journal_request.since, journal_request.destination, journal_request.limit)
+
+        journal_response = responses_models.JournalResponse([responses_models.JournalEntry(**entry)
+                                                             for entry in entries])
+        return json_response(journal_response.to_response_dict(), 200)
+
+    @app.route('/channels/scale', methods=['POST'])
+    @get_model(model=requets_models.ChannelScaleRequest)
+    async def scale_channels(scale_request: requets_models.ChannelScaleRequest):
         try:
-            whitelisted_tx = app.kin_account.whitelist_transaction(whitelist_request.dict())
-        except kin.KinErrors.WrongNetworkError:
-            raise errors.InvalidParamError(f'The network id sent in the request doesn\'t '
-                                           f'match the network the server is configured with')
-        except:
-            raise errors.CantDecodeTransactionError()
-
-        return json_response(responses_models.WhitelistResponse(whitelisted_tx).to_response_dict(), 200)
\ No newline at end of file
+            await app.channel_scaler.scale_to(scale_request.channel_count)
+        except KinErrors.LowBalanceError:
+            raise errors.LowBalanceError()
+
+        channels_info = responses_models.StatusResponse.ChannelsInfo(**app.channel_scheduler.get_status())
+        return json_response(channels_info.to_response_dict(), 200)
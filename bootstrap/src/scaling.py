@@ -0,0 +1,194 @@
+"""Contains methods to grow and shrink the channel pool while the server is running"""
+import asyncio
+import logging
+from hashlib import sha256
+
+import kin
+from kin.blockchain.keypair import Keypair
+from sanic import Sanic
+
+from . import errors
+from .account import BootstrapAccount
+from .batching import create_accounts_batch, split_to_batches
+from .helpers import prettify_exc
+
+from typing import List, Optional
+
+logger = logging.getLogger('bootstrap')
+
+
+def derive_channels(master_seed: str, salt: str, start: int, end: int) -> List[str]:
+    """
+    Get the seeds of the channels in the range [start, end), generated based on a seed and salt
+
+    The seeds are the same ones the kin-sdk's get_hd_channels generates, but without its limit of 100 channels.
+    """
+    hashed_salt = sha256(salt.encode()).hexdigest()
+    return [Keypair.generate_hd_seed(master_seed, hashed_salt + str(index)) for index in range(start, end)]
+
+
+async def create_channel_accounts(kin_account: BootstrapAccount, channel_seeds: List[str],
+                                  starting_balance: float, fee: int) -> None:
+    """Create the channel accounts in multi-operation transactions, sent concurrently on different channels"""
+    addresses = [Keypair.address_from_seed(seed) for seed in channel_seeds]
+    await asyncio.gather(*[create_accounts_batch(kin_account, batch, starting_balance, fee)
+                           for batch in split_to_batches(addresses)])
+
+
+async def find_missing_channels(kin_client: kin.KinClient, channel_seeds: List[str], concurrency: int) -> List[str]:
+    """
+    Find which of the channels don't exist on the blockchain yet
+
+    :param kin_client: The client to query horizon with
+    :param channel_seeds: The seeds of the channels to look for
+    :param concurrency: How many accounts to look up at the same time
+    :return: The seeds of the channels that don't exist
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def does_channel_exist(seed: str) -> bool:
+        async with semaphore:
+            return await kin_client.does_account_exists(Keypair.address_from_seed(seed))
+
+    exists = await asyncio.gather(*[does_channel_exist(seed) for seed in channel_seeds])
+    return [seed for seed, channel_exists in zip(channel_seeds, exists) if not channel_exists]
+
+
+async def bootstrap_channels(app: Sanic, channel_count: int, create_missing: bool = True) -> None:
+    """
+    Get the server ready to send transactions
+
+    Gets the fee while looking up which channels already exist,
+    and then creates only the missing channels and adds them to the pool.
+
+    :param create_missing: Create the missing channels, or wait for someone else to create them
+
+    :raises: errors.NotReadyError: if some channels are missing and should not be created here
+    """
+    channel_seeds = app.channel_scaler.derive_channels(0, channel_count)
+    _, missing_seeds = await asyncio.gather(
+        app.fee_manager.refresh(),
+        find_missing_channels(app.kin_client, channel_seeds, app.channel_scaler.lookup_concurrency))
+
+    logger.info(f'{channel_count - len(missing_seeds)} out of {channel_count} channels already exist')
+    if missing_seeds and not create_missing:
+        raise errors.NotReadyError()
+    await app.channel_scaler.scale_to(channel_count, missing_seeds=missing_seeds)
+
+
+class ChannelScaler:
+    """
+    Grow and shrink the channel pool
+
+    The channels are always the first 'channel_count' channels derived from the seed and salt
+    (starting from 'first_channel'), so shrinking and growing the pool again reuses the same accounts.
+    """
+
+    def __init__(self, app: Sanic, master_seed: str, salt: str, starting_balance: float,
+                 channel_count: int, max_channels: int, lookup_concurrency: int,
+                 first_channel: int = 0, use_master_seed: bool = True):
+        """
+        :param app: The app, used to get the kin account, the channel scheduler and the fee
+        :param master_seed: The seed used to derive the channels
+        :param salt: The salt used to derive the channels
+        :param starting_balance: The starting balance for new channels
+        :param channel_count: The number of channels the pool starts with
+        :param max_channels: The maximum number of channels the pool can grow to
+        :param lookup_concurrency: How many channel accounts to look up at the same time
+        :param first_channel: The index of the first derived channel that belongs to this pool
+        :param use_master_seed: Use the master account as the channel when the pool is empty.
+            When other processes use the same master account, the pool can't shrink to 0 instead.
+        """
+        self.app = app
+        self.master_seed = master_seed
+        self.salt = salt
+        self.starting_balance = starting_balance
+        self.channel_count = channel_count
+        self.max_channels = max_channels
+        self.lookup_concurrency = lookup_concurrency
+        self.first_channel = first_channel
+        self.use_master_seed = use_master_seed
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def derive_channels(self, start: int, end: int) -> List[str]:
+        """Get the seeds of the pool's channels in the range [start, end)"""
+        return derive_channels(self.master_seed, self.salt, self.first_channel + start, self.first_channel + end)
+
+    async def scale_to(self, channel_count: int, missing_seeds: Optional[List[str]] = None) -> None:
+        """
+        Grow or shrink the pool to the given number of channels
+
+        :param channel_count: The number of channels the pool should have
+        :param missing_seeds: The seeds of the new channels that don't exist yet, if already known
+
+        :raises: errors.InvalidParamError: if the channel count is out of range
+        :raises: KinErrors.SdkError: if the new channels could not be created
+        """
+        min_channels = 0 if self.use_master_seed else 1
+        if not min_channels <= channel_count <= self.max_channels:
+            raise errors.InvalidParamError(f'Channel count must be between {min_channels} and {self.max_channels}')
+
+        async with self._lock:
+            current_count = self.channel_count
+            scheduler = self.app.channel_scheduler
+
+            if channel_count > current_count:
+                logger.info(f'Growing the channel pool from {current_count} to {channel_count} channels')
+                new_seeds = self.derive_channels(current_count, channel_count)
+                if missing_seeds is None:
+                    missing_seeds = await find_missing_channels(self.app.kin_client, new_seeds,
+                                                                self.lookup_concurrency)
+                else:
+                    missing_seeds = [seed for seed in new_seeds if seed in set(missing_seeds)]
+
+                if missing_seeds:
+                    logger.info(f'Creating {len(missing_seeds)} channels')
+                    await create_channel_accounts(self.app.kin_account, missing_seeds,
+                                                  self.starting_balance, self.app.fee_manager.fee)
+                scheduler.add_channels(new_seeds)
+                if current_count == 0:
+                    # The base account is only used as a channel when there are no other channels
+                    scheduler.remove_channels([self.master_seed])
+
+            elif channel_count < current_count:
+                logger.info(f'Shrinking the channel pool from {current_count} to {channel_count} channels')
+                if channel_count == 0:
+                    scheduler.add_channels([self.master_seed])
+                scheduler.remove_channels(self.derive_channels(channel_count, current_count))
+
+            self.channel_count = channel_count
+
+    def start_autoscaling(self, interval: float, step: int) -> None:
+        """
+        Grow the pool whenever requests were waiting for channels for a whole interval
+
+        :param interval: How often (in seconds) to check if the pool is saturated
+        :param step: How many channels to add each time
+        """
+        self._task = asyncio.ensure_future(self._autoscale(interval, step))
+
+    async def stop(self) -> None:
+        """Stop autoscaling"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _autoscale(self, interval: float, step: int) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            saturated_since = self.app.channel_scheduler.saturated_since
+            if saturated_since is None or loop.time() - saturated_since < interval \
+                    or self.channel_count >= self.max_channels:
+                continue
+
+            try:
+                await self.scale_to(min(self.channel_count + step, self.max_channels))
+            except Exception as e:
+                logger.error(f'Failed to grow the channel pool:\n'
+                             f'{prettify_exc(e)}')
@@ -0,0 +1,35 @@
+"""Contains the json backend used to parse request bodies and serialize responses"""
+import json
+
+from typing import Any
+
+# Use the fastest json library that is installed, they all parse directly from bytes
+try:
+    import orjson
+
+    BACKEND = 'orjson'
+    loads = orjson.loads
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize an object to json bytes"""
+        return orjson.dumps(obj)
+
+except ImportError:
+    try:
+        import ujson
+
+        BACKEND = 'ujson'
+        loads = ujson.loads
+
+        def dumps(obj: Any) -> bytes:
+            """Serialize an object to json bytes"""
+            # escape_forward_slashes: https://github.com/huge-success/sanic/issues/1019
+            return ujson.dumps(obj, escape_forward_slashes=False).encode()
+
+    except ImportError:
+        BACKEND = 'json'
+        loads = json.loads
+
+        def dumps(obj: Any) -> bytes:
+            """Serialize an object to json bytes"""
+            return json.dumps(obj, separators=(',', ':')).encode()
@@ -0,0 +1,202 @@
+"""Contains the hub that pushes payments from a single horizon stream to many subscribers"""
+import base64
+import asyncio
+import logging
+from datetime import datetime
+
+import kin
+from kin.transactions import RawTransaction, NATIVE_ASSET_TYPE
+from kin_base.keypair import Keypair
+from kin_base.memo import TextMemo
+from kin_base.operation import Payment
+
+from . import errors
+from .helpers import prettify_exc
+from .responses_models import PaymentInfoResponse
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger('bootstrap')
+
+# How long to wait before reconnecting to horizon after the stream failed
+RECONNECT_INTERVAL = 1
+
+
+class Subscription:
+    """The payments of a set of addresses, waiting to be sent to a single subscriber"""
+
+    def __init__(self, addresses: Set[str], queue_size: int):
+        self.addresses = addresses
+        # Holds (tx_hash, payment) tuples, and None once the subscription was closed by the hub
+        self.queue = asyncio.Queue(queue_size)
+
+    async def get(self) -> Optional[Tuple[str, PaymentInfoResponse]]:
+        """
+        Wait for the next payment
+
+        :return: The transaction hash and the payment, or None if the subscription was closed
+        """
+        return await self.queue.get()
+
+
+def may_involve(envelope_xdr: str, keys: Set[bytes]) -> bool:
+    """
+    Check if a transaction envelope might mention any of the raw public keys, without decoding it
+
+    Xdr aligns everything to 4 bytes, so every account in the envelope starts at a multiple of 4.
+    A false positive only costs decoding the transaction.
+    """
+    envelope = base64.b64decode(envelope_xdr)
+    return any(envelope[offset:offset + 32] in keys for offset in range(0, len(envelope) - 31, 4))
+
+
+def parse_payments(tx: dict) -> Iterator[Tuple[str, PaymentInfoResponse]]:
+    """
+    Get all of the kin payments in a transaction from horizon
+
+    Unlike the kin-sdk's monitors, transactions with more than one operation are supported,
+    since the server itself sends payments in batches.
+    """
+    raw_tx = RawTransaction(tx)
+    memo = raw_tx.tx.memo.text.decode() if isinstance(raw_tx.tx.memo, TextMemo) else None
+    # Convert from '2018-11-12T06:45:40Z' to unix timestamp
+    timestamp = datetime.strptime(raw_tx.timestamp, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+    tx_source = raw_tx.tx.source.decode()
+
+    for operation in raw_tx.tx.operations:
+        if not isinstance(operation, Payment) or operation.asset.type != NATIVE_ASSET_TYPE:
+            continue
+        yield raw_tx.hash, PaymentInfoResponse(operation.source or tx_source,
+                                               operation.destination,
+                                               float(operation.amount),
+                                               memo,
+                                               timestamp)
+
+
+class PaymentStreamHub:
+    """
+    Push payments to subscribers, using a single horizon stream for all of them
+
+    Subscriptions are indexed by address, so each payment is only matched against its source and destination.
+    Transactions that don't mention any of the addresses are skipped before being decoded.
+    The horizon stream is only open while there are subscribers,
+    and after it fails it resumes from the last transaction, so none are missed.
+    A subscriber that can't keep up and fills its queue is disconnected, instead of slowing down everyone else.
+    """
+
+    def __init__(self, kin_client: kin.KinClient, queue_size: int, max_subscribers: int):
+        """
+        :param kin_client: The client used to stream the transactions from horizon
+        :param queue_size: How many payments can wait for a subscriber before it is disconnected
+        :param max_subscribers: The maximum number of subscribers at the same time
+        """
+        self.kin_client = kin_client
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        # The raw public keys of the subscribed addresses, as they appear in transaction envelopes
+        self._keys: Set[bytes] = set()
+        self.subscriber_count = 0
+        self._task = None
+
+        # Metrics
+        self.pushed_payments = 0
+        self.dropped_subscribers = 0
+
+    def check_capacity(self) -> None:
+        """
+        Check that there is room for another subscriber
+
+        :raises: errors.TooManySubscribersError: if there are already too many subscribers
+        """
+        if self.subscriber_count >= self.max_subscribers:
+            raise errors.TooManySubscribersError()
+
+    def subscribe(self, addresses: List[str]) -> Subscription:
+        """
+        Subscribe to the payments sent from or to any of the addresses
+
+        :raises: errors.TooManySubscribersError: if there are already too many subscribers
+        """
+        self.check_capacity()
+
+        subscription = Subscription(set(addresses), self.queue_size)
+        for address in subscription.addresses:
+            if address not in self._subscriptions:
+                self._subscriptions[address] = set()
+                self._keys.add(Keypair.from_address(address).raw_public_key())
+            self._subscriptions[address].add(subscription)
+        self.subscriber_count += 1
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop sending payments to a subscription, does nothing if it was already removed"""
+        removed = False
+        for address in subscription.addresses:
+            subscriptions = self._subscriptions.get(address)
+            if subscriptions is None or subscription not in subscriptions:
+                continue
+            subscriptions.remove(subscription)
+            removed = True
+            if not subscriptions:
+                del self._subscriptions[address]
+                self._keys.discard(Keypair.from_address(address).raw_public_key())
+
+        if removed:
+            self.subscriber_count -= 1
+        if self.subscriber_count == 0:
+            self.stop()
+
+    def stop(self) -> None:
+        """Close the horizon stream"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, tx: dict) -> None:
+        """Push the payments in a transaction from horizon to their subscribers"""
+        try:
+            if not may_involve(tx['envelope_xdr'], self._keys):
+                return
+            payments = list(parse_payments(tx))
+        except Exception as e:
+            logger.debug(f'Skipping a transaction that could not be parsed: {e}')
+            return
+
+        for tx_hash, payment in payments:
+            # An account might send kin to itself, make sure the subscriber only gets the payment once
+            subscriptions = self._subscriptions.get(payment.source, set()) | \
+                self._subscriptions.get(payment.destination, set())
+            for subscription in subscriptions:
+                try:
+                    subscription.queue.put_nowait((tx_hash, payment))
+                    self.pushed_payments += 1
+                except asyncio.QueueFull:
+                    self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        logger.warning(f'Dropping a payment stream subscriber that is not keeping up')
+        self.dropped_subscribers += 1
+        self.unsubscribe(subscription)
+        # Make room to tell the subscriber it was closed
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    async def _run(self) -> None:
+        cursor = 'now'
+        while True:
+            try:
+                async for tx in await self.kin_client.horizon.transactions(cursor=cursor, sse=True):
+                    self.publish(tx)
+                    cursor = tx.get('paging_token', cursor)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'The payment stream failed, reconnecting in {RECONNECT_INTERVAL} seconds:\n'
+                             f'{prettify_exc(e)}')
+                await asyncio.sleep(RECONNECT_INTERVAL)
@@ -0,0 +1,177 @@
+"""Contains opt-in tracing of requests, exported as OTLP json"""
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .serialization import dumps
+
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger('bootstrap')
+
+SERVICE_NAME = 'kin-bootstrap'
+# OTLP span status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A timed operation in a trace, with the spans of its sub-operations as children"""
+
+    def __init__(self, exporter: 'FileSpanExporter', name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Dict[str, Any]):
+        self.exporter = exporter
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, name: str, value: Any) -> None:
+        self.attributes[name] = value
+
+    def set_error(self, message: str) -> None:
+        """Mark the operation as failed"""
+        self.error = message
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """Set the end time of the span, and export it"""
+        self.end_time = time.time_ns()
+        if error is not None:
+            self.set_error(f'{type(error).__name__}: {error}')
+        self.exporter.export(self)
+
+    def to_otlp(self) -> dict:
+        """Get the span in the OTLP json format"""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 2 if self.parent_id is None else 1,  # SERVER for the request, INTERNAL for the rest
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano': str(self.end_time),
+            'attributes': [{'key': key, 'value': _to_otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': STATUS_OK} if self.error is None else {'code': STATUS_ERROR, 'message': self.error},
+        }
+        if self.parent_id is not None:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _to_otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+# The span of the operation that is currently running, in this request
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class FileSpanExporter:
+    """
+    Write finished spans to a file, as lines of OTLP json (the format of the collector's otlpjsonfile receiver)
+
+    Spans are serialized and written by a background thread, in batches of whatever finished since the last write.
+    """
+
+    def __init__(self, path: str):
+        """:param path: The path of the file to append the spans to"""
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def stop(self) -> None:
+        """Write the spans that are still queued, and stop the background thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _get_batch(self) -> List[Optional[Span]]:
+        batch = [self._queue.get()]
+        while not self._queue.empty():
+            batch.append(self._queue.get())
+        return batch
+
+    def _run(self) -> None:
+        with open(self.path, 'ab') as file:
+            stopped = False
+            while not stopped:
+                batch = self._get_batch()
+                stopped = None in batch
+                spans = [span.to_otlp() for span in batch if span is not None]
+                if not spans:
+                    continue
+
+                request = {'resourceSpans': [{
+                    'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+                    'scopeSpans': [{'scope': {'name': 'bootstrap'}, 'spans': spans}]}]}
+                try:
+                    file.write(dumps(request) + b'\n')
+                    file.flush()
+                except Exception as e:
+                    logger.error(f'Failed to write {len(spans)} spans to {self.path}: {e}')
+
+
+class Tracer:
+    """Start a trace for a sample of the requests"""
+
+    def __init__(self, exporter: FileSpanExporter, sample_rate: float):
+        """
+        :param exporter: Exports the finished spans
+        :param sample_rate: Percent of the requests to trace
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name: str, attributes: Dict[str, Any]) -> Optional[Span]:
+        """
+        Start the root span of a request, and make it the current span
+
+        :return: The span, or None if the request was not sampled
+        """
+        span = None
+        if random.random() * 100 < self.sample_rate:
+            span = Span(self.exporter, name, os.urandom(16).hex(), None, attributes)
+        current_span.set(span)
+        return span
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Trace an operation as a child of the current span
+
+    Does nothing (and yields None) if the request is not traced.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.exporter, name, parent.trace_id, parent.span_id, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    else:
+        child.end()
+    finally:
+        current_span.reset(token)
@@ -0,0 +1,58 @@
+"""Contains fast, cached validation of the addresses and transaction hashes in requests"""
+import base64
+import binascii
+import string
+from functools import lru_cache
+
+from typing import Iterable, Optional
+
+# How many validation results to remember for each kind of value
+VALIDATION_CACHE_SIZE = 2 ** 16
+
+ADDRESS_LENGTH = 56
+ACCOUNT_VERSION_BYTE = 6 << 3  # Encodes to a 'G' prefix
+TX_HASH_LENGTH = 64
+HEX_DIGITS = frozenset(string.hexdigits)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _check_address(address: str) -> bool:
+    try:
+        decoded = base64.b32decode(address)
+    except ValueError:  # binascii.Error, or non ascii characters
+        return False
+    # The checksum is a CRC16-XModem of the version byte and the key, in little endian
+    return decoded[0] == ACCOUNT_VERSION_BYTE and \
+        binascii.crc_hqx(decoded[:-2], 0).to_bytes(2, 'little') == decoded[-2:]
+
+
+def is_valid_address(address: str) -> bool:
+    """
+    Check if a string is a valid public address
+
+    Same as kin's is_valid_address, without its extra decoding steps,
+    and with the results of recent addresses cached since the same destinations come back constantly.
+    """
+    # 56 base32 characters are exactly 35 bytes, so there are no padding bits to check
+    return type(address) is str and len(address) == ADDRESS_LENGTH and _check_address(address)
+
+
+def is_valid_transaction_hash(tx_hash: str) -> bool:
+    """Check if a string is a valid transaction hash, 64 hex characters"""
+    return type(tx_hash) is str and len(tx_hash) == TX_HASH_LENGTH and HEX_DIGITS.issuperset(tx_hash)
+
+
+def find_invalid_address(addresses: Iterable[str]) -> Optional[str]:
+    """Validate many addresses in a single pass, and get the first invalid one, if any"""
+    for address in addresses:
+        if not is_valid_address(address):
+            return address
+    return None
+
+
+def find_invalid_transaction_hash(tx_hashes: Iterable[str]) -> Optional[str]:
+    """Validate many transaction hashes in a single pass, and get the first invalid one, if any"""
+    for tx_hash in tx_hashes:
+        if not is_valid_transaction_hash(tx_hash):
+            return tx_hash
+    return None
@@ -0,0 +1,146 @@
+"""Contains the signer that whitelists transactions, away from the event loop"""
+import math
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import sha256
+
+from kin_base.keypair import Keypair
+from kin_base.transaction_envelope import TransactionEnvelope
+
+from .cache import WhitelistCache
+
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class WhitelistExecutors:
+    """Contains the kinds of executors transactions can be signed in"""
+    PROCESS = 'process'  # Sign in other processes, in parallel to the event loop
+    THREAD = 'thread'  # Sign in other threads, lighter but decoding the envelopes still holds the GIL
+
+
+class WhitelistErrors:
+    """Contains the reasons a transaction can't be whitelisted"""
+    WRONG_NETWORK = 'wrong_network'
+    CANT_DECODE = 'cant_decode'
+
+
+class WhitelistResult(NamedTuple):
+    """Either the whitelisted envelope, along with what the cache needs to expire it, or an error"""
+    tx_envelope: Optional[str]
+    error: Optional[str] = None  # One of WhitelistErrors
+    source: Optional[str] = None
+    sequence: int = 0
+    max_time: int = 0  # The upper time bound of the transaction, 0 if it has none
+
+
+class EnvelopeSigner:
+    """Sign transaction envelopes with the server's account, the same way KinAccount.whitelist_transaction does"""
+
+    def __init__(self, seed: str, passphrase: str):
+        self.keypair = Keypair.from_seed(seed)
+        self.passphrase = passphrase
+        self.network_id = sha256(passphrase.encode()).digest()
+
+    def sign(self, envelope_xdr: str, network_id: str) -> WhitelistResult:
+        if network_id != self.passphrase:
+            return WhitelistResult(None, WhitelistErrors.WRONG_NETWORK)
+        try:
+            envelope = TransactionEnvelope.from_xdr(envelope_xdr)
+            envelope.network_id = self.network_id
+            envelope.signatures.append(self.keypair.sign_decorated(envelope.hash_meta()))
+            tx = envelope.tx
+            source = tx.source.decode() if isinstance(tx.source, bytes) else tx.source
+            max_time = tx.time_bounds[0].maxTime if tx.time_bounds else 0
+            return WhitelistResult(envelope.xdr().decode(), None, source, tx.sequence, max_time)
+        except Exception:
+            return WhitelistResult(None, WhitelistErrors.CANT_DECODE)
+
+    def sign_many(self, payloads: List[Tuple[str, str]]) -> List[WhitelistResult]:
+        """Sign a list of (envelope, network id) pairs"""
+        return [self.sign(envelope_xdr, network_id) for envelope_xdr, network_id in payloads]
+
+
+# The signer of an executor process, set once when the process starts
+_process_signer: Optional[EnvelopeSigner] = None
+
+
+def _init_process_signer(seed: str, passphrase: str) -> None:
+    global _process_signer
+    _process_signer = EnvelopeSigner(seed, passphrase)
+
+
+def _sign_in_process(payloads: List[Tuple[str, str]]) -> List[WhitelistResult]:
+    return _process_signer.sign_many(payloads)
+
+
+class WhitelistSigner:
+    """
+    Whitelist transactions in an executor, so decoding and signing them doesn't block the event loop
+
+    A batch is split to one chunk per executor worker, so it is signed in parallel,
+    with a single round trip to each worker instead of one per transaction.
+    Envelopes that were already whitelisted are taken from the cache, without reaching the executor.
+    """
+
+    def __init__(self, seed: str, passphrase: str, executor: str, pool_size: int,
+                 cache: Optional[WhitelistCache] = None):
+        """
+        :param seed: The seed of the account to sign with
+        :param passphrase: The passphrase of the network the transactions must be for
+        :param executor: One of WhitelistExecutors
+        :param pool_size: The number of processes or threads to sign in
+        :param cache: The cache of whitelisted envelopes, if any
+
+        :raises: ValueError: if the executor is not one of WhitelistExecutors
+        """
+        if executor == WhitelistExecutors.PROCESS:
+            # Every process gets its signer once, instead of the seed being sent along with every call
+            self._executor = ProcessPoolExecutor(pool_size, initializer=_init_process_signer,
+                                                 initargs=(seed, passphrase))
+            self._sign_many = _sign_in_process
+        elif executor == WhitelistExecutors.THREAD:
+            self._executor = ThreadPoolExecutor(pool_size)
+            self._sign_many = EnvelopeSigner(seed, passphrase).sign_many
+        else:
+            raise ValueError(f'Unknown whitelist executor "{executor}"')
+        self.pool_size = pool_size
+        self.cache = cache
+
+    async def whitelist(self, envelope_xdr: str, network_id: str) -> WhitelistResult:
+        return (await self.whitelist_many([(envelope_xdr, network_id)]))[0]
+
+    async def whitelist_many(self, payloads: List[Tuple[str, str]]) -> List[WhitelistResult]:
+        """Whitelist a list of (envelope, network id) pairs, and get their results in the same order"""
+        if self.cache is None:
+            return await self._sign_many_in_executor(payloads)
+
+        keys = [WhitelistCache.get_key(envelope_xdr, network_id) for envelope_xdr, network_id in payloads]
+        results: List[Optional[WhitelistResult]] = [None] * len(payloads)
+        missing = []
+        for index, key in enumerate(keys):
+            tx_envelope = self.cache.get(key)
+            if tx_envelope is None:
+                missing.append(index)
+            else:
+                results[index] = WhitelistResult(tx_envelope)
+
+        signed = await self._sign_many_in_executor([payloads[index] for index in missing])
+        for index, result in zip(missing, signed):
+            results[index] = result
+            # Only whitelisted envelopes are cached, failed ones have no sequence or time bounds to expire by
+            if result.error is None:
+                self.cache.set(keys[index], result.tx_envelope, result.source, result.sequence, result.max_time)
+        return results
+
+    async def _sign_many_in_executor(self, payloads: List[Tuple[str, str]]) -> List[WhitelistResult]:
+        if not payloads:
+            return []
+        loop = asyncio.get_event_loop()
+        chunk_size = math.ceil(len(payloads) / self.pool_size)
+        chunks = [payloads[index:index + chunk_size] for index in range(0, len(payloads), chunk_size)]
+        chunks_results = await asyncio.gather(*[loop.run_in_executor(self._executor, self._sign_many, chunk)
+                                                for chunk in chunks])
+        return [result for chunk_results in chunks_results for result in chunk_results]
+
+    def close(self) -> None:
+        self._executor.shutdown()
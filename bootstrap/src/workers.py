@@ -0,0 +1,180 @@
+"""Contains the multi-process mode, where each worker process sends transactions on its own slice of the channels"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from signal import SIGINT, SIGTERM, Signals
+from socket import socket, SOL_SOCKET, SO_REUSEADDR
+
+from .account import BootstrapAccount
+from .channels import ChannelScheduler
+from .config import Settings
+from .helpers import prettify_exc
+from .horizon import create_kin_client
+from .log import init_logging
+from .scaling import create_channel_accounts, derive_channels, find_missing_channels
+
+from typing import Dict, List
+
+logger = logging.getLogger('bootstrap')
+
+# The channel stats that are summed across the workers, average_wait_time is averaged instead
+CHANNEL_STATS = ('total_channels', 'free_channels', 'non_free_channels', 'resting_channels', 'waiting_requests',
+                 'average_wait_time', 'rejected_requests')
+# How often (in seconds) each worker publishes its channel stats
+STATS_PUBLISH_INTERVAL = 1
+# How long to wait before trying to create the channels again
+CREATE_RETRY_INTERVAL = 5
+# How often (in seconds) to check if the workers are still running
+WORKER_POLL_INTERVAL = 1
+
+
+class WorkerStats:
+    """
+    The channel stats of all of the workers, in memory shared between the processes
+
+    Each worker only writes its own row, so no lock is needed.
+    A row might be read while it is being written, which is fine for stats.
+    """
+
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self._values = multiprocessing.Array('d', worker_count * len(CHANNEL_STATS), lock=False)
+
+    def publish(self, worker_index: int, channels_status: dict) -> None:
+        """Publish the channel stats of a worker"""
+        offset = worker_index * len(CHANNEL_STATS)
+        for index, name in enumerate(CHANNEL_STATS):
+            self._values[offset + index] = channels_status[name]
+
+    def aggregate(self) -> dict:
+        """Get the channel stats of all of the workers together"""
+        totals = dict.fromkeys(CHANNEL_STATS, 0)
+        for worker_index in range(self.worker_count):
+            offset = worker_index * len(CHANNEL_STATS)
+            for index, name in enumerate(CHANNEL_STATS):
+                totals[name] += self._values[offset + index]
+
+        status = {name: int(value) for name, value in totals.items()}
+        status['average_wait_time'] = totals['average_wait_time'] / self.worker_count
+        return status
+
+
+@dataclass
+class Worker:
+    """A worker process, and the stats it shares with the other workers"""
+    index: int
+    stats: WorkerStats
+
+
+def get_first_channel(worker_index: int, max_channels: int) -> int:
+    """Get the index of the first derived channel a worker owns, each worker can grow up to 'max_channels'"""
+    return worker_index * max_channels
+
+
+def get_worker_channels(config: Settings, worker_count: int) -> Dict[int, List[str]]:
+    """Get the seeds of the channels each worker starts with"""
+    first_channels = [get_first_channel(index, config.CHANNEL_MAX_COUNT) for index in range(worker_count)]
+    return {index: derive_channels(config.SEED, config.CHANNEL_SALT, first_channel,
+                                   first_channel + config.CHANNEL_COUNT)
+            for index, first_channel in enumerate(first_channels)}
+
+
+async def create_worker_channels(config: Settings, worker_count: int) -> None:
+    """
+    Create the channels that all of the workers start with, from a single process
+
+    Only this process uses the master account as a channel, so its sequence number is never shared.
+    """
+    kin_client = create_kin_client(config)
+    scheduler = ChannelScheduler([config.SEED],
+                                 max_waiters=config.CHANNEL_WAIT_QUEUE_SIZE,
+                                 wait_timeout=config.CHANNEL_WAIT_TIMEOUT,
+                                 failure_threshold=config.CHANNEL_FAILURE_THRESHOLD,
+                                 rest_time=config.CHANNEL_REST_TIME)
+    kin_account = BootstrapAccount(config.SEED, kin_client, scheduler, config.APP_ID)
+    channel_seeds = [seed for seeds in get_worker_channels(config, worker_count).values() for seed in seeds]
+
+    try:
+        while True:
+            try:
+                fee, missing_seeds = await asyncio.gather(
+                    kin_client.get_minimum_fee(),
+                    find_missing_channels(kin_client, channel_seeds, config.CHANNEL_LOOKUP_CONCURRENCY))
+                if missing_seeds:
+                    logger.info(f'Creating {len(missing_seeds)} channels for {worker_count} workers')
+                    await create_channel_accounts(kin_account, missing_seeds, config.CHANNEL_STARTING_BALANCE, fee)
+                logger.info(f'All {len(channel_seeds)} channels of {worker_count} workers exist')
+                return
+            except Exception as e:
+                logger.error(f'Failed to create the channels, retrying in {CREATE_RETRY_INTERVAL} seconds:\n'
+                             f'{prettify_exc(e)}')
+                await asyncio.sleep(CREATE_RETRY_INTERVAL)
+    finally:
+        await kin_client.close()
+
+
+def _run_worker(config: Settings, worker: Worker, sock: socket) -> None:
+    # Imported here to avoid a circular import, init imports the middlewares that use this module
+    from .init import init_app
+
+    app = init_app(config, worker)
+    app.run(access_log=False, sock=sock)
+
+
+def run_workers(config: Settings) -> None:
+    """
+    Serve the app from WORKERS processes that share the same socket, until they are stopped
+
+    Each worker sends transactions on its own slice of the channels,
+    while this process creates the channels the workers start with.
+
+    :raises: ValueError: if the workers' slices of the channels would overlap
+    """
+    # Each worker's slice is CHANNEL_MAX_COUNT channels long, starting more than that would use the next worker's
+    if config.CHANNEL_COUNT > config.CHANNEL_MAX_COUNT:
+        raise ValueError(f'CHANNEL_COUNT ({config.CHANNEL_COUNT}) can\'t be more than '
+                         f'CHANNEL_MAX_COUNT ({config.CHANNEL_MAX_COUNT})')
+
+    sock = socket()
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', config.PORT))
+    sock.set_inheritable(True)
+
+    stats = WorkerStats(config.WORKERS)
+    processes = []
+    for index in range(config.WORKERS):
+        process = multiprocessing.Process(target=_run_worker, args=(config, Worker(index, stats), sock),
+                                          name=f'worker-{index}', daemon=True)
+        process.start()
+        processes.append(process)
+
+    # Only set up logging after forking, the listener thread of the logs would not exist in the workers
+    init_logging(config.LOG_FORMAT)
+    logger.setLevel(config.LOG_LEVEL)
+    logger.info(f'Started {config.WORKERS} workers')
+
+    loop = asyncio.get_event_loop()
+    creation_task = loop.create_task(create_worker_channels(config, config.WORKERS))
+
+    def stop(signal_number: int) -> None:
+        logger.info(f'Received signal {Signals(signal_number).name}, stopping the workers')
+        creation_task.cancel()
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, SIGTERM)
+
+    for signal_number in (SIGINT, SIGTERM):
+        loop.add_signal_handler(signal_number, stop, signal_number)
+
+    async def supervise():
+        try:
+            await creation_task
+        except asyncio.CancelledError:
+            pass
+        while any(process.is_alive() for process in processes):
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+
+    loop.run_until_complete(supervise())
+    sock.close()
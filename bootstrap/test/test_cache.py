@@ -0,0 +1,118 @@
+import time
+import asyncio
+
+import sys
+sys.path.append("..")
+
+from src.cache import TTLCache, TransactionCache, WhitelistCache, SingleFlight
+
+
+def test_ttl_cache():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    value, age = cache.get('a')
+    assert value == 1
+    assert age < 60
+
+    # 'b' is the least recently used entry, so it should be evicted
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a')[0] == 1
+    assert cache.get('c')[0] == 3
+
+    cache.invalidate('a')
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(max_size=10, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.misses == 1
+
+    # A ttl of 0 disables the cache
+    cache = TTLCache(max_size=10, ttl=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_ttl_cache_generations():
+    cache = TTLCache(max_size=2, ttl=60)
+    generation = cache.get_generation('a')
+
+    # A value read before the key was invalidated is stale
+    cache.invalidate('a')
+    cache.set('a', 1, generation)
+    assert cache.get('a') is None
+
+    cache.set('a', 2, cache.get_generation('a'))
+    assert cache.get('a')[0] == 2
+
+    # Keys whose generations were dropped still get a newer generation than the one read before
+    generation = cache.get_generation('a')
+    cache.invalidate('b', 'c')
+    assert cache.get_generation('a') != generation
+
+
+def test_whitelist_cache():
+    cache = WhitelistCache(max_size=2)
+    key = WhitelistCache.get_key('envelope', 'network')
+    assert key != WhitelistCache.get_key('envelope', 'other network')
+
+    cache.set(key, 'signed', 'GA', sequence=5, max_time=0)
+    assert cache.get(key) == 'signed'
+
+    # A transaction with a later sequence for the same account was whitelisted, so the first one is stale
+    cache.set(WhitelistCache.get_key('later', 'network'), 'signed later', 'GA', sequence=6, max_time=0)
+    assert cache.get(key) is None
+    assert cache.get(WhitelistCache.get_key('later', 'network')) == 'signed later'
+
+    # Transactions past their time bounds can't be applied anymore
+    expired = WhitelistCache.get_key('expired', 'network')
+    cache.set(expired, 'signed expired', 'GB', sequence=1, max_time=int(time.time()) - 1)
+    assert cache.get(expired) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # A max_size of 0 disables the cache
+    cache = WhitelistCache(max_size=0)
+    cache.set(key, 'signed', 'GA', sequence=5, max_time=0)
+    assert cache.get(key) is None
+
+
+async def test_transaction_cache_disk(loop, tmpdir):
+    path = str(tmpdir.join('tx_cache.db'))
+    cache = TransactionCache(max_size=10, not_found_ttl=5, path=path)
+    await cache.set('tx', b'body')
+    cache.close()
+
+    # The responses are read back from the disk after a restart
+    cache = TransactionCache(max_size=10, not_found_ttl=5, path=path)
+    assert await cache.get('tx') == b'body'
+    assert await cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+async def test_single_flight(loop):
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def read(value):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(*[single_flight.do('a', lambda: read(1)) for _ in range(5)],
+                                   single_flight.do('b', lambda: read(2)))
+    assert results == [1, 1, 1, 1, 1, 2]
+    assert calls == 2
+    assert single_flight.shared_calls == 4
+
+    # Once the call is done, the next request makes a new call
+    assert await single_flight.do('a', lambda: read(3)) == 3
+    assert calls == 3
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from kin.utils import get_hd_channels
+
+import sys
+sys.path.append("..")
+
+from src import errors
+from src.channels import ChannelScheduler, ChannelStatuses
+from src.scaling import derive_channels
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+
+
+def get_scheduler(channel_count=2, max_waiters=10, wait_timeout=1.0, failure_threshold=2, rest_time=0.05):
+    return ChannelScheduler(get_hd_channels(SEED, 'test', channel_count),
+                            max_waiters=max_waiters,
+                            wait_timeout=wait_timeout,
+                            failure_threshold=failure_threshold,
+                            rest_time=rest_time)
+
+
+async def test_acquire_release(loop):
+    scheduler = get_scheduler()
+
+    first = await scheduler.acquire()
+    second = await scheduler.acquire()
+    assert first != second
+    assert scheduler.get_status()['free_channels'] == 0
+
+    # The next request waits in line until a channel is released
+    waiting = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+    assert scheduler.get_status()['waiting_requests'] == 1
+
+    scheduler.release(first)
+    assert await waiting == first
+    assert scheduler.channels[first].status == ChannelStatuses.TAKEN
+
+
+async def test_wait_queue_full(loop):
+    scheduler = get_scheduler(channel_count=1, max_waiters=1)
+    await scheduler.acquire()
+
+    waiting = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(errors.ChannelsBusyError):
+        await scheduler.acquire()
+
+    waiting.cancel()
+    assert scheduler.get_status()['rejected_requests'] == 1
+
+
+async def test_wait_timeout(loop):
+    scheduler = get_scheduler(channel_count=1, wait_timeout=0.01)
+    await scheduler.acquire()
+
+    with pytest.raises(errors.ChannelsBusyError):
+        await scheduler.acquire()
+
+    assert scheduler.get_status()['waiting_requests'] == 0
+    assert scheduler.get_status()['average_wait_time'] > 0
+
+
+async def test_rest_failing_channel(loop):
+    scheduler = get_scheduler(channel_count=1)
+
+    for _ in range(2):
+        async with scheduler.get_channel() as channel:
+            scheduler.report_failure(channel)
+
+    assert scheduler.channels[channel].status == ChannelStatuses.RESTING
+    assert scheduler.get_status()['resting_channels'] == 1
+
+    # The channel is used again after resting
+    assert await scheduler.acquire() == channel
+
+
+async def test_add_remove_channels(loop):
+    scheduler = get_scheduler(channel_count=1)
+    taken = await scheduler.acquire()
+
+    # A request waiting for a channel should get a newly added one
+    waiting = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+    new_seed = derive_channels(SEED, 'test', 5, 6)[0]
+    scheduler.add_channels([new_seed])
+    assert await waiting == new_seed
+
+    # Channels in use are only removed when they are released
+    scheduler.remove_channels([taken])
+    assert taken in scheduler.channels
+    scheduler.release(taken)
+    assert taken not in scheduler.channels
+
+
+def test_derive_channels():
+    # Should match the channels the kin-sdk generates
+    assert derive_channels(SEED, 'test', 0, 10) == get_hd_channels(SEED, 'test', 10)
+    assert derive_channels(SEED, 'test', 5, 10) == get_hd_channels(SEED, 'test', 10)[5:]
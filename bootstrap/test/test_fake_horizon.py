@@ -0,0 +1,107 @@
+import asyncio
+
+from kin_base.builder import Builder
+from kin_base.keypair import Keypair
+from kin_base.network import NETWORKS
+
+import sys
+sys.path.append("..")
+
+from bench.fake_horizon import FakeNetwork, QUARKS_PER_KIN
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+ADDRESS = Keypair.from_seed(SEED).address().decode()
+DESTINATION = 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6'
+NETWORKS['FAKE'] = 'fake network'
+
+
+def get_network(capacity=10):
+    network = FakeNetwork('fake network', ledger_time=1, capacity=capacity, base_fee=100)
+    network.fund(ADDRESS, 1000 * QUARKS_PER_KIN)
+    return network
+
+
+def build(network, sequence_offset=1, fee=100, create=None, pay=None):
+    builder = Builder(None, network_name='FAKE', fee=fee, secret=SEED,
+                      sequence=network.accounts[ADDRESS].sequence + sequence_offset)
+    if create is not None:
+        builder.append_create_account_op(DESTINATION, str(create))
+    if pay is not None:
+        builder.append_payment_op(DESTINATION, str(pay))
+    builder.sign()
+    return builder.gen_xdr().decode()
+
+
+def get_result_codes(body):
+    return body['extras']['result_codes']
+
+
+async def submit_and_close(network, *envelopes):
+    submissions = [asyncio.ensure_future(network.submit(envelope)) for envelope in envelopes]
+    await asyncio.sleep(0)
+    network.close_ledger()
+    return await asyncio.gather(*submissions)
+
+
+async def test_apply_on_ledger_close():
+    network = get_network()
+    submission = asyncio.ensure_future(network.submit(build(network, create=10)))
+    await asyncio.sleep(0)
+    assert not submission.done()
+    # The next transaction of the account is checked against the waiting one
+    second = asyncio.ensure_future(network.submit(build(network, sequence_offset=2, pay=5)))
+    await asyncio.sleep(0)
+
+    network.close_ledger()
+    (status, body), (second_status, _) = await asyncio.gather(submission, second)
+
+    assert status == second_status == 200
+    assert network.transactions[body['hash']] == body
+    assert network.accounts[DESTINATION].balance == 15 * QUARKS_PER_KIN
+    assert network.accounts[ADDRESS].balance == (1000 - 15) * QUARKS_PER_KIN - 200
+    assert network.ledgers[-1]['successful_transaction_count'] == 2
+
+    # Resubmitting returns the first result
+    assert (await network.submit(body['envelope_xdr'])) == (200, body)
+
+
+async def test_rejected_submissions():
+    network = get_network()
+
+    status, body = await network.submit(build(network, sequence_offset=2, create=10))
+    assert status == 400
+    assert get_result_codes(body) == {'transaction': 'tx_bad_seq'}
+
+    status, body = await network.submit(build(network, fee=10, create=10))
+    assert get_result_codes(body) == {'transaction': 'tx_insufficient_fee'}
+
+    status, body = await network.submit('not a transaction')
+    assert body['type'].endswith('transaction_malformed')
+
+
+async def test_failed_operations():
+    network = get_network()
+    balance = network.accounts[ADDRESS].balance
+
+    [(status, body)] = await submit_and_close(network, build(network, pay=5))
+
+    assert status == 400
+    assert get_result_codes(body) == {'transaction': 'tx_failed', 'operations': ['op_no_destination']}
+    # The fee and the sequence are used anyway
+    assert network.accounts[ADDRESS].balance == balance - 100
+    assert network.ledgers[-1]['failed_transaction_count'] == 1
+
+
+async def test_ledger_capacity():
+    network = get_network(capacity=1)
+    first = asyncio.ensure_future(network.submit(build(network, create=10)))
+    second = asyncio.ensure_future(network.submit(build(network, sequence_offset=2, pay=5)))
+    await asyncio.sleep(0)
+
+    # Only one transaction fits in a ledger, the other waits for the next one
+    network.close_ledger()
+    assert network.ledgers[-1]['successful_transaction_count'] == 1
+    network.close_ledger()
+    assert network.ledgers[-1]['successful_transaction_count'] == 1
+
+    assert [status for status, _ in await asyncio.gather(first, second)] == [200, 200]
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+import asynctest
+
+import sys
+sys.path.append("..")
+
+from src.fees import FeeManager, FeePolicies, get_capacity_usage
+
+
+def get_ledgers(base_fee, transaction_count, max_tx_set_size=100):
+    ledger = {'base_fee_in_stroops': base_fee, 'successful_transaction_count': transaction_count,
+              'failed_transaction_count': 0, 'max_tx_set_size': max_tx_set_size}
+    return {'_embedded': {'records': [ledger] * 10}}
+
+
+def get_fee_manager(policy, fixed_fee=0, surge_threshold=0.8, surge_multiplier=2.5, max_fee=400):
+    kin_client = asynctest.MagicMock()
+    kin_client.horizon.ledgers = asynctest.CoroutineMock(return_value=get_ledgers(100, 10))
+    return FeeManager(kin_client, policy, fixed_fee, surge_threshold=surge_threshold,
+                      surge_multiplier=surge_multiplier, max_fee=max_fee)
+
+
+def test_capacity_usage():
+    assert get_capacity_usage(get_ledgers(100, 25)['_embedded']['records']) == 0.25
+    assert get_capacity_usage([{'transaction_count': 3, 'failed_transaction_count': 1, 'max_tx_set_size': 8},
+                               {'transaction_count': 0, 'max_tx_set_size': 8}]) == 0.25
+    assert get_capacity_usage([]) == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        get_fee_manager('free')
+
+
+async def test_fixed_policy(loop):
+    fee_manager = get_fee_manager(FeePolicies.FIXED, fixed_fee=0)
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(200, 100)
+    await fee_manager.refresh()
+
+    assert fee_manager.fee == 0
+    assert fee_manager.minimum_fee == 200
+
+
+async def test_network_policy(loop):
+    fee_manager = get_fee_manager(FeePolicies.NETWORK)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 100
+
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(300, 100)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 300
+    assert fee_manager.capacity_usage == 1
+
+
+async def test_surge_policy(loop):
+    fee_manager = get_fee_manager(FeePolicies.SURGE)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 100
+
+    # Above the threshold the fee is multiplied
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(100, 80)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 250
+
+    # Up to the maximum fee
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(200, 90)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 400
+
+    # Unless the minimum fee is already higher
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(500, 90)
+    await fee_manager.refresh()
+    assert fee_manager.fee == 500
+
+
+async def test_refresher(loop):
+    fee_manager = get_fee_manager(FeePolicies.NETWORK)
+    fee_manager.kin_client.horizon.ledgers.side_effect = Exception('horizon is down')
+    fee_manager.start(0.01)
+
+    # The last known fee is kept when a refresh fails
+    await asyncio.sleep(0.05)
+    assert fee_manager.kin_client.horizon.ledgers.call_count > 0
+    assert fee_manager.fee == 100
+
+    fee_manager.kin_client.horizon.ledgers.side_effect = None
+    fee_manager.kin_client.horizon.ledgers.return_value = get_ledgers(200, 10)
+    await asyncio.sleep(0.05)
+    assert fee_manager.fee == 200
+
+    await fee_manager.stop()
+    assert fee_manager._task is None
@@ -0,0 +1,217 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+import asynctest
+from kin_base.exceptions import HorizonError, HorizonRequestError
+
+import sys
+sys.path.append("..")
+
+from src import horizon
+from src.config import Settings
+from src.horizon import FailoverHorizon, HorizonNode, PooledHorizon, create_kin_client, parse_endpoints
+
+NOT_FOUND = {'type': 'https://stellar.org/horizon-errors/not_found', 'status': 404, 'title': 'Resource Missing'}
+SERVER_ERROR = {'type': 'https://stellar.org/horizon-errors/server_error', 'status': 500, 'title': 'Internal Error'}
+
+
+@pytest.fixture
+def get_horizon(loop):
+    created = []
+
+    def create(node_count=3, failure_threshold=2, rest_time=60):
+        failover = _get_horizon(node_count, failure_threshold, rest_time)
+        created.append(failover)
+        return failover
+
+    yield create
+    for failover in created:
+        loop.run_until_complete(failover.close())
+
+
+def _get_horizon(node_count, failure_threshold, rest_time):
+    nodes = [HorizonNode(PooledHorizon(f'http://horizon-{index}', pool_size=10, keepalive_timeout=10,
+                                       connect_timeout=1, request_timeout=5, num_retries=0),
+                         failure_threshold=failure_threshold, rest_time=rest_time)
+             for index in range(node_count)]
+    for node in nodes:
+        node.horizon.query = asynctest.CoroutineMock(return_value={'uri': node.uri})
+        node.horizon.submit = asynctest.CoroutineMock(return_value={'hash': node.uri})
+    return FailoverHorizon(nodes)
+
+
+@pytest.fixture
+def no_probes(monkeypatch):
+    monkeypatch.setattr(horizon, 'PROBE_RATE', 0)
+
+
+class FakeClock:
+    """Stands in for the time module of the horizon nodes, so time only passes when a test moves it"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(horizon, 'time', clock)
+    return clock
+
+
+def test_parse_endpoints():
+    assert parse_endpoints('http://a') == ['http://a']
+    assert parse_endpoints('http://a, http://b,,') == ['http://a', 'http://b']
+
+
+async def test_read_fastest_node(get_horizon, no_probes):
+    failover = get_horizon()
+    failover.nodes[0].latency = 0.3
+    failover.nodes[1].latency = 0.1
+    failover.nodes[2].latency = 0.2
+
+    assert await failover.query('/accounts/1') == {'uri': 'http://horizon-1'}
+    assert [node.uri for node in failover.get_read_nodes()] == \
+        ['http://horizon-1', 'http://horizon-2', 'http://horizon-0']
+
+
+async def test_latency_ewma(get_horizon):
+    node = get_horizon().nodes[0]
+    node.report_success(1)
+    assert node.latency == 1
+    node.report_success(0)
+    assert node.latency == pytest.approx(1 - horizon.LATENCY_EWMA_WEIGHT)
+
+
+async def test_read_failover(get_horizon, no_probes):
+    failover = get_horizon()
+    for index, node in enumerate(failover.nodes):
+        node.latency = index
+    failover.nodes[0].horizon.query.side_effect = asyncio.TimeoutError
+    failover.nodes[1].horizon.query.side_effect = HorizonError(SERVER_ERROR)
+
+    assert await failover.query('/accounts/1') == {'uri': 'http://horizon-2'}
+    assert failover.nodes[0].failures == failover.nodes[1].failures == 1
+    assert failover.nodes[2].failures == 0
+
+
+async def test_read_request_error_not_failed_over(get_horizon, no_probes):
+    failover = get_horizon()
+    failover.nodes[0].horizon.query.side_effect = HorizonError(NOT_FOUND)
+
+    with pytest.raises(HorizonError):
+        await failover.query('/accounts/1')
+    assert failover.nodes[0].failures == 0
+    # A missing resource is missing on every node
+    assert failover.nodes[1].horizon.query.call_count == 0
+
+
+async def test_read_all_nodes_failed(get_horizon):
+    failover = get_horizon(node_count=2)
+    for node in failover.nodes:
+        node.horizon.query.side_effect = HorizonRequestError('connection refused')
+
+    with pytest.raises(HorizonRequestError):
+        await failover.query('/accounts/1')
+    assert all(node.horizon.query.call_count == 1 for node in failover.nodes)
+
+
+async def test_circuit_breaker(get_horizon, no_probes, clock):
+    failover = get_horizon(failure_threshold=2, rest_time=60)
+    failover.nodes[0].horizon.query.side_effect = asyncio.TimeoutError
+
+    await failover.query('/accounts/1')
+    assert failover.nodes[0].is_available()
+    await failover.query('/accounts/1')
+    assert not failover.nodes[0].is_available()
+
+    # The resting node is only tried last
+    await failover.query('/accounts/1')
+    assert failover.nodes[0].horizon.query.call_count == 2
+    assert failover.get_read_nodes()[-1] is failover.nodes[0]
+
+    # After resting, a single failure rests the node again
+    clock.now += 59
+    assert not failover.nodes[0].is_available()
+    clock.now += 1
+    assert failover.nodes[0].is_available()
+    failover.nodes[0].latency = None
+    await failover.query('/accounts/1')
+    assert not failover.nodes[0].is_available()
+
+    clock.now += 60
+    failover.nodes[0].horizon.query.side_effect = None
+    failover.nodes[0].latency = None
+    assert await failover.query('/accounts/1') == {'uri': 'http://horizon-0'}
+    assert failover.nodes[0].failures == 0
+
+
+async def test_submit_sticky(get_horizon, no_probes):
+    failover = get_horizon(failure_threshold=1)
+    failover.nodes[0].latency = 1
+    failover.nodes[1].latency = 0.1
+
+    # Submissions go to the first node, even if it is slower
+    assert await failover.submit('te') == {'hash': 'http://horizon-0'}
+
+    # Submissions are not failed over, but move to the next node once the node is resting
+    failover.nodes[0].horizon.submit.side_effect = HorizonRequestError('connection refused')
+    with pytest.raises(HorizonRequestError):
+        await failover.submit('te')
+    assert failover.nodes[1].horizon.submit.call_count == 0
+    assert await failover.submit('te') == {'hash': 'http://horizon-1'}
+    assert str(failover.horizon_uri) == 'http://horizon-1'
+
+    # And stay there after the first node recovers
+    failover.nodes[0].rest_until = 0
+    assert await failover.submit('te') == {'hash': 'http://horizon-1'}
+
+
+async def test_kin_client(loop):
+    config = Settings(HORIZON_ENDPOINT='http://horizon-0,http://horizon-1', HORIZON_POOL_SIZE=7,
+                      HORIZON_REQUEST_TIMEOUT=4)
+    kin_client = create_kin_client(config)
+
+    assert [node.uri for node in kin_client.horizon.nodes] == ['http://horizon-0', 'http://horizon-1']
+    assert kin_client.environment.horizon_uri == 'http://horizon-0'
+    assert kin_client.horizon._session.connector.limit == 7
+    assert kin_client.horizon._session._timeout.total == 4
+    await kin_client.close()
+
+
+class FakeEventSource:
+    """Streams a single event with the id after its cursor, and records the cursors it was opened with"""
+    cursors = []
+
+    def __init__(self, url, session, params, headers):
+        self.cursor = int(params['cursor'])
+        self._reconnection_time = timedelta(seconds=0.1)
+        FakeEventSource.cursors.append(params['cursor'])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def __aiter__(self):
+        paging_token = str(self.cursor + 1)
+        yield asynctest.Mock(last_event_id=paging_token, data=f'{{"paging_token": "{paging_token}"}}')
+
+
+async def test_stream_cursor(loop, monkeypatch):
+    monkeypatch.setattr(horizon, 'EventSource', FakeEventSource)
+    monkeypatch.setattr(FakeEventSource, 'cursors', [])
+    node = PooledHorizon('http://horizon-0', pool_size=1, keepalive_timeout=1, connect_timeout=1,
+                         request_timeout=1, num_retries=0)
+
+    # The stream starts from the cursor, and resumes from the last event when it ends
+    stream = await node.transactions(cursor='123', sse=True)
+    assert await stream.__anext__() == {'paging_token': '124'}
+    assert await stream.__anext__() == {'paging_token': '125'}
+    assert FakeEventSource.cursors == ['123', '124']
+    await node.close()
@@ -0,0 +1,46 @@
+import json
+import logging
+
+import sys
+sys.path.append("..")
+
+from src import log
+
+
+def get_record(message: str, fields: dict = None) -> logging.LogRecord:
+    record = logging.LogRecord('bootstrap', logging.INFO, __file__, 1, message, None, None)
+    if fields is not None:
+        record.fields = fields
+    return log.request_id_filter(record)
+
+
+def test_format_body():
+    assert log.format_body(b'{"a":1}') == '{"a":1}'
+    assert log.format_body(b'{"a":1}', 3) == '{"a... (7 bytes)'
+    assert log.format_body(b'{"a":1}', 100) == '{"a":1}'
+    assert log.format_body(b'\xff') == '�'
+
+
+def test_json_formatter():
+    log.req_id.set('abcd1234')
+    entry = json.loads(log.JsonFormatter().format(get_record('Got request', {'method': 'POST', 'body': '{}'})))
+    assert entry['message'] == 'Got request'
+    assert entry['request_id'] == 'abcd1234'
+    assert entry['level'] == 'INFO'
+    assert entry['method'] == 'POST'
+    assert entry['body'] == '{}'
+
+
+def test_text_formatter():
+    formatted = log.TextFormatter().format(get_record('Got request', {'method': 'POST'}))
+    assert formatted.endswith('| Got request\nmethod: POST')
+    assert log.TextFormatter().format(get_record('Got request')).endswith('| Got request')
+
+
+def test_local_queue_handler():
+    """The records should be queued as they are, to be formatted on the listener's thread"""
+    handler = log.LocalQueueHandler(None)
+    record = get_record('Got request %s', None)
+    record.args = ('POST',)
+    assert handler.prepare(record) is record
+    assert record.args == ('POST',)
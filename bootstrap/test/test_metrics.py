@@ -0,0 +1,48 @@
+import sys
+sys.path.append("..")
+
+from src import metrics
+
+
+def test_counter():
+    counter = metrics.Counter('errors_total', 'Errors', ('code',))
+    counter.inc('4001')
+    counter.inc('4001')
+    counter.inc('5000', amount=3)
+    assert counter.get('4001') == 2
+    assert list(counter.render()) == ['# HELP errors_total Errors',
+                                      '# TYPE errors_total counter',
+                                      'errors_total{code="4001"} 2',
+                                      'errors_total{code="5000"} 3']
+
+
+def test_histogram():
+    histogram = metrics.Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+    histogram.observe(0.05, '/pay')
+    histogram.observe(0.1, '/pay')
+    histogram.observe(0.5, '/pay')
+    histogram.observe(5, '/pay')
+    assert histogram.get_count('/pay') == 4
+    assert list(histogram.render()) == ['# HELP latency_seconds Latency',
+                                        '# TYPE latency_seconds histogram',
+                                        'latency_seconds_bucket{route="/pay",le="0.1"} 2',
+                                        'latency_seconds_bucket{route="/pay",le="1"} 3',
+                                        'latency_seconds_bucket{route="/pay",le="+Inf"} 4',
+                                        'latency_seconds_sum{route="/pay"} 5.65',
+                                        'latency_seconds_count{route="/pay"} 4']
+
+
+def test_histogram_time():
+    histogram = metrics.Histogram('latency_seconds', 'Latency', ('method',))
+    try:
+        with histogram.time('send_kin'):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert histogram.get_count('send_kin') == 1
+
+
+def test_escape_labels():
+    counter = metrics.Counter('errors_total', 'Errors', ('path',))
+    counter.inc('/a"b\\c')
+    assert list(counter.render())[-1] == 'errors_total{path="/a\\"b\\\\c"} 1'
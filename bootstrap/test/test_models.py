@@ -3,7 +3,9 @@ import pytest
 import sys
 sys.path.append("..")
 
-from src import errors, requets_models
+from dataclasses import asdict
+
+from src import errors, requets_models, responses_models
 
 
 def test_from_json():
@@ -65,6 +67,29 @@ def test_payment_request():
                                       memo='a' * 50)
 
 
+def test_batch_payment_request():
+    # Check nothing is raised
+    requets_models.BatchPaymentRequest(payments=[{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                                  'amount': 10}],
+                                       memo=None)
+
+    # Check validations
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.BatchPaymentRequest(payments=[], memo=None)
+
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.BatchPaymentRequest(payments=[{'destination': 'blabla', 'amount': 10}], memo=None)
+
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.BatchPaymentRequest(payments=[{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                                      'amount': 0}],
+                                           memo=None)
+
+    with pytest.raises(errors.MissingParamError):
+        requets_models.BatchPaymentRequest(payments=[{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G'}],
+                                           memo=None)
+
+
 def test_creation_request():
     # Check nothing is raised
     requets_models.CreationRequest(destination='GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
@@ -101,6 +126,18 @@ def test_balance_request():
         requets_models.BalanceRequest(address='qwewq')
 
 
+def test_bulk_balance_request():
+    # Check nothing is raised
+    requets_models.BulkBalanceRequest(addresses=['GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G'])
+
+    # Check validations
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.BulkBalanceRequest(addresses=[])
+
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.BulkBalanceRequest(addresses=['GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'qwewq'])
+
+
 def test_transaction_info_request():
     # Check nothing is raised
     requets_models.TransactionInfoRequest(tx_hash='e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f46'
@@ -108,4 +145,101 @@ def test_transaction_info_request():
 
     # Check validations
     with pytest.raises(errors.InvalidParamError):
-        requets_models.TransactionInfoRequest(tx_hash='abcdefg')
\ No newline at end of file
+        requets_models.TransactionInfoRequest(tx_hash='abcdefg')
+
+
+def test_payments_lookup_request():
+    # Check nothing is raised
+    requets_models.PaymentsLookupRequest(tx_hashes=['e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d56'])
+
+    # Check validations
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.PaymentsLookupRequest(tx_hashes=[])
+
+    with pytest.raises(errors.InvalidParamError):
+        requets_models.PaymentsLookupRequest(tx_hashes=['abcdefg'])
+
+
+def test_from_json_bytes():
+    from_bytes = requets_models.BalanceRequest.from_json(b'{"address":"GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G"}')
+    assert from_bytes.address == 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G'
+
+    with pytest.raises(errors.InvalidBodyError):
+        requets_models.BalanceRequest.from_json(b'\xff')
+
+
+@pytest.mark.parametrize('model, body', [
+    (requets_models.PaymentRequest, {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                     'amount': 5}),
+    (requets_models.PaymentRequest, {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                     'amount': 5.5, 'memo': 'abc'}),
+    (requets_models.PaymentRequest, {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                     'amount': 5, 'memo': None}),
+    (requets_models.CreationRequest, {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                      'starting_balance': 0}),
+])
+def test_fast_parser(model, body):
+    fast = requets_models.FAST_PARSERS[model](body)
+    assert fast == model(**body)
+    assert fast.__fields_set__ == model(**body).__fields_set__
+    assert isinstance(fast.__values__[list(body)[1]], float)
+
+
+@pytest.mark.parametrize('body', [
+    {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': -1},
+    {'destination': 'qwe', 'amount': 5},
+    {'destination': 'qwe', 'amount': -1},
+    {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5, 'memo': 'a' * 30},
+    {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': '5'},
+    {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': True},
+    {'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5, 'extra': 1},
+    {'amount': 5},
+])
+def test_fast_parser_errors(body):
+    """The precompiled parser should not change the result of any request"""
+    def get_result(func):
+        try:
+            return func()
+        except errors.BootstrapError as e:
+            return type(e), e.to_dict()
+
+    full_result = get_result(lambda: requets_models.PaymentRequest(**body))
+    assert get_result(lambda: requets_models.PaymentRequest.from_dict(body)) == full_result
+
+
+def test_to_response_dict():
+    flat = responses_models.PaymentInfoResponse('GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                                'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                                5, None, 1548675452)
+    assert flat.to_response_dict() == asdict(flat)
+
+    result = responses_models.BatchPaymentResult('GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G',
+                                                 5, 'abc', None)
+    nested = responses_models.BatchPaymentResponse([result])
+    assert nested.to_response_dict() == {'results': [result.to_response_dict()]}
+
+
+@pytest.mark.parametrize('body', [
+    {'payments': [{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5}] * 3,
+     'memo': 'abc'},
+    {'payments': []},
+    {'payments': [{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5},
+                  {'destination': 'qwe', 'amount': 5}]},
+    {'payments': [{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 'abc'},
+                  {'destination': 'qwe', 'amount': 5}]},
+    {'payments': [{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5,
+                   'memo': 'abc'}]},
+    {'payments': [{'destination': 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G', 'amount': 5}],
+     'memo': 'a' * 30},
+    {'payments': 'abc'},
+])
+def test_fast_parser_batch(body):
+    """The precompiled parser should not change the result of a batch request"""
+    def get_result(func):
+        try:
+            return func().dict()
+        except errors.BootstrapError as e:
+            return type(e), e.to_dict()
+
+    full_result = get_result(lambda: requets_models.BatchPaymentRequest(**body))
+    assert get_result(lambda: requets_models.BatchPaymentRequest.from_dict(body)) == full_result
@@ -0,0 +1,153 @@
+import pytest
+import asynctest
+import kin
+from kin_base.exceptions import HorizonRequestError
+
+import sys
+sys.path.append("..")
+
+from src.account import BootstrapAccount
+from src.channels import ChannelScheduler
+from src.retries import RetryPolicy, RetryReasons, RetryOutcomes, get_retry_reason
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+DESTINATION = 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6'
+TX_HASH = '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+
+
+def get_tx_error(result_code):
+    return kin.KinErrors.HorizonError({
+        'type': 'https://stellar.org/horizon-errors/transaction_failed',
+        'status': 400,
+        'extras': {'result_codes': {'transaction': result_code}}
+    })
+
+
+NOT_FOUND = kin.KinErrors.HorizonError({'type': 'https://stellar.org/horizon-errors/not_found', 'status': 404})
+TIMEOUT = kin.KinErrors.HorizonError({'type': 'https://stellar.org/horizon-errors/timeout', 'status': 504})
+
+
+@pytest.fixture
+def account(loop):
+    kin_client = kin.KinClient(kin.Environment('CUSTOM', 'http://localhost:8000', 'test'))
+    scheduler = ChannelScheduler([SEED], max_waiters=10, wait_timeout=1, failure_threshold=5, rest_time=1)
+    account = BootstrapAccount(SEED, kin_client, scheduler, 'anon',
+                               retry_policy=RetryPolicy(max_retries=2, backoff=0.01, deadline=5))
+    account.channel_manager.channels[SEED].sequence = 5
+    kin_client.horizon.submit = asynctest.CoroutineMock()
+    kin_client.horizon.account = asynctest.CoroutineMock()
+    kin_client.horizon.transaction = asynctest.CoroutineMock()
+    yield account
+    loop.run_until_complete(kin_client.close())
+
+
+def submitted_envelopes(account):
+    return [call[0][0] for call in account._client.horizon.submit.call_args_list]
+
+
+def test_retry_reason():
+    assert get_retry_reason(get_tx_error('tx_bad_seq')) == RetryReasons.BAD_SEQUENCE
+    assert get_retry_reason(TIMEOUT) == RetryReasons.TRANSIENT
+    assert get_retry_reason(HorizonRequestError('connection refused')) == RetryReasons.TRANSIENT
+    assert get_retry_reason(get_tx_error('tx_failed')) is None
+    assert get_retry_reason(NOT_FOUND) is None
+    assert get_retry_reason(ValueError()) is None
+
+
+async def test_bad_sequence(account):
+    account._client.horizon.submit.side_effect = [get_tx_error('tx_bad_seq'), {'hash': TX_HASH}]
+    account._client.horizon.account.return_value = {'sequence': '10'}
+
+    assert await account.send_kin(DESTINATION, 10, 100) == TX_HASH
+
+    # Signed again with the resynced sequence
+    first, second = submitted_envelopes(account)
+    assert first != second
+    assert account.channel_manager.channels[SEED].sequence == 11
+    assert account.retry_policy.retries == {RetryReasons.BAD_SEQUENCE: 1, RetryReasons.TRANSIENT: 0}
+    assert account.retry_policy.outcomes[RetryOutcomes.SUCCEEDED] == 1
+
+
+async def test_transient_error(account):
+    account._client.horizon.submit.side_effect = [HorizonRequestError('connection refused'), TIMEOUT,
+                                                  {'hash': TX_HASH}]
+
+    assert await account.send_kin(DESTINATION, 10, 100) == TX_HASH
+
+    # The same transaction is submitted again, without signing it again
+    first, second, third = submitted_envelopes(account)
+    assert first == second == third
+    assert account.channel_manager.channels[SEED].sequence == 6
+    assert account.retry_policy.retries[RetryReasons.TRANSIENT] == 2
+    assert account.retry_policy.outcomes[RetryOutcomes.SUCCEEDED] == 1
+
+
+async def test_transient_then_applied(account):
+    # The first submission timed out but was applied, so the second one has a bad sequence
+    account._client.horizon.submit.side_effect = [TIMEOUT, get_tx_error('tx_bad_seq')]
+    account._client.horizon.account.return_value = {'sequence': '6'}
+    account._client.horizon.transaction.return_value = {'hash': TX_HASH}
+
+    tx_hash = await account.send_kin(DESTINATION, 10, 100)
+
+    assert account._client.horizon.transaction.call_args[0][0] == tx_hash
+    assert len(set(submitted_envelopes(account))) == 1
+    assert account.channel_manager.channels[SEED].sequence == 6
+    assert account.retry_policy.outcomes[RetryOutcomes.FOUND] == 1
+
+
+async def test_transient_then_sequence_used(account):
+    # The sequence was used, but not by the transaction (or horizon didn't see it yet)
+    account._client.horizon.submit.side_effect = [TIMEOUT, get_tx_error('tx_bad_seq')]
+    account._client.horizon.account.return_value = {'sequence': '6'}
+    account._client.horizon.transaction.side_effect = NOT_FOUND
+
+    with pytest.raises(kin.KinErrors.RequestError):
+        await account.send_kin(DESTINATION, 10, 100)
+
+    # Never signed again
+    assert len(set(submitted_envelopes(account))) == 1
+    assert account.retry_policy.outcomes[RetryOutcomes.FAILED] == 1
+
+
+async def test_transient_then_same_sequence(account):
+    # The sequence was not used, and signing again with the same sequence can't apply the transaction twice
+    account.channel_manager.channels[SEED].sequence = 7
+    account._client.horizon.submit.side_effect = [TIMEOUT, get_tx_error('tx_bad_seq'), {'hash': TX_HASH}]
+    account._client.horizon.account.return_value = {'sequence': '7'}
+
+    assert await account.send_kin(DESTINATION, 10, 100) == TX_HASH
+    assert account._client.horizon.transaction.call_count == 0
+    assert account.channel_manager.channels[SEED].sequence == 8
+
+
+async def test_retries_exhausted(account):
+    account._client.horizon.submit.side_effect = TIMEOUT
+
+    with pytest.raises(kin.KinErrors.ServerError):
+        await account.send_kin(DESTINATION, 10, 100)
+
+    assert account._client.horizon.submit.call_count == 3
+    assert account.retry_policy.outcomes[RetryOutcomes.EXHAUSTED] == 1
+    # The channel's sequence can't be trusted anymore
+    assert account.channel_manager.channels[SEED].sequence is None
+
+
+async def test_retry_deadline(account):
+    account.retry_policy.deadline = 0
+    account._client.horizon.submit.side_effect = HorizonRequestError('connection refused')
+
+    with pytest.raises(HorizonRequestError):
+        await account.send_kin(DESTINATION, 10, 100)
+    assert account._client.horizon.submit.call_count == 1
+    # Not retried, so not counted
+    assert sum(account.retry_policy.outcomes.values()) == 0
+
+
+async def test_not_retried(account):
+    account._client.horizon.submit.side_effect = get_tx_error('tx_too_late')
+
+    with pytest.raises(kin.KinErrors.RequestError):
+        await account.send_kin(DESTINATION, 10, 100)
+    assert account._client.horizon.submit.call_count == 1
+    assert sum(account.retry_policy.retries.values()) == 0
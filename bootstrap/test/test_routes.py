@@ -1,8 +1,11 @@
 import json
+import asyncio
+import threading
 
 import kin
 import pytest
 import asynctest
+from sanic.request import RequestParameters
 
 import sys
 sys.path.append("..")
@@ -10,11 +13,21 @@ sys.path.append("..")
 from src.init import init_app, VERSION
 from src import errors
 from src.config import Settings
+from src.batching import PaymentBatcher
+from src.cache import TTLCache, TransactionCache
+from src.channels import ChannelScheduler
+from src.idempotency import IdempotencyStore
+from src.journal import Journal
+from src.requets_models import PaymentRequest
+from src.scaling import bootstrap_channels, derive_channels
+from src.tracing import Tracer, FileSpanExporter
+from src.workers import Worker, WorkerStats
+
+import test_streaming
 
 app = init_app(Settings())
 # Remove the setup_kin_with_network listener, we dont want to make calls to the blockchain in tests
 del app.listeners['before_server_start'][1]
-app.minimum_fee = 100
 
 
 @pytest.fixture
@@ -22,6 +35,13 @@ def test_cli(loop, test_client):
     return loop.run_until_complete(test_client(app))
 
 
+def get_ledgers(base_fee, transaction_count=10, max_tx_set_size=500):
+    """Get a horizon response with the latest ledgers"""
+    ledger = {'base_fee_in_stroops': base_fee, 'successful_transaction_count': transaction_count,
+              'failed_transaction_count': 0, 'max_tx_set_size': max_tx_set_size}
+    return {'_embedded': {'records': [ledger] * 10}}
+
+
 # Balance
 
 async def test_balance(test_cli):
@@ -43,6 +63,106 @@ async def test_balance_not_found(test_cli):
 
     assert balance_resp == errors.AccountNotFoundError(address).to_dict()
 
+
+async def test_balance_cached(test_cli):
+    address = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+    app.balance_cache = TTLCache(10, 60)
+    # Mock response
+    app.kin_client.get_account_balance = asynctest.CoroutineMock(return_value=50)
+    app.kin_account.send_kin = asynctest.CoroutineMock(
+        return_value='2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872')
+
+    for _ in range(3):
+        balance_resp = await test_cli.get(f'/balance/{address}')
+        assert (await balance_resp.json())['balance'] == 50
+        assert balance_resp.headers['Age'] == '0'
+
+    assert app.kin_client.get_account_balance.call_count == 1
+
+    # Paying to the address should invalidate its balance
+    await test_cli.post('/pay', json={'destination': address, 'amount': 15})
+    await test_cli.get(f'/balance/{address}')
+    app.balance_cache = TTLCache(10, 0)
+
+    assert app.kin_client.get_account_balance.call_count == 2
+
+
+async def test_balance_single_flight(test_cli):
+    address = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+
+    # Mock response
+    async def get_account_balance(address):
+        await asyncio.sleep(0.05)
+        return 50
+    app.kin_client.get_account_balance = asynctest.CoroutineMock(side_effect=get_account_balance)
+
+    balance_resps = await asyncio.gather(*[test_cli.get(f'/balance/{address}') for _ in range(5)])
+
+    for balance_resp in balance_resps:
+        assert (await balance_resp.json())['balance'] == 50
+    # Concurrent requests should share a single call to horizon
+    assert app.kin_client.get_account_balance.call_count == 1
+
+
+async def test_balance_read_during_payment(test_cli):
+    address = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+    app.balance_cache = TTLCache(10, 60)
+    balances = [50, 65]
+    read_started = asyncio.Event()
+    release_read = asyncio.Event()
+
+    # Mock response
+    async def get_account_balance(address):
+        balance = balances.pop(0)
+        read_started.set()
+        await release_read.wait()
+        return balance
+    app.kin_client.get_account_balance = asynctest.CoroutineMock(side_effect=get_account_balance)
+    app.kin_account.send_kin = asynctest.CoroutineMock(
+        return_value='2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872')
+
+    try:
+        # The balance is read before the payment, but the read finishes after it
+        stale_read = asyncio.ensure_future(test_cli.get(f'/balance/{address}'))
+        await read_started.wait()
+        await test_cli.post('/pay', json={'destination': address, 'amount': 15})
+        release_read.set()
+        assert (await (await stale_read).json())['balance'] == 50
+
+        # The stale balance should not be cached
+        balance_resp = await test_cli.get(f'/balance/{address}')
+        assert (await balance_resp.json())['balance'] == 65
+        assert app.kin_client.get_account_balance.call_count == 2
+    finally:
+        app.balance_cache = TTLCache(10, 0)
+
+
+async def test_balances(test_cli):
+    existing = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+    missing = 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G'
+
+    # Mock response
+    async def get_account_balance(address):
+        if address == missing:
+            raise kin.KinErrors.AccountNotFoundError
+        return 50
+    app.kin_client.get_account_balance = asynctest.CoroutineMock(side_effect=get_account_balance)
+
+    balances_resp = await (await test_cli.post('/balances', json={'addresses': [existing, missing, existing]})).json()
+
+    assert balances_resp == {'balances': {
+        existing: {'balance': 50, 'error': None},
+        missing: {'balance': None, 'error': errors.AccountNotFoundError(missing).to_dict()}
+    }}
+    assert app.kin_client.get_account_balance.call_count == 2
+
+
+async def test_balances_invalid(test_cli):
+    balances_resp = await (await test_cli.post('/balances', json={'addresses': ['qwewq']})).json()
+
+    assert balances_resp == errors.InvalidParamError("Address 'qwewq' is not a valid public address").to_dict()
+
+
 # Payment info
 
 
@@ -106,6 +226,31 @@ async def test_tx_info(test_cli):
     assert tx_info_resp['timestamp'] == 1555329965
 
 
+async def test_tx_info_cached(test_cli, tmpdir):
+    tx_hash = '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    tx_info = {'source': 'GDAIEO6OIKIR3UYS6O547MANCV3DHDJKY5FC3QRW26FQFV76PNLY5Y2Q',
+               'destination': 'GARY2346NSTEI2WGYTC3ULQDJGJJ4EPP3IPTYLM7QWNWEPCEGA2EQJK5',
+               'amount': 10, 'memo': '1-xnXb-33a7c05eda014bfd', 'timestamp': 1555329965}
+    # Mock response
+    operation = asynctest.Mock(type=kin.OperationTypes.PAYMENT, destination=tx_info['destination'],
+                               amount=tx_info['amount'])
+    app.kin_client.get_transaction_data = asynctest.CoroutineMock(return_value=asynctest.Mock(
+        source=tx_info['source'], memo=tx_info['memo'], timestamp='2019-04-15T12:06:05Z', operation=operation))
+    app.tx_cache = TransactionCache(10, 5, str(tmpdir.join('tx_cache.db')))
+
+    for _ in range(2):
+        tx_info_resp = await (await test_cli.get(f'/payment/{tx_hash}')).json()
+        assert tx_info_resp == tx_info
+    assert app.kin_client.get_transaction_data.call_count == 1
+
+    # The response should also be stored on disk
+    app.tx_cache.close()
+    app.tx_cache = TransactionCache(10, 5, str(tmpdir.join('tx_cache.db')))
+    tx_info_resp = await (await test_cli.get(f'/payment/{tx_hash}')).json()
+    assert tx_info_resp == tx_info
+    assert app.kin_client.get_transaction_data.call_count == 1
+
+
 async def test_tx_info_invalid(test_cli):
     # Mock response
     tx_response = json.loads("""{
@@ -172,6 +317,88 @@ async def test_tx_info_not_found(test_cli):
     assert tx_info_resp == errors.TransactionNotFoundError\
         ('2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872').to_dict()
 
+    # Transactions that were not found are cached for a short time
+    await test_cli.get('/payment/2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872')
+    assert app.kin_client.get_transaction_data.call_count == 1
+
+
+def mock_payments_lookup():
+    """Mock a transaction that is a payment, and a transaction that doesn't exist"""
+    tx_info = {'source': 'GDAIEO6OIKIR3UYS6O547MANCV3DHDJKY5FC3QRW26FQFV76PNLY5Y2Q',
+               'destination': 'GARY2346NSTEI2WGYTC3ULQDJGJJ4EPP3IPTYLM7QWNWEPCEGA2EQJK5',
+               'amount': 10, 'memo': '1-xnXb-33a7c05eda014bfd', 'timestamp': 1555329965}
+    found = 'c3cd7a2e90c6714bb32df16810a1f486bc2d267163db3e3aadccc42554d8102c'
+    missing = '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+
+    async def get_transaction_data(tx_hash):
+        if tx_hash == missing:
+            raise kin.KinErrors.ResourceNotFoundError
+        operation = asynctest.Mock(type=kin.OperationTypes.PAYMENT, destination=tx_info['destination'],
+                                   amount=tx_info['amount'])
+        return asynctest.Mock(source=tx_info['source'], memo=tx_info['memo'], timestamp='2019-04-15T12:06:05Z',
+                              operation=operation)
+    app.kin_client.get_transaction_data = asynctest.CoroutineMock(side_effect=get_transaction_data)
+
+    return [{'tx_hash': found, 'payment': tx_info, 'error': None},
+            {'tx_hash': missing, 'payment': None, 'error': errors.TransactionNotFoundError(missing).to_dict()}]
+
+
+async def test_payments_lookup(test_cli):
+    expected = mock_payments_lookup()
+
+    lookup_resp = await (await test_cli.post('/payments/lookup', json={
+        'tx_hashes': [result['tx_hash'] for result in expected]})).json()
+
+    assert lookup_resp == {'payments': expected}
+
+
+async def test_payments_lookup_stream(test_cli):
+    expected = mock_payments_lookup()
+
+    lookup_resp = await test_cli.post('/payments/lookup/stream', json={
+        'tx_hashes': [result['tx_hash'] for result in expected]})
+
+    assert lookup_resp.headers['Content-Type'] == 'application/x-ndjson'
+    results = [json.loads(line) for line in (await lookup_resp.text()).splitlines()]
+    assert sorted(results, key=lambda result: result['tx_hash']) == \
+        sorted(expected, key=lambda result: result['tx_hash'])
+
+
+async def test_stream_payments(test_cli):
+    tx = test_streaming.get_tx()
+
+    # Mock response
+    async def transactions():
+        yield tx
+        await asyncio.sleep(10)
+    app.kin_client.horizon.transactions = asynctest.CoroutineMock(return_value=transactions())
+
+    stream_resp = await test_cli.get(f'/payments/stream?addresses={test_streaming.FIRST}')
+
+    assert stream_resp.headers['Content-Type'] == 'text/event-stream'
+    assert await stream_resp.content.readline() == f'id: {tx["hash"]}\n'.encode()
+    assert await stream_resp.content.readline() == b'event: payment\n'
+    event = json.loads((await stream_resp.content.readline())[len('data: '):])
+    assert event['destination'] == test_streaming.FIRST
+    assert event['amount'] == 10
+    stream_resp.close()
+
+
+async def test_stream_payments_not_started(test_cli):
+    handler = app.router.routes_all['/payments/stream'].handler
+    request = asynctest.Mock(args=RequestParameters(addresses=[test_streaming.FIRST]))
+
+    # The client might go away before streaming starts, so the handler itself shouldn't subscribe
+    response = await handler(request)
+    assert response.content_type == 'text/event-stream'
+    assert app.payment_stream_hub.subscriber_count == 0
+
+
+async def test_stream_payments_invalid(test_cli):
+    stream_resp = await (await test_cli.get('/payments/stream?addresses=qwewq')).json()
+
+    assert stream_resp == errors.InvalidParamError("Address 'qwewq' is not a valid public address").to_dict()
+
 
 # Status
 
@@ -212,6 +439,31 @@ async def test_status(test_cli):
     assert status_response['public_address'] == status['account']['public_address']
     assert status_response['balance'] == status['account']['balance']
     assert status_response['channels']['total_channels'] == status['account']['channels']['total_channels']
+    assert status_response['fees'] == {'policy': 'network', 'fee': 100, 'minimum_fee': 100, 'capacity_usage': 0}
+
+
+async def test_status_workers(test_cli):
+    # Mock response
+    channels = {'total_channels': 2, 'free_channels': 1, 'non_free_channels': 1, 'resting_channels': 0,
+                'waiting_requests': 0, 'average_wait_time': 0.2, 'rejected_requests': 1}
+    status = {'client': {'sdk_version': '2.4.0', 'horizon': {'uri': 'https://horizon.kinfederation.com'}},
+              'account': {'app_id': 'DevX',
+                          'public_address': 'GBUZFMZXZ6S2Y6HP5IIMTCESJJYJW32GFPN7XAVMRNE2OYQTM3Y7XYXL',
+                          'balance': 2999186.699,
+                          'channels': channels}}
+    app.kin_account.get_status = asynctest.CoroutineMock(return_value=status)
+    # Another worker published its channels
+    app.worker = Worker(0, WorkerStats(2))
+    app.worker.stats.publish(1, dict(channels, free_channels=2, non_free_channels=0, average_wait_time=0))
+
+    status_response = await (await test_cli.get('/status')).json()
+    app.worker = None
+
+    assert status_response['channels']['total_channels'] == 4
+    assert status_response['channels']['free_channels'] == 3
+    assert status_response['channels']['non_free_channels'] == 1
+    assert status_response['channels']['rejected_requests'] == 2
+    assert status_response['channels']['average_wait_time'] == pytest.approx(0.1)
 
 
 # Pay
@@ -261,6 +513,229 @@ async def test_pay_not_exist(test_cli):
     assert payment_resp == errors.\
         DestinationDoesNotExistError('GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6').to_dict()
 
+
+async def test_pay_idempotency_key(test_cli, tmpdir):
+    payment = {'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15}
+    headers = {'Idempotency-Key': 'payment-1'}
+    app.idempotency_store = IdempotencyStore(10, 60, str(tmpdir.join('idempotency.db')))
+
+    # Mock response
+    async def send_kin(*args):
+        await asyncio.sleep(0.05)
+        return '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    app.kin_account.send_kin = asynctest.CoroutineMock(side_effect=send_kin)
+
+    # A concurrent duplicate should wait for the first request
+    payment_resps = await asyncio.gather(*[test_cli.post('/pay', json=payment, headers=headers) for _ in range(2)])
+    assert sorted('Idempotent-Replayed' in payment_resp.headers for payment_resp in payment_resps) == [False, True]
+
+    # A retry should get the original response, even after a restart
+    app.idempotency_store.close()
+    app.idempotency_store = IdempotencyStore(10, 60, str(tmpdir.join('idempotency.db')))
+    payment_resp = await test_cli.post('/pay', json=payment, headers=headers)
+
+    assert payment_resp.headers['Idempotent-Replayed'] == 'true'
+    assert (await payment_resp.json())['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    assert app.kin_account.send_kin.call_count == 1
+
+    # The key can't be reused for a different payment
+    payment_resp = await (await test_cli.post('/pay', json={**payment, 'amount': 16}, headers=headers)).json()
+    assert payment_resp['code'] == errors.InvalidParamError('').code
+
+
+async def test_pay_idempotency_key_disconnected(test_cli):
+    payment = {'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15}
+    headers = {'Idempotency-Key': 'payment-1'}
+
+    # Mock response
+    submitted = asyncio.Event()
+
+    async def send_kin(*args):
+        submitted.set()
+        await asyncio.sleep(0.1)
+        return '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    app.kin_account.send_kin = asynctest.CoroutineMock(side_effect=send_kin)
+
+    # The client gives up after the payment was submitted, which cancels the request's handler
+    request = asyncio.ensure_future(test_cli.post('/pay', json=payment, headers=headers))
+    await submitted.wait()
+    request.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await request
+
+    # The payment still finishes, and the retry gets its response instead of paying again
+    payment_resp = await test_cli.post('/pay', json=payment, headers=headers)
+    assert payment_resp.status == 200
+    assert payment_resp.headers['Idempotent-Replayed'] == 'true'
+    assert (await payment_resp.json())['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    assert app.kin_account.send_kin.call_count == 1
+
+
+async def test_pay_idempotency_key_failed(test_cli):
+    payment = {'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15}
+    headers = {'Idempotency-Key': 'payment-1'}
+    # Mock response
+    app.kin_account.send_kin = asynctest.CoroutineMock(side_effect=kin.KinErrors.LowBalanceError)
+
+    await test_cli.post('/pay', json=payment, headers=headers)
+    await test_cli.post('/pay', json=payment, headers=headers)
+
+    # Failed requests are not remembered, so they can be retried
+    assert app.kin_account.send_kin.call_count == 2
+
+
+async def test_idempotency_store_off_event_loop(test_cli, tmpdir):
+    store = IdempotencyStore(10, 60, str(tmpdir.join('idempotency.db')))
+    # Record the threads the database is used from
+    threads = set()
+    db = store._db
+
+    class RecordingConnection:
+        def __getattr__(self, name):
+            threads.add(threading.get_ident())
+            return getattr(db, name)
+    store._db = RecordingConnection()
+
+    async def handler():
+        return asynctest.Mock(status=200, body=b'{"tx_id":"abcd"}')
+
+    assert await store.run('payment-1', 'fingerprint', handler) == (200, b'{"tx_id":"abcd"}', False)
+    # Read the response back from the disk
+    store._completed.clear()
+    assert await store.run('payment-1', 'fingerprint', handler) == (200, b'{"tx_id":"abcd"}', True)
+
+    assert threads and threading.get_ident() not in threads
+    store.close()
+
+
+async def test_pay_tracks_sequence(test_cli):
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+    # Use a single channel so both payments go through it
+    app.channel_scheduler = app.kin_account.channel_manager = ChannelScheduler([Settings().SEED], 10, 1, 3, 1)
+
+    for _ in range(2):
+        await test_cli.post('/pay', json={
+            'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6',
+            'amount': 15,
+            'memo': 'ggwp'
+        })
+
+    # The sequence should only be fetched for the first payment
+    assert app.kin_client.horizon.account.call_count == 1
+    assert app.channel_scheduler.channels[Settings().SEED].sequence == 3
+
+
+async def test_pay_batch(test_cli):
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+
+    payments = [{'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15}] * 150
+    batch_resp = await \
+        (await test_cli.post('/pay/batch', json={
+            'payments': payments,
+            'memo': 'ggwp'
+        })).json()
+
+    # 150 payments should fit in 2 transactions
+    assert app.kin_client.horizon.submit.call_count == 2
+    assert len(batch_resp['results']) == 150
+    for result in batch_resp['results']:
+        assert result['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+        assert result['error'] is None
+
+
+async def test_pay_batch_partial_failure(test_cli):
+    # Mock response, the first submission fails on the second operation
+    op_failed = kin.KinErrors.HorizonError({
+        'type': 'https://stellar.org/horizon-errors/transaction_failed',
+        'extras': {'result_codes': {'transaction': 'tx_failed',
+                                    'operations': ['op_success', 'op_no_destination']}}
+    })
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(side_effect=[
+        op_failed,
+        {'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'}])
+
+    batch_resp = await \
+        (await test_cli.post('/pay/batch', json={
+            'payments': [{'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15},
+                         {'destination': 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5', 'amount': 10}],
+            'memo': None
+        })).json()
+
+    assert batch_resp['results'][0]['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    assert batch_resp['results'][1]['tx_id'] is None
+    assert batch_resp['results'][1]['error'] == errors.\
+        DestinationDoesNotExistError('GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5').to_dict()
+
+
+async def test_pay_micro_batching(test_cli):
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+
+    app.payment_batcher = PaymentBatcher(app, max_size=100, max_wait=0.05)
+    app.payment_batcher.start()
+    try:
+        responses = await asyncio.gather(*[test_cli.post('/pay', json={
+            'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6',
+            'amount': 15,
+            'memo': 'ggwp'
+        }) for _ in range(5)])
+    finally:
+        await app.payment_batcher.stop()
+
+    # All of the concurrent payments should be sent in a single transaction
+    assert app.kin_client.horizon.submit.call_count == 1
+    for response in responses:
+        assert (await response.json())['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+
+
+async def test_pay_micro_batching_stop(test_cli):
+    # Mock response
+    async def send_transaction(builder, requests):
+        await asyncio.sleep(0.05)
+        return '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    app.kin_account.send_transaction = asynctest.CoroutineMock(side_effect=send_transaction)
+    payment = PaymentRequest(destination='GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', amount=15)
+
+    batcher = PaymentBatcher(app, max_size=2, max_wait=10)
+    batcher.start()
+    # The first two payments are being sent, and the last one is still waiting for its batch to fill
+    payments = [asyncio.ensure_future(batcher.pay(payment)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    await batcher.stop()
+
+    for payment in payments:
+        assert payment.done()
+        assert payment.result() == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+
+
+async def test_pay_batch_channels_busy(test_cli):
+    # No channels, and no room to wait for one
+    app.channel_scheduler = app.kin_account.channel_manager = ChannelScheduler([], 0, 1, 3, 1)
+    payment = {'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 'amount': 15}
+
+    batch_resp = await (await test_cli.post('/pay/batch', json={'payments': [payment], 'memo': None})).json()
+    assert batch_resp['results'][0]['error'] == errors.ChannelsBusyError().to_dict()
+
+    # Micro-batched payments get the same error as a single payment would
+    app.payment_batcher = PaymentBatcher(app, max_size=100, max_wait=0.01)
+    app.payment_batcher.start()
+    try:
+        payment_resp = await test_cli.post('/pay', json=payment)
+    finally:
+        await app.payment_batcher.stop()
+    assert payment_resp.status == 503
+    assert await payment_resp.json() == errors.ChannelsBusyError().to_dict()
+
+
 # Create
 
 
@@ -365,4 +840,231 @@ async def test_whitelist_wrong_network(test_cli):
         })).json()
 
     assert creation_resp == errors.InvalidParamError(f'The network id sent in the request doesn\'t '
-                                                     f'match the network the server is configured with').to_dict()
\ No newline at end of file
+                                                     f'match the network the server is configured with').to_dict()
+
+
+async def test_whitelist_batch(test_cli):
+    envelope = "AAAAAJalymXISxn6Cx+rKsuItEyoR+IoeCiUaSGy5yckSdAIAA" \
+               "AAZAAfJbkAAAABAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA" \
+               "AQAAAAAAAAABAAAAAJalymXISxn6Cx+rKsuItEyoR+IoeCiUaS" \
+               "Gy5yckSdAIAAAAAAAAAAAABhqAAAAAAAAAAAEkSdAIAAAAQDlw" \
+               "LjXrjpa/FmtpxrnrRrYbRBtVkpqgaHgy9R0gG/PpLtcuces9LL" \
+               "B3B8WmhqS47AlFMPg80WSD2Rv+QbJNHwg="
+    single_resp = await (await test_cli.post('/whitelist', json={
+        'envelope': envelope,
+        'network_id': kin.config.HORIZON_PASSPHRASE_TEST
+    })).json()
+
+    batch_resp = await (await test_cli.post('/whitelist/batch', json={'transactions': [
+        {'envelope': envelope, 'network_id': kin.config.HORIZON_PASSPHRASE_TEST},
+        {'envelope': 'blablabla', 'network_id': kin.config.HORIZON_PASSPHRASE_TEST},
+        {'envelope': envelope, 'network_id': 'incorrect'},
+    ]})).json()
+
+    first, second, third = batch_resp['results']
+    assert first == {'tx_envelope': single_resp['tx_envelope'], 'error': None}
+    # Already whitelisted by the first request
+    assert app.whitelist_cache.hits == 1
+    assert second == {'tx_envelope': None, 'error': errors.CantDecodeTransactionError().to_dict()}
+    assert third == {'tx_envelope': None,
+                     'error': errors.InvalidParamError(f'The network id sent in the request doesn\'t match the '
+                                                       f'network the server is configured with').to_dict()}
+
+    empty_resp = await test_cli.post('/whitelist/batch', json={'transactions': []})
+    assert empty_resp.status == 400
+
+
+# Journal
+
+async def test_journal(test_cli, tmpdir):
+    destination = 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6'
+    app.journal = app.kin_account.journal = Journal(str(tmpdir.join('journal.db')), 100, 100)
+    app.journal.start()
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+
+    await test_cli.post('/pay', json={'destination': destination, 'amount': 15, 'memo': 'ggwp'})
+    await test_cli.post('/pay', json={'destination': 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5',
+                                      'amount': 10})
+    # Let the journal write the entries
+    await asyncio.sleep(0.1)
+
+    journal_resp = await (await test_cli.get(f'/journal?destination={destination}&since=0')).json()
+
+    assert len(journal_resp['entries']) == 1
+    entry = journal_resp['entries'][0]
+    assert entry['kind'] == 'payment'
+    assert entry['source'] == app.kin_account.keypair.public_address
+    assert entry['amount'] == 15
+    assert entry['memo'] == '1-anon-ggwp'
+    assert entry['tx_id'] == '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'
+    assert entry['channel'] == app.kin_account.keypair.public_address
+    assert entry['result'] == 'success'
+    assert json.loads(entry['request']) == {'destination': destination, 'amount': 15, 'memo': 'ggwp'}
+
+    journal_resp = await (await test_cli.get('/journal?limit=10')).json()
+    assert len(journal_resp['entries']) == 2
+
+
+async def test_journal_batch_size(test_cli, tmpdir):
+    journal = Journal(str(tmpdir.join('journal.db')), 100, 2)
+    batches = []
+
+    async def write(batch):
+        batches.append(len(batch))
+    journal._write = write
+
+    for _ in range(5):
+        journal.record_whitelist({}, 0.1, None)
+    journal.start()
+    await asyncio.sleep(0.01)
+    await journal.stop()
+
+    # The entry the writer waited for counts toward the batch size
+    assert batches == [2, 2, 1]
+
+
+async def test_journal_disabled(test_cli):
+    journal_resp = await (await test_cli.get('/journal')).json()
+
+    assert journal_resp == errors.JournalDisabledError().to_dict()
+
+
+# Channels
+
+async def test_scale_channels(test_cli):
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+    app.kin_client.does_account_exists = asynctest.CoroutineMock(return_value=False)
+    initial_count = app.channel_scaler.channel_count
+
+    channels_resp = await (await test_cli.post('/channels/scale', json={'channel_count': initial_count + 150})).json()
+
+    # The new channels should be created in 2 transactions
+    assert app.kin_client.horizon.submit.call_count == 2
+    assert channels_resp['total_channels'] == initial_count + 150
+
+    channels_resp = await (await test_cli.post('/channels/scale', json={'channel_count': 10})).json()
+
+    assert channels_resp['total_channels'] == 10
+
+
+async def test_scale_channels_too_many(test_cli):
+    channels_resp = await (await test_cli.post('/channels/scale', json={'channel_count': 100000})).json()
+
+    assert channels_resp['code'] == errors.InvalidParamError('').code
+
+
+async def test_bootstrap_channels(test_cli):
+    # Mock response
+    app.kin_client.horizon.account = asynctest.CoroutineMock(return_value={'sequence': '1'})
+    app.kin_client.horizon.submit = asynctest.CoroutineMock(
+        return_value={'hash': '2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'})
+    app.kin_client.horizon.ledgers = asynctest.CoroutineMock(return_value=get_ledgers(200))
+    # Only the first 2 channels already exist
+    existing = derive_channels(app.channel_scaler.master_seed, app.channel_scaler.salt, 0, 2)
+    existing_addresses = [kin.Keypair.address_from_seed(seed) for seed in existing]
+    app.kin_client.does_account_exists = asynctest.CoroutineMock(
+        side_effect=lambda address: address in existing_addresses)
+    await app.channel_scaler.scale_to(0)
+
+    await bootstrap_channels(app, 5)
+    assert app.fee_manager.fee == 200
+
+    # Only the missing channels should be created, in a single transaction
+    assert app.kin_client.horizon.submit.call_count == 1
+    assert app.kin_client.does_account_exists.call_count == 5
+    assert app.channel_scaler.channel_count == 5
+    assert app.channel_scheduler.get_status()['total_channels'] == 5
+
+
+async def test_bootstrap_channels_worker(test_cli):
+    # Mock response
+    app.kin_client.horizon.ledgers = asynctest.CoroutineMock(return_value=get_ledgers(200))
+    app.kin_client.does_account_exists = asynctest.CoroutineMock(return_value=False)
+    app.kin_client.horizon.submit = asynctest.CoroutineMock()
+
+    # A worker waits for the main process to create its channels
+    with pytest.raises(errors.NotReadyError):
+        await bootstrap_channels(app, 2, create_missing=False)
+    assert app.kin_client.horizon.submit.call_count == 0
+
+
+# Ready
+
+async def test_channel_count_over_max(test_client):
+    invalid_app = init_app(Settings(CHANNEL_COUNT=11, CHANNEL_MAX_COUNT=10))
+    del invalid_app.listeners['before_server_start'][1]
+
+    # The server fails to start, instead of retrying to set up the channels forever
+    with pytest.raises(ValueError):
+        await test_client(invalid_app)
+
+
+async def test_ready(test_cli):
+    ready_resp = await test_cli.get('/ready')
+    assert ready_resp.status == 503
+    assert await ready_resp.json() == errors.NotReadyError().to_dict()
+
+    app.ready = True
+    try:
+        ready_resp = await test_cli.get('/ready')
+    finally:
+        app.ready = False
+    assert ready_resp.status == 200
+    assert await ready_resp.json() == {'ready': True}
+
+
+async def test_metrics(test_cli):
+    address = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+    # Mock response
+    app.kin_client.get_account_balance = asynctest.CoroutineMock(return_value=50)
+
+    await test_cli.get(f'/balance/{address}')
+    await test_cli.get('/balance/qwe')
+    await test_cli.get('/no/such/route')
+
+    metrics_resp = await test_cli.get('/metrics')
+    assert metrics_resp.status == 200
+    assert metrics_resp.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    metrics = await metrics_resp.text()
+
+    assert 'bootstrap_request_duration_seconds_count{route="/balance/<address>",method="GET",status="200"} 1' \
+           in metrics
+    assert 'bootstrap_request_duration_seconds_count{route="/balance/<address>",method="GET",status="400"} 1' \
+           in metrics
+    assert 'bootstrap_request_duration_seconds_count{route="unmatched",method="GET",status="404"} 1' in metrics
+    assert 'bootstrap_horizon_call_duration_seconds_count{method="get_account_balance"} 1' in metrics
+    assert f'bootstrap_errors_total{{code="{errors.InvalidParamError("").code}"}} 1' in metrics
+    assert 'bootstrap_errors_total{code="404"} 1' in metrics
+    assert 'bootstrap_channels{state="free"} 1' in metrics
+    assert 'bootstrap_cache_misses_total{cache="balance"} 1' in metrics
+    assert f'bootstrap_horizon_node_available{{node="{Settings().HORIZON_ENDPOINT}"}} 1' in metrics
+
+
+async def test_tracing(test_cli, tmpdir):
+    path = tmpdir.join('spans.json')
+    app.tracer = Tracer(FileSpanExporter(str(path)), 100)
+    # Mock response
+    app.kin_account.send_kin = asynctest.CoroutineMock(
+        return_value='2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872')
+
+    try:
+        await test_cli.post('/pay', json={'destination': 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6',
+                                          'amount': 15})
+    finally:
+        app.tracer.exporter.stop()
+        app.tracer = None
+
+    with open(path) as file:
+        spans = [span for line in file for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+    validate, request = spans
+    assert request['name'] == 'POST /pay'
+    assert {'key': 'http.status_code', 'value': {'intValue': '200'}} in request['attributes']
+    assert request['attributes'][0]['key'] == 'bootstrap.request_id'
+    assert validate['name'] == 'validate'
+    assert validate['parentSpanId'] == request['spanId']
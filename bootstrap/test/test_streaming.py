@@ -0,0 +1,136 @@
+import asyncio
+
+import asynctest
+from kin_base import Builder
+from kin_base.keypair import Keypair
+
+import sys
+sys.path.append("..")
+
+from src import errors, streaming
+from src.streaming import PaymentStreamHub, may_involve, parse_payments
+
+import pytest
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+SOURCE = 'GDT7ZKBIKREQNZ3KRJA2QFF3KC3IAEAKAAIOHIISDMCIYMNW3UKOCW6R'
+FIRST = 'GARY2346NSTEI2WGYTC3ULQDJGJJ4EPP3IPTYLM7QWNWEPCEGA2EQJK5'
+SECOND = 'GAKYRLGVYIJSLDEWN6MJNYRMF7HYOHGHBDV4XO5SNLJWXFCR4SC5Z5K5'
+OTHER = 'GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6'
+
+
+def get_tx(tx_hash='2c61e62017ff8a0b281c009dff71f8e466447bf31910b49a8ad79a50ab3de872'):
+    """Get a transaction like horizon returns, with a payment to FIRST and a payment to SECOND"""
+    builder = Builder(network_name='TEST', horizon=None, fee=100, secret=SEED, sequence=1)
+    builder.append_payment_op(FIRST, '10')
+    builder.append_payment_op(SECOND, '5')
+    builder.add_text_memo('1-test')
+    builder.sign()
+    return {'envelope_xdr': builder.gen_xdr().decode(), 'created_at': '2019-04-15T12:06:05Z', 'hash': tx_hash}
+
+
+def get_hub(queue_size=10, max_subscribers=10):
+    kin_client = asynctest.Mock()
+    # Never stream anything, the tests publish the transactions themselves
+    kin_client.horizon.transactions = asynctest.CoroutineMock(side_effect=asyncio.Future)
+    return PaymentStreamHub(kin_client, queue_size, max_subscribers)
+
+
+def test_parse_payments():
+    payments = list(parse_payments(get_tx()))
+
+    assert [(payment.source, payment.destination, payment.amount) for _, payment in payments] == \
+        [(SOURCE, FIRST, 10), (SOURCE, SECOND, 5)]
+    assert payments[0][1].memo == '1-test'
+    assert payments[0][1].timestamp == 1555329965
+
+
+async def test_publish(loop):
+    hub = get_hub()
+    first = hub.subscribe([FIRST])
+    both = hub.subscribe([FIRST, SECOND])
+    source = hub.subscribe([SOURCE])
+
+    hub.publish(get_tx())
+
+    assert first.queue.qsize() == 1
+    assert both.queue.qsize() == 2
+    assert source.queue.qsize() == 2
+    _, payment = await first.get()
+    assert payment.destination == FIRST
+
+    for subscription in (first, both, source):
+        hub.unsubscribe(subscription)
+    assert hub.subscriber_count == 0
+    assert hub._task is None
+
+
+def test_may_involve():
+    envelope_xdr = get_tx()['envelope_xdr']
+    keys = {Keypair.from_address(address).raw_public_key() for address in (SOURCE, FIRST, SECOND, OTHER)}
+
+    for address in (SOURCE, FIRST, SECOND):
+        assert may_involve(envelope_xdr, {Keypair.from_address(address).raw_public_key()})
+    assert may_involve(envelope_xdr, keys)
+    assert not may_involve(envelope_xdr, {Keypair.from_address(OTHER).raw_public_key()})
+    assert not may_involve(envelope_xdr, set())
+
+
+async def test_publish_unrelated(loop):
+    hub = get_hub()
+    subscription = hub.subscribe([OTHER])
+
+    # The transaction doesn't mention the address, so it isn't even decoded
+    with asynctest.patch('src.streaming.parse_payments') as parse_payments_mock:
+        hub.publish(get_tx())
+    parse_payments_mock.assert_not_called()
+    assert subscription.queue.empty()
+
+    # Unsubscribing forgets the address
+    hub.unsubscribe(subscription)
+    assert hub._keys == set()
+
+
+async def test_resume_after_failure(loop, monkeypatch):
+    monkeypatch.setattr(streaming, 'RECONNECT_INTERVAL', 0)
+
+    async def failing_stream():
+        yield dict(get_tx(), paging_token='123')
+        raise ConnectionError('The stream dropped')
+
+    async def idle_stream():
+        await asyncio.Future()
+        yield
+
+    hub = get_hub()
+    hub.kin_client.horizon.transactions = asynctest.CoroutineMock(side_effect=[failing_stream(), idle_stream()])
+    subscription = hub.subscribe([FIRST])
+    await subscription.get()
+    await asyncio.sleep(0.01)
+
+    # Payments sent while reconnecting are not missed
+    assert [call[1]['cursor'] for call in hub.kin_client.horizon.transactions.call_args_list] == ['now', '123']
+    hub.stop()
+
+
+async def test_drop_slow_subscriber(loop):
+    hub = get_hub(queue_size=1)
+    subscription = hub.subscribe([FIRST])
+
+    hub.publish(get_tx())
+    hub.publish(get_tx())
+
+    assert await subscription.get() is None
+    assert hub.subscriber_count == 0
+    assert hub.dropped_subscribers == 1
+
+
+async def test_too_many_subscribers(loop):
+    hub = get_hub(max_subscribers=1)
+    hub.subscribe([FIRST])
+
+    with pytest.raises(errors.TooManySubscribersError):
+        hub.subscribe([SECOND])
+    with pytest.raises(errors.TooManySubscribersError):
+        hub.check_capacity()
+    hub.stop()
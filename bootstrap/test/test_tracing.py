@@ -0,0 +1,85 @@
+import json
+
+import kin
+import asynctest
+
+import sys
+sys.path.append("..")
+
+from src import tracing
+from src.account import BootstrapAccount
+from src.channels import ChannelScheduler
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+
+
+def read_spans(path) -> list:
+    with open(path) as file:
+        return [span for line in file
+                for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+
+
+def test_spans(tmpdir):
+    path = tmpdir.join('spans.json')
+    exporter = tracing.FileSpanExporter(str(path))
+    tracer = tracing.Tracer(exporter, 100)
+
+    root = tracer.start_trace('POST /pay', {'bootstrap.request_id': 'abcd1234'})
+    try:
+        with tracing.span('validate', model='PaymentRequest') as validate:
+            with tracing.span('inner'):
+                pass
+        try:
+            with tracing.span('horizon.submit'):
+                raise ValueError('failed')
+        except ValueError:
+            pass
+        assert tracing.current_span.get() is root
+        root.end()
+    finally:
+        # Outside of a request the trace isn't confined to a task, so don't leave it as the current span
+        tracing.current_span.set(None)
+        exporter.stop()
+
+    spans = {span['name']: span for span in read_spans(path)}
+    assert set(spans) == {'POST /pay', 'validate', 'inner', 'horizon.submit'}
+    assert len({span['traceId'] for span in spans.values()}) == 1
+
+    assert 'parentSpanId' not in spans['POST /pay']
+    assert spans['POST /pay']['attributes'] == [{'key': 'bootstrap.request_id', 'value': {'stringValue': 'abcd1234'}}]
+    assert spans['validate']['parentSpanId'] == root.span_id
+    assert spans['inner']['parentSpanId'] == validate.span_id
+    assert spans['horizon.submit']['parentSpanId'] == root.span_id
+    assert spans['horizon.submit']['status'] == {'code': tracing.STATUS_ERROR, 'message': 'ValueError: failed'}
+    assert spans['validate']['status'] == {'code': tracing.STATUS_OK}
+
+
+def test_not_traced(tmpdir):
+    tracer = tracing.Tracer(tracing.FileSpanExporter(str(tmpdir.join('spans.json'))), 0)
+    assert tracer.start_trace('POST /pay', {}) is None
+    with tracing.span('validate') as span:
+        assert span is None
+    tracer.exporter.stop()
+
+
+async def test_send_kin_spans(loop, tmpdir):
+    path = tmpdir.join('spans.json')
+    exporter = tracing.FileSpanExporter(str(path))
+    kin_client = kin.KinClient(kin.Environment('CUSTOM', 'http://localhost:8000', 'test'))
+    scheduler = ChannelScheduler([SEED], max_waiters=10, wait_timeout=1, failure_threshold=2, rest_time=1)
+    account = BootstrapAccount(SEED, kin_client, scheduler, 'anon')
+    account.channel_manager.channels[SEED].sequence = 1
+
+    root = tracing.Tracer(exporter, 100).start_trace('POST /pay', {})
+    try:
+        with asynctest.patch('kin_base.Builder.submit', return_value={'hash': 'abcd'}):
+            assert await account.send_kin('GBV2MSCOAVLGB45KUENY77EFWWDCXPBWZIJJMRI75GPR3AUTB5UWUCO6', 15, 100) == 'abcd'
+        root.end()
+    finally:
+        await kin_client.close()
+        exporter.stop()
+
+    spans = read_spans(path)
+    assert [span['name'] for span in spans] == ['transaction.build', 'channel.acquire', 'transaction.sign',
+                                                'horizon.submit', 'POST /pay']
+    assert all(span.get('parentSpanId') == root.span_id for span in spans[:-1])
@@ -0,0 +1,58 @@
+import pytest
+
+import sys
+sys.path.append("..")
+
+from kin.blockchain import utils
+from kin.blockchain.keypair import Keypair
+
+from src import validation
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+ADDRESS = Keypair.address_from_seed(SEED)
+
+
+@pytest.mark.parametrize('address', [
+    ADDRESS,
+    Keypair.address_from_seed(Keypair.generate_seed()),
+    ADDRESS[:-1] + ('A' if ADDRESS[-1] != 'A' else 'B'),  # Bad checksum
+    ADDRESS[:10] + ADDRESS[11] + ADDRESS[10] + ADDRESS[12:],  # Swapped characters
+    ADDRESS.lower(),
+    ADDRESS[:-1],
+    ADDRESS + 'A',
+    SEED,  # Wrong version byte
+    'G' * 56,
+    '1' * 56,
+    'Ã' * 56,
+    '',
+])
+def test_is_valid_address(address):
+    assert validation.is_valid_address(address) == utils.is_valid_address(address)
+    # Check again with the cached result
+    assert validation.is_valid_address(address) == utils.is_valid_address(address)
+
+
+@pytest.mark.parametrize('tx_hash', [
+    'e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d56',
+    'E9D42295B0DBB30B9B83B70B7B49FD3E09DC9986F4627DCBBBCA490063EB2D56',
+    'e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d5',
+    'g9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d56',
+    '',
+])
+def test_is_valid_transaction_hash(tx_hash):
+    assert validation.is_valid_transaction_hash(tx_hash) == utils.is_valid_transaction_hash(tx_hash)
+
+
+def test_non_strings():
+    assert not validation.is_valid_address(None)
+    assert not validation.is_valid_address(['G' * 56])
+    assert not validation.is_valid_transaction_hash(None)
+
+
+def test_find_invalid():
+    assert validation.find_invalid_address([ADDRESS] * 3) is None
+    assert validation.find_invalid_address([ADDRESS, 'qwe', 'asd']) == 'qwe'
+
+    tx_hash = 'e9d42295b0dbb30b9b83b70b7b49fd3e09dc9986f4627dcbbbca490063eb2d56'
+    assert validation.find_invalid_transaction_hash([tx_hash] * 3) is None
+    assert validation.find_invalid_transaction_hash([tx_hash, 'qwe']) == 'qwe'
@@ -0,0 +1,66 @@
+import pytest
+import asynctest
+
+import kin
+
+import sys
+sys.path.append("..")
+
+from src.cache import WhitelistCache
+from src.whitelist import WhitelistErrors, WhitelistExecutors, WhitelistSigner
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+ENVELOPE = 'AAAAAJalymXISxn6Cx+rKsuItEyoR+IoeCiUaSGy5yckSdAIAAAAZAAfJbkAAAABAAAAAQAAAAAAAAAAAAAAAAAAAAAAAAAA' \
+           'AAAAAQAAAAAAAAABAAAAAJalymXISxn6Cx+rKsuItEyoR+IoeCiUaSGy5yckSdAIAAAAAAAAAAAABhqAAAAAAAAAAAEkSdAI' \
+           'AAAAQDlwLjXrjpa/FmtpxrnrRrYbRBtVkpqgaHgy9R0gG/PpLtcuces9LLB3B8WmhqS47AlFMPg80WSD2Rv+QbJNHwg='
+PASSPHRASE = kin.config.HORIZON_PASSPHRASE_TEST
+
+
+def get_expected_envelope():
+    kin_client = kin.KinClient(kin.Environment('CUSTOM', 'http://localhost:8000', PASSPHRASE))
+    return kin_client, kin_client.kin_account(SEED).whitelist_transaction({'envelope': ENVELOPE,
+                                                                           'network_id': PASSPHRASE})
+
+
+@pytest.mark.parametrize('executor', [WhitelistExecutors.PROCESS, WhitelistExecutors.THREAD])
+async def test_whitelist_many(executor):
+    kin_client, expected = get_expected_envelope()
+    signer = WhitelistSigner(SEED, PASSPHRASE, executor, pool_size=2)
+    try:
+        # Signed the same as the kin sdk, in the order of the requests across the chunks
+        result = await signer.whitelist(ENVELOPE, PASSPHRASE)
+        assert (result.tx_envelope, result.error) == (expected, None)
+        assert result.source == 'GCLKLSTFZBFRT6QLD6VSVS4IWRGKQR7CFB4CRFDJEGZOOJZEJHIARI4G'
+        assert result.sequence == 8767200777207809
+        results = await signer.whitelist_many([(ENVELOPE, PASSPHRASE), ('blablabla', PASSPHRASE),
+                                               (ENVELOPE, 'incorrect')])
+        assert [(result.tx_envelope, result.error) for result in results] == \
+            [(expected, None), (None, WhitelistErrors.CANT_DECODE), (None, WhitelistErrors.WRONG_NETWORK)]
+        assert await signer.whitelist_many([]) == []
+    finally:
+        signer.close()
+        await kin_client.close()
+
+
+async def test_whitelist_cached():
+    kin_client, expected = get_expected_envelope()
+    cache = WhitelistCache(max_size=10)
+    signer = WhitelistSigner(SEED, PASSPHRASE, WhitelistExecutors.THREAD, pool_size=1, cache=cache)
+    signer._sign_many = asynctest.Mock(wraps=signer._sign_many)
+    try:
+        await signer.whitelist(ENVELOPE, PASSPHRASE)
+        # The retry is not signed again, and errors are not cached
+        results = await signer.whitelist_many([(ENVELOPE, PASSPHRASE), (ENVELOPE, 'incorrect')])
+        assert results[0].tx_envelope == expected
+        assert results[1].error == WhitelistErrors.WRONG_NETWORK
+        assert [call[0][0] for call in signer._sign_many.call_args_list] == \
+            [[(ENVELOPE, PASSPHRASE)], [(ENVELOPE, 'incorrect')]]
+        assert (cache.hits, len(cache)) == (1, 1)
+    finally:
+        signer.close()
+        await kin_client.close()
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        WhitelistSigner(SEED, PASSPHRASE, 'gpu', pool_size=1)
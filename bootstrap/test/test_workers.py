@@ -0,0 +1,64 @@
+import pytest
+
+import sys
+sys.path.append("..")
+
+from src import errors
+from src.config import Settings
+from src.scaling import ChannelScaler, derive_channels
+from src.workers import CHANNEL_STATS, WorkerStats, get_first_channel, get_worker_channels, run_workers
+
+SEED = 'SCOMIY6IHXNIL6ZFTBBYDLU65VONYWI3Y6EN4IDWDP2IIYTCYZBCCE6C'
+
+
+def get_channel_status(**values):
+    status = dict.fromkeys(CHANNEL_STATS, 0)
+    status.update(values)
+    return status
+
+
+def test_worker_stats():
+    stats = WorkerStats(2)
+    stats.publish(0, get_channel_status(total_channels=5, free_channels=3, non_free_channels=2,
+                                        average_wait_time=0.5))
+    stats.publish(1, get_channel_status(total_channels=5, free_channels=5, rejected_requests=2,
+                                        average_wait_time=0.1))
+
+    status = stats.aggregate()
+    assert status['total_channels'] == 10
+    assert status['free_channels'] == 8
+    assert status['non_free_channels'] == 2
+    assert status['rejected_requests'] == 2
+    assert status['average_wait_time'] == pytest.approx(0.3)
+
+    # Publishing again replaces the worker's stats
+    stats.publish(1, get_channel_status())
+    assert stats.aggregate()['total_channels'] == 5
+
+
+def test_worker_channels():
+    config = Settings(SEED=SEED, CHANNEL_COUNT=3, CHANNEL_MAX_COUNT=10)
+    worker_channels = get_worker_channels(config, 3)
+
+    assert sorted(worker_channels) == [0, 1, 2]
+    all_seeds = [seed for seeds in worker_channels.values() for seed in seeds]
+    assert len(all_seeds) == len(set(all_seeds)) == 9
+    assert SEED not in all_seeds
+    # The first worker has the same channels as a single process
+    assert worker_channels[0] == derive_channels(SEED, config.CHANNEL_SALT, 0, 3)
+    assert worker_channels[2] == derive_channels(SEED, config.CHANNEL_SALT, 20, 23)
+    assert get_first_channel(2, 10) == 20
+
+
+def test_overlapping_worker_channels():
+    # The first worker's channels would run into the second worker's slice
+    with pytest.raises(ValueError):
+        run_workers(Settings(SEED=SEED, WORKERS=2, CHANNEL_COUNT=11, CHANNEL_MAX_COUNT=10))
+
+
+async def test_worker_scaler_keeps_a_channel(loop):
+    scaler = ChannelScaler(None, SEED, 'test', 2, 1, 10, 5, first_channel=10, use_master_seed=False)
+
+    assert scaler.derive_channels(0, 2) == derive_channels(SEED, 'test', 10, 12)
+    with pytest.raises(errors.InvalidParamError):
+        await scaler.scale_to(0)